@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Production entrypoint for the University of Greenwich API
+
+A gunicorn master imports the app once (pre-fork loading: workers start
+without re-importing and share the loaded pages copy-on-write), then forks
+WEB_CONCURRENCY uvicorn workers running the uvloop event loop and httptools
+parser. Each worker opens its own Mongo client on first use.
+
+    python serve.py
+
+Signals to the master:
+    HUP         restart the workers gracefully; in-flight requests finish
+                first. Preloaded code is kept, so deploy new code with USR2.
+    USR2        start a second master with the new code next to the old one;
+                once it serves, send the old master TERM to drain it.
+    TTIN/TTOU   add or remove one worker.
+
+Caches, rate limit buckets and /metrics are per worker.
+"""
+
+import itertools
+import os
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8001"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30"))
+KEEPALIVE_SECONDS = int(os.getenv("KEEPALIVE_SECONDS", "5"))
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+ACCESS_LOG = os.getenv("ACCESS_LOG", "false").lower() == "true"
+
+
+class ServerWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+
+def pre_fork(arbiter, worker):
+    # Lowest free slot. A worker replacing a dead one takes over its slot and
+    # the attendance spool left behind; during a HUP old and new workers
+    # overlap, so the new set takes the next free slots instead.
+    used = {getattr(running, "slot", None) for running in arbiter.WORKERS.values()}
+    worker.slot = next(slot for slot in itertools.count() if slot not in used)
+
+
+def post_fork(arbiter, worker):
+    os.environ["WORKER_SLOT"] = str(worker.slot)
+
+
+class ServerApplication(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from server import app
+        return app
+
+
+def options() -> dict:
+    return {
+        "bind": f"{HOST}:{PORT}",
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "serve.ServerWorker",
+        "preload_app": True,
+        "graceful_timeout": GRACEFUL_TIMEOUT_SECONDS,
+        "keepalive": KEEPALIVE_SECONDS,
+        "backlog": BACKLOG,
+        "accesslog": "-" if ACCESS_LOG else None,
+        "pre_fork": pre_fork,
+        "post_fork": post_fork,
+    }
+
+
+if __name__ == "__main__":
+    ServerApplication(options()).run()
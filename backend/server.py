@@ -1,22 +1,231 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from pymongo import MongoClient
+from pydantic import AfterValidator, BaseModel, BeforeValidator, ConfigDict, EmailStr, Field, ValidationError
+from typing import Annotated, Optional, List, Literal, NamedTuple, Tuple
+from datetime import date, datetime, timedelta, timezone
+from jose import JWTError
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReplaceOne, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from bson import ObjectId
+from bson.errors import InvalidId
 import os
 from dotenv import load_dotenv
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import asyncio
+import base64
+import csv
+import hashlib
+import hmac
+import importlib
+import json
+import logging
+import math
+import re
+import socket
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from zoneinfo import ZoneInfo
+import orjson
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Lazy imports
+# Dependencies only some requests need (the LLM SDK behind chat, JWT crypto,
+# passlib, numpy) are imported on first attribute access, so cold starts and
+# worker restarts don't pay for them. tests/test_startup.py keeps the budget.
+class LazyModule:
+    def __init__(self, name: str):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        module = self.module
+        if module is None:
+            module = self.module = importlib.import_module(self.name)
+        return getattr(module, attribute)
+
+litellm = LazyModule("litellm")
+jwt = LazyModule("jose.jwt")
+passlib_context = LazyModule("passlib.context")
+np = LazyModule("numpy")
+
 app = FastAPI()
 
+# Metrics
+# Request counts, latency histograms and dependency timings (Mongo commands,
+# LLM replies, bcrypt) exposed in Prometheus text format on /metrics. Request
+# metrics are only touched from the event loop thread, so plain ints need no
+# locks; Mongo command events arrive on driver threads and each thread writes
+# its own histograms, merged when scraped.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+UNMATCHED_ROUTE = "unmatched"
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One slot per bucket plus the +Inf overflow; made cumulative when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other: "Histogram") -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+
+def label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_histogram(lines: List[str], name: str, labels: str, histogram: Histogram) -> None:
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    cumulative += histogram.counts[-1]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+class MongoCommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+
+    def _histograms(self) -> dict:
+        histograms = getattr(self.local, "histograms", None)
+        if histograms is None:
+            histograms = self.local.histograms = {}
+            self.shards.append(histograms)
+        return histograms
+
+    def _observe(self, event) -> None:
+        histograms = self._histograms()
+        histogram = histograms.get(event.command_name)
+        if histogram is None:
+            histogram = histograms[event.command_name] = Histogram()
+        histogram.observe(event.duration_micros / 1e6)
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        self._observe(event)
+
+    def failed(self, event) -> None:
+        self._observe(event)
+
+    def histograms(self) -> dict:
+        merged = {}
+        for shard in list(self.shards):
+            for command, histogram in list(shard.items()):
+                merged.setdefault(command, Histogram()).merge(histogram)
+        return merged
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        # One histogram per (method, route, status); its count doubles as the request counter
+        self.requests = {}
+        # In flight = started minus observed, so only the start is counted separately
+        self.started = 0
+        self.dependencies = {}
+        self.mongo = MongoCommandTimer()
+
+    def observe(self, dependency: str, operation: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        histogram = self.dependencies.get((dependency, operation))
+        if histogram is None:
+            histogram = self.dependencies[(dependency, operation)] = Histogram()
+        histogram.observe(seconds)
+
+    def render(self) -> str:
+        requests = sorted(
+            (f'method="{method}",route="{label_value(route)}",status="{status_code}"', histogram)
+            for (method, route, status_code), histogram in self.requests.items()
+        )
+        lines = [
+            "# HELP http_requests_total HTTP requests by route template and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for labels, histogram in requests:
+            lines.append(f"http_requests_total{{{labels}}} {sum(histogram.counts)}")
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency by route template and status code.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for labels, histogram in requests:
+            render_histogram(lines, "http_request_duration_seconds", labels, histogram)
+        lines += [
+            "# HELP http_requests_in_flight HTTP requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.started - sum(sum(h.counts) for h in self.requests.values())}",
+            "# HELP dependency_duration_seconds Time spent in Mongo commands, LLM replies and bcrypt.",
+            "# TYPE dependency_duration_seconds histogram",
+        ]
+        dependencies = {("mongo", command): histogram for command, histogram in self.mongo.histograms().items()}
+        dependencies.update(self.dependencies)
+        for (dependency, operation), histogram in sorted(dependencies.items()):
+            render_histogram(lines, "dependency_duration_seconds",
+                             f'dependency="{dependency}",operation="{label_value(operation)}"', histogram)
+        return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, which would add a task and
+    # stream copy to every request
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        metrics = self.metrics
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.started += 1
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started
+            # The router stores the matched route in the shared scope; labelling by
+            # its template keeps path parameters out of the label set
+            route = scope.get("route")
+            key = (scope["method"], route.path if route else UNMATCHED_ROUTE, status_code)
+            histogram = metrics.requests.get(key)
+            if histogram is None:
+                histogram = metrics.requests[key] = Histogram()
+            # Histogram.observe inlined; this runs on every request
+            histogram.counts[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            histogram.sum += elapsed
+
+metrics = Metrics(METRICS_ENABLED)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -24,18 +233,1986 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # MongoDB
-client = MongoClient(os.getenv("MONGO_URL"))
-db = client.university_db
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "university_db")
+
+class MongoConnection:
+    # The client is created on first use in each process. One built before a
+    # fork would share its monitor threads and sockets with the parent and can
+    # deadlock in the child, so pre-forked workers (serve.py) each open their own.
+    def __init__(self, url: Optional[str], database_name: str, **options):
+        self.url = url
+        self.database_name = database_name
+        self.options = options
+        self._client = None
+        self.collections = []
+        os.register_at_fork(after_in_child=self.reset)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = AsyncIOMotorClient(self.url, **self.options)
+        return self._client
+
+    @property
+    def database(self):
+        return self.client[self.database_name]
+
+    def collection(self, name: str) -> "LazyCollection":
+        collection = LazyCollection(self, name)
+        self.collections.append(collection)
+        return collection
+
+    def reset(self) -> None:
+        # A client inherited through fork is dropped, never used or closed
+        self._client = None
+        for collection in self.collections:
+            collection.resolved = None
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+class LazyCollection:
+    # Stands in for a Motor collection until the process's client exists
+    def __init__(self, connection: MongoConnection, name: str):
+        self.connection = connection
+        self.name = name
+        self.resolved = None
+
+    def __getattr__(self, attribute):
+        # Only reached for names not set above, i.e. the collection's own API
+        collection = self.resolved
+        if collection is None:
+            collection = self.resolved = self.connection.database[self.name]
+        return getattr(collection, attribute)
+
+mongo = MongoConnection(
+    os.getenv("MONGO_URL"),
+    MONGO_DB_NAME,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    event_listeners=[metrics.mongo] if METRICS_ENABLED else [],
+)
+
+# Pagination
+# List routes page with keyset cursors: an opaque token holding the last
+# item's sort key and _id, so later pages cost the same as the first.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+STREAM_BATCH_SIZE = 500
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    # orjson encodes datetimes natively and ObjectIds through json_default, so
+    # raw Mongo documents render without per-item conversion or jsonable_encoder
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=json_default)
+
+def encode_cursor(position: dict) -> str:
+    tagged = {}
+    for key, value in position.items():
+        if isinstance(value, datetime):
+            value = {"dt": value.isoformat()}
+        elif isinstance(value, ObjectId):
+            value = {"oid": str(value)}
+        tagged[key] = value
+    raw = json.dumps(tagged, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> dict:
+    try:
+        tagged = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(tagged, dict):
+            raise ValueError("cursor is not an object")
+        position = {}
+        for key, value in tagged.items():
+            # Cursors are client-controlled: anything but a plain value could
+            # smuggle an operator like {"$ne": null} into the keyset filter
+            if isinstance(value, dict) and value.keys() == {"dt"} and isinstance(value["dt"], str):
+                value = datetime.fromisoformat(value["dt"])
+            elif isinstance(value, dict) and value.keys() == {"oid"} and isinstance(value["oid"], str):
+                value = ObjectId(value["oid"])
+            elif not isinstance(value, (str, int, float, bool, type(None))):
+                raise ValueError(f"cursor field {key} is not a scalar")
+            position[key] = value
+        return position
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(sort_field: Optional[str], direction: int, position: dict) -> dict:
+    if "id" not in position or (sort_field and "k" not in position):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    op = "$gt" if direction == ASCENDING else "$lt"
+    if sort_field is None:
+        return {"_id": {op: position["id"]}}
+    return {"$or": [
+        {sort_field: {op: position["k"]}},
+        {sort_field: position["k"], "_id": {op: position["id"]}},
+    ]}
+
+class PageParams:
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        format: Literal["json", "ndjson"] = "json",
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.format = format
+
+# Response models
+# Item shapes of the list routes. Each model also yields its route's
+# projection; the routes render the projected documents directly with
+# FastJSONResponse rather than re-validating them one by one.
+ObjectIdStr = Annotated[str, BeforeValidator(str)]
+
+class ItemModel(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: ObjectIdStr = Field(alias="_id")
+
+class TimetableItem(ItemModel):
+    course: str
+    time: str
+    location: str
+    day: str
+    campus: str
+    weekday: Optional[int] = None
+    start_minute: Optional[int] = None
+    end_minute: Optional[int] = None
+
+class ClassOccurrenceItem(TimetableItem):
+    date: date
+    starts_at: datetime
+    ends_at: datetime
+
+class GradeItem(ItemModel):
+    name: str
+    grade: str
+    credits: int
+    year: Optional[int] = None
+
+class NewsItem(ItemModel):
+    title: str
+    content: str
+    category: str
+    image: Optional[str] = None
+    created_at: datetime
+
+class EventItem(ItemModel):
+    title: str
+    description: Optional[str] = None
+    date: datetime
+    location: Optional[str] = None
+    campus: Optional[str] = None
+
+class LibraryItem(ItemModel):
+    title: str
+    author: str
+    isbn: str
+    available: bool
+    location: str
+    campus: str
+
+class AttendanceItem(ItemModel):
+    class_name: str
+    timestamp: datetime
+
+class ChatHistoryItem(ItemModel):
+    session_id: str
+    message: str
+    response: str
+    timestamp: datetime
+
+class UserProfile(BaseModel):
+    username: str
+    email: str
+    student_id: str
+    course: str
+    year: int
+
+class TokenResponse(BaseModel):
+    token: str
+    refresh_token: str
+    token_type: str
+    expires_in: int
+
+class AuthResponse(TokenResponse):
+    user: UserProfile
+
+def projection_for(model) -> dict:
+    return {field.alias or name: 1 for name, field in model.model_fields.items()}
+
+# Repositories
+class Repository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    # Reads take an explicit projection so no query ships fields its caller ignores
+    async def find_one(self, query: dict, projection: dict) -> Optional[dict]:
+        return await self.collection.find_one(query, projection)
+
+    async def exists(self, query: dict) -> bool:
+        return await self.find_one(query, {"_id": 1}) is not None
+
+    async def find(self, query: dict, projection: dict, sort: Optional[list] = None, limit: int = 0,
+                   skip: int = 0) -> List[dict]:
+        cursor = self.collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    def _keyset_cursor(self, query: dict, sort_field: Optional[str], direction: int,
+                       cursor: Optional[str], projection: dict):
+        # _id breaks ties so items sharing a sort value are never skipped or repeated
+        sort = [("_id", direction)] if sort_field is None else [(sort_field, direction), ("_id", direction)]
+        if cursor:
+            query = {"$and": [query, keyset_filter(sort_field, direction, decode_cursor(cursor))]}
+        return self.collection.find(query, projection).sort(sort)
+
+    async def find_page(self, query: dict, sort_field: Optional[str], direction: int, limit: int,
+                        cursor: Optional[str], projection: dict):
+        items = await self._keyset_cursor(query, sort_field, direction, cursor, projection) \
+            .limit(limit + 1).to_list(length=None)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            last = items[-1]
+            position = {"id": last["_id"]}
+            if sort_field:
+                position["k"] = last.get(sort_field)
+            next_cursor = encode_cursor(position)
+        return items, next_cursor
+
+    def iterate(self, query: dict, sort_field: Optional[str], direction: int,
+                cursor: Optional[str], limit: int, projection: dict):
+        # Motor cursor fetched in batches, so streaming keeps memory flat
+        motor_cursor = self._keyset_cursor(query, sort_field, direction, cursor, projection) \
+            .batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            motor_cursor = motor_cursor.limit(limit)
+        return motor_cursor
+
+    async def insert_one(self, document: dict) -> str:
+        result = await self.collection.insert_one(document)
+        return str(result.inserted_id)
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True) -> List[str]:
+        result = await self.collection.insert_many(documents, ordered=ordered)
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False) -> int:
+        result = await self.collection.update_one(query, update, upsert=upsert)
+        return result.modified_count
+
+    async def insert_if_absent(self, query: dict, document: dict) -> bool:
+        # True only for the caller whose upsert actually created the document
+        result = await self.collection.update_one(query, {"$setOnInsert": document}, upsert=True)
+        return result.upserted_id is not None
+
+    async def count(self, query: dict) -> int:
+        return await self.collection.count_documents(query)
+
+class UserRepository(Repository):
+    async def get_credentials(self, username: str) -> Optional[dict]:
+        # The only read of the password hash; everything else uses the principal
+        return await self.find_one({"username": username}, CREDENTIALS_PROJECTION)
+
+    async def set_password(self, username: str, hashed_password: str) -> int:
+        return await self.update_one({"username": username}, {"$set": {"password": hashed_password}})
+
+    async def get_principal(self, username: str) -> Optional[dict]:
+        return await self.find_one({"username": username}, PRINCIPAL_PROJECTION)
+
+class TimetableRepository(Repository):
+    async def distinct_classes(self) -> List[dict]:
+        # Every student's copy of a class collapses into one entry
+        pipeline = [
+            {"$group": {"_id": {"course": "$course", "day": "$day", "time": "$time",
+                                "location": "$location", "campus": "$campus"}}},
+        ]
+        return [group["_id"] async for group in self.collection.aggregate(pipeline, allowDiskUse=True)]
+
+    async def class_enrolment(self) -> List[dict]:
+        pipeline = [
+            {"$group": {"_id": {"course": "$course", "day": "$day", "time": "$time",
+                                "location": "$location", "campus": "$campus"},
+                        "students": {"$addToSet": "$username"}}},
+            {"$project": {"_id": 0, "class": "$_id", "students": {"$size": "$students"}}},
+        ]
+        return [group async for group in self.collection.aggregate(pipeline, allowDiskUse=True)]
+
+    async def weekly_load(self) -> List[dict]:
+        # Classes per student per timetable day
+        pipeline = [
+            {"$group": {"_id": {"username": "$username", "day": "$day"}, "classes": {"$sum": 1}}},
+            {"$project": {"_id": 0, "username": "$_id.username", "day": "$_id.day", "classes": 1}},
+        ]
+        return [group async for group in self.collection.aggregate(pipeline, allowDiskUse=True)]
+
+    async def backfill_slots(self) -> int:
+        # Classes written before slots were stored; unparseable ones get null slots
+        updated = 0
+        while True:
+            batch = await self.find({"weekday": {"$exists": False}}, {"day": 1, "time": 1},
+                                    limit=TIMETABLE_BACKFILL_BATCH_SIZE)
+            if not batch:
+                return updated
+            await self.collection.bulk_write([
+                UpdateOne({"_id": entry["_id"]}, {"$set": timetable_slot(entry)}) for entry in batch
+            ], ordered=False)
+            updated += len(batch)
+
+class AttendanceRepository(Repository):
+    async def record_scans(self, records: List[dict]) -> int:
+        # Upserts keyed on (username, session) turn repeated scans and replays into no-ops
+        result = await self.collection.bulk_write([
+            UpdateOne({"username": record["username"], "session": record["session"]},
+                      {"$setOnInsert": record}, upsert=True)
+            for record in records
+        ], ordered=False)
+        return result.upserted_count
+
+    async def count_by_session(self, start: datetime, end: datetime) -> List[dict]:
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}, "session": {"$exists": True}}},
+            {"$group": {"_id": "$session", "class_name": {"$first": "$class_name"}, "attended": {"$sum": 1}}},
+        ]
+        return [group async for group in self.collection.aggregate(pipeline)]
+
+    async def count_by_student(self, start: datetime, end: datetime) -> List[dict]:
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": "$username", "attended": {"$sum": 1}}},
+        ]
+        return [group async for group in self.collection.aggregate(pipeline)]
+
+# Library search
+# Books carry derived, write-time normalised fields so every search mode is
+# index-backed: a weighted text index for ranked search, a multikey index on
+# lower-cased tokens for prefix autocomplete and an exact ISBN-13 key.
+LIBRARY_PROJECTION = projection_for(LibraryItem)
+AUTOCOMPLETE_PROJECTION = {"title": 1, "author": 1}
+LIBRARY_BACKFILL_BATCH_SIZE = 1000
+TIMETABLE_BACKFILL_BATCH_SIZE = 1000
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[^\W_]+", text.lower())
+
+def normalize_isbn(value: str) -> Optional[str]:
+    cleaned = re.sub(r"[^0-9X]", "", value.upper())
+    if len(cleaned) == 13 and cleaned.isdigit():
+        return cleaned
+    if len(cleaned) == 10 and cleaned[:9].isdigit():
+        # Convert ISBN-10 to ISBN-13 so both spellings hit the same key
+        body = "978" + cleaned[:9]
+        check = (10 - sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(body)) % 10) % 10
+        return body + str(check)
+    return None
+
+def library_search_fields(book: dict) -> dict:
+    return {
+        "search_terms": sorted(set(tokenize(book.get("title", "")) + tokenize(book.get("author", "")))),
+        "isbn_normalized": normalize_isbn(book.get("isbn", "")),
+    }
+
+def prefix_patterns(query: str) -> List[re.Pattern]:
+    # Every token must match as a word prefix; anchored, escaped regexes use the index
+    return [re.compile("^" + re.escape(token)) for token in tokenize(query)]
+
+def library_filters(campus: Optional[str], available: Optional[bool]) -> dict:
+    filters = {}
+    if campus:
+        filters["campus"] = campus
+    if available is not None:
+        filters["available"] = available
+    return filters
+
+class LibraryRepository(Repository):
+    async def find_by_isbn(self, isbn: str, filters: dict, limit: int, cursor: Optional[str] = None):
+        return await self.find_page({"isbn_normalized": isbn, **filters}, None, ASCENDING, limit, cursor,
+                                    LIBRARY_PROJECTION)
+
+    async def search_text(self, query: str, filters: dict, limit: int, cursor: Optional[str] = None):
+        # Relevance order has no stable keyset, so text results page by offset
+        offset = decode_cursor(cursor).get("o", 0) if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        books = await self.find({"$text": {"$search": query}, **filters},
+                                sort=[("score", {"$meta": "textScore"})], limit=limit + 1, skip=offset,
+                                projection=LIBRARY_PROJECTION)
+        next_cursor = encode_cursor({"o": offset + limit}) if len(books) > limit else None
+        return books[:limit], next_cursor
+
+    async def search_prefix(self, query: str, filters: dict, limit: int, cursor: Optional[str] = None,
+                            projection: dict = LIBRARY_PROJECTION):
+        prefixes = prefix_patterns(query)
+        if not prefixes:
+            return [], None
+        return await self.find_page({"search_terms": {"$all": prefixes}, **filters}, None, ASCENDING, limit,
+                                    cursor, projection)
+
+    async def browse(self, filters: dict, limit: int, cursor: Optional[str] = None):
+        return await self.find_page(filters, None, ASCENDING, limit, cursor, LIBRARY_PROJECTION)
+
+    async def search(self, query: Optional[str], filters: dict, limit: int, cursor: Optional[str] = None):
+        isbn = normalize_isbn(query) if query else None
+        if isbn:
+            return await self.find_by_isbn(isbn, filters, limit, cursor)
+        if not query:
+            return await self.browse(filters, limit, cursor)
+        # A keyset cursor means the first page already fell back to prefix matching
+        position = decode_cursor(cursor) if cursor else {}
+        if "id" in position:
+            return await self.search_prefix(query, filters, limit, cursor)
+        books, next_cursor = await self.search_text(query, filters, limit, cursor)
+        if books or position:
+            return books, next_cursor
+        # Partially typed words don't match the stemmed text index
+        return await self.search_prefix(query, filters, limit)
+
+    async def backfill_search_fields(self) -> int:
+        updated = 0
+        while True:
+            batch = await self.find({"search_terms": {"$exists": False}}, {"title": 1, "author": 1, "isbn": 1},
+                                    limit=LIBRARY_BACKFILL_BATCH_SIZE)
+            if not batch:
+                return updated
+            await self.collection.bulk_write([
+                UpdateOne({"_id": book["_id"]}, {"$set": library_search_fields(book)}) for book in batch
+            ], ordered=False)
+            updated += len(batch)
+
+# Grade summaries
+# Each student's running totals (credits, grade points and modules, overall
+# and per year) live in grade_summaries and are bumped on every grade write, so
+# a summary read is one _id lookup. The backfill recomputes them from grades.
+GRADE_POINTS = {
+    "A+": 4.0, "A": 4.0, "A-": 3.7,
+    "B+": 3.3, "B": 3.0, "B-": 2.7,
+    "C+": 2.3, "C": 2.0, "C-": 1.7,
+    "D": 1.0, "F": 0.0,
+}
+GRADE_POINTS_EXPRESSION = {"$switch": {
+    "branches": [{"case": {"$eq": ["$grade", grade]}, "then": points} for grade, points in GRADE_POINTS.items()],
+    "default": 0.0,
+}}
+# Lowest GPA for each classification, best first
+CLASSIFICATION_BANDS = [(3.7, "First"), (3.0, "Upper Second (2:1)"), (2.3, "Lower Second (2:2)"),
+                        (1.7, "Third"), (0.0, "Fail")]
+GRADE_SUMMARY_PROJECTION = {"_id": 0, "credits": 1, "points": 1, "modules": 1, "years": 1}
+GRADE_SUMMARY_BACKFILL_BATCH_SIZE = 500
+GRADE_SUMMARY_BACKFILL_CONCURRENCY = 4
+
+def normalize_grade(value: str) -> str:
+    # Unknown grades would count as credits with no points and skew every GPA
+    grade = value.strip().upper()
+    if grade not in GRADE_POINTS:
+        raise ValueError(f"expected one of {', '.join(GRADE_POINTS)}")
+    return grade
+
+def classify(gpa: Optional[float]) -> Optional[str]:
+    if gpa is None:
+        return None
+    return next((name for lowest, name in CLASSIFICATION_BANDS if gpa >= lowest), CLASSIFICATION_BANDS[-1][1])
+
+def summarize_totals(totals: dict) -> dict:
+    credits = totals.get("credits", 0)
+    gpa = round(totals.get("points", 0.0) / credits, 2) if credits else None
+    return {"credits": credits, "modules": totals.get("modules", 0), "gpa": gpa, "classification": classify(gpa)}
+
+def add_totals(totals: dict, credits: int, points: float, modules: int) -> None:
+    totals["credits"] = totals.get("credits", 0) + credits
+    totals["points"] = totals.get("points", 0.0) + points
+    totals["modules"] = totals.get("modules", 0) + modules
+
+class GradeSummaryRepository(Repository):
+    async def get_summary(self, username: str) -> dict:
+        summary = await self.find_one({"_id": username}, GRADE_SUMMARY_PROJECTION) or {}
+        years = summary.get("years", {})
+        return {
+            **summarize_totals(summary),
+            "years": [{"year": int(year), **summarize_totals(years[year])} for year in sorted(years, key=int)],
+        }
+
+    async def apply(self, grades: List[dict]) -> None:
+        # Folds newly written grades into their students' totals
+        increments = {}
+        for grade in grades:
+            points = GRADE_POINTS.get(grade["grade"], 0.0) * grade["credits"]
+            increment = increments.setdefault(grade["username"], {})
+            prefixes = [""] if grade.get("year") is None else ["", f"years.{grade['year']}."]
+            for prefix in prefixes:
+                for field, value in (("credits", grade["credits"]), ("points", points), ("modules", 1)):
+                    increment[prefix + field] = increment.get(prefix + field, 0) + value
+        if increments:
+            updated_at = datetime.utcnow()
+            await self.collection.bulk_write([
+                UpdateOne({"_id": username}, {"$inc": increment, "$set": {"updated_at": updated_at}}, upsert=True)
+                for username, increment in increments.items()
+            ], ordered=False)
+
+    async def rebuild(self, grades: Repository, usernames: List[str]) -> int:
+        pipeline = [
+            {"$match": {"username": {"$in": usernames}}},
+            {"$group": {
+                "_id": {"username": "$username", "year": "$year"},
+                "credits": {"$sum": "$credits"},
+                "points": {"$sum": {"$multiply": [GRADE_POINTS_EXPRESSION, "$credits"]}},
+                "modules": {"$sum": 1},
+            }},
+            {"$project": {
+                "_id": 0, "username": "$_id.username", "year": "$_id.year", "credits": 1, "points": 1, "modules": 1,
+            }},
+        ]
+        groups = [group async for group in grades.collection.aggregate(pipeline)]
+        # Grades recorded before years were stored count towards the student's current year
+        current_years = await student_years([group["username"] for group in groups if group.get("year") is None])
+        summaries = {username: {"credits": 0, "points": 0.0, "modules": 0, "years": {}} for username in usernames}
+        for group in groups:
+            if group.get("year") is None:
+                group["year"] = current_years.get(group["username"])
+            summary = summaries[group["username"]]
+            add_totals(summary, group["credits"], group["points"], group["modules"])
+            if group.get("year") is not None:
+                add_totals(summary["years"].setdefault(str(group["year"]), {}),
+                           group["credits"], group["points"], group["modules"])
+        updated_at = datetime.utcnow()
+        await self.collection.bulk_write([
+            ReplaceOne({"_id": username}, {**summary, "updated_at": updated_at}, upsert=True)
+            for username, summary in summaries.items()
+        ], ordered=False)
+        return len(summaries)
+
+    async def backfill(self, grades: Repository, batch_size: int = GRADE_SUMMARY_BACKFILL_BATCH_SIZE,
+                       concurrency: int = GRADE_SUMMARY_BACKFILL_CONCURRENCY) -> int:
+        usernames = sorted(await grades.collection.distinct("username"))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def rebuild_batch(batch: List[str]) -> int:
+            async with semaphore:
+                return await self.rebuild(grades, batch)
+
+        counts = await asyncio.gather(*(rebuild_batch(usernames[start:start + batch_size])
+                                        for start in range(0, len(usernames), batch_size)))
+        return sum(counts)
+
+class LeaseRepository(Repository):
+    async def acquire(self, name: str, owner: str, seconds: float) -> bool:
+        # Takes or renews a named lease; False while another owner's lease is live
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+# Incremental sync log; entries are keyed by change stream resume token
+SYNC_RETENTION_SECONDS = int(os.getenv("SYNC_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+class ChangeLogRepository(Repository):
+    async def latest(self) -> Optional[str]:
+        newest = await self.find({}, {"_id": 1}, sort=[("_id", DESCENDING)], limit=1)
+        return newest[0]["_id"] if newest else None
+
+    async def changed_after(self, token: str, until: str, username: str, collections: List[str],
+                            limit: int) -> List[dict]:
+        # Entries without a username (shared feeds, deletes) concern everyone
+        return await self.find(
+            {"_id": {"$gt": token, "$lte": until}, "username": {"$in": [username, None]},
+             "collection": {"$in": collections}},
+            {"_id": 1, "collection": 1, "item_id": 1},
+            sort=[("_id", ASCENDING)],
+            limit=limit,
+        )
+
+    async def record(self, entries: List[dict]) -> None:
+        # Ordered, so the log never holds a change without the ones before it
+        await self.collection.bulk_write([
+            UpdateOne({"_id": entry["_id"]},
+                      {"$setOnInsert": {key: value for key, value in entry.items() if key != "_id"}}, upsert=True)
+            for entry in entries
+        ], ordered=True)
+
+    async def clear(self) -> None:
+        await self.collection.delete_many({})
+
+users_repo = UserRepository(mongo.collection("users"))
+timetable_repo = TimetableRepository(mongo.collection("timetable"))
+grades_repo = Repository(mongo.collection("grades"))
+attendance_repo = AttendanceRepository(mongo.collection("attendance"))
+chat_history_repo = Repository(mongo.collection("chat_history"))
+news_repo = Repository(mongo.collection("news"))
+events_repo = Repository(mongo.collection("events"))
+library_repo = LibraryRepository(mongo.collection("library"))
+revoked_tokens_repo = Repository(mongo.collection("revoked_tokens"))
+grade_summaries_repo = GradeSummaryRepository(mongo.collection("grade_summaries"))
+attendance_rollups_repo = Repository(mongo.collection("attendance_daily"))
+attendance_roster_repo = Repository(mongo.collection("attendance_roster"))
+change_log_repo = ChangeLogRepository(mongo.collection("sync_changes"))
+leases_repo = LeaseRepository(mongo.collection("leases"))
+
+# Indexes
+# Declared per collection and built idempotently at startup; keep in sync with
+# INDEXED_QUERIES below so the self-check covers every route's query shape.
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "timetable": [
+        IndexModel([("username", ASCENDING), ("_id", ASCENDING)], name="username_id"),
+    ],
+    "grades": [
+        IndexModel([("username", ASCENDING), ("_id", ASCENDING)], name="username_id"),
+    ],
+    "attendance": [
+        IndexModel([("username", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                   name="username_timestamp_id"),
+        IndexModel([("username", ASCENDING), ("session", ASCENDING)], name="username_session"),
+        IndexModel([("timestamp", ASCENDING)], name="timestamp"),
+    ],
+    "news": [
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+    ],
+    "events": [
+        IndexModel([("date", ASCENDING), ("_id", ASCENDING)], name="date_id"),
+    ],
+    "library": [
+        IndexModel([("title", TEXT), ("author", TEXT)], name="title_author_text",
+                   weights={"title": 10, "author": 5}, default_language="english"),
+        IndexModel([("search_terms", ASCENDING)], name="search_terms"),
+        IndexModel([("isbn_normalized", ASCENDING)], name="isbn_normalized"),
+        IndexModel([("campus", ASCENDING), ("available", ASCENDING)], name="campus_available"),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], name="jti_unique", unique=True),
+        IndexModel([("revoked_at", ASCENDING)], name="revoked_at"),
+        # Mongo drops entries once the token would have expired anyway
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "chat_history": [
+        IndexModel([("username", ASCENDING), ("session_id", ASCENDING), ("timestamp", ASCENDING),
+                    ("_id", ASCENDING)], name="username_session_timestamp_id"),
+        IndexModel([("username", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+                   name="username_timestamp_id"),
+    ],
+    "sync_changes": [
+        IndexModel([("username", ASCENDING), ("_id", ASCENDING)], name="username_id"),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=SYNC_RETENTION_SECONDS),
+    ],
+}
+
+# Superseded indexes, dropped at startup once their replacement exists
+RETIRED_INDEXES = {
+    "timetable": ["username"],
+    "grades": ["username"],
+    "attendance": ["username_timestamp", "username_qr_code"],
+    "news": ["created_at"],
+    "events": ["date"],
+    "chat_history": ["username_session_timestamp", "username_timestamp"],
+}
+
+# (route, collection, filter, sort) for every query a route issues
+INDEXED_QUERIES = [
+    ("POST /api/auth/register", "users", {"username": "__index_check__"}, None),
+    ("POST /api/auth/register", "users", {"email": "__index_check__"}, None),
+    ("POST /api/auth/login", "users", {"username": "__index_check__"}, None),
+    ("GET /api/timetable", "timetable", {"username": "__index_check__"}, [("_id", 1)]),
+    ("GET /api/timetable/today", "timetable", {"username": "__index_check__"}, None),
+    ("GET /api/sync", "sync_changes",
+     {"_id": {"$gt": "__index_check__"}, "username": {"$in": ["__index_check__", None]}}, [("_id", 1)]),
+    ("GET /api/grades", "grades", {"username": "__index_check__"}, [("_id", 1)]),
+    ("GET /api/news", "news", {}, [("created_at", -1), ("_id", -1)]),
+    ("GET /api/events", "events", {}, [("date", 1), ("_id", 1)]),
+    ("GET /api/library", "library", {"isbn_normalized": "__index_check__"}, None),
+    ("GET /api/library", "library", {"$text": {"$search": "__index_check__"}}, None),
+    ("GET /api/library", "library", {"search_terms": {"$all": [re.compile("^__index_check__")]}}, None),
+    ("GET /api/library", "library", {"campus": "__index_check__"}, [("_id", 1)]),
+    ("GET /api/attendance", "attendance", {"username": "__index_check__"}, [("timestamp", -1), ("_id", -1)]),
+    ("POST /api/attendance", "attendance", {"username": "__index_check__", "session": "__index_check__"}, None),
+    ("attendance rollup", "attendance", {"timestamp": {"$gte": datetime(1970, 1, 1)}}, None),
+    ("revocation sync", "revoked_tokens", {"revoked_at": {"$gt": datetime(1970, 1, 1)}}, None),
+    ("GET /api/chat/history", "chat_history", {"username": "__index_check__"}, [("timestamp", 1), ("_id", 1)]),
+    ("GET /api/chat/history", "chat_history",
+     {"username": "__index_check__", "session_id": "__index_check__"}, [("timestamp", 1), ("_id", 1)]),
+]
+
+INDEX_SELF_CHECK = os.getenv("INDEX_SELF_CHECK", "false").lower() == "true"
+
+async def ensure_indexes(database) -> None:
+    for collection_name, indexes in INDEXES.items():
+        collection = database[collection_name]
+        try:
+            await collection.create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. duplicate usernames blocking a unique index; keep serving
+            logger.error("Failed to build indexes on %s: %s", collection_name, e)
+            continue
+        existing = await collection.index_information()
+        for name in RETIRED_INDEXES.get(collection_name, []):
+            if name in existing:
+                await collection.drop_index(name)
+
+def _plan_stages(plan) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+async def check_query_plans(database) -> List[dict]:
+    report = []
+    for route, collection_name, query, sort in INDEXED_QUERIES:
+        cursor = database[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({
+            "route": route,
+            "collection": collection_name,
+            "filter": sorted(query.keys()),
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
+
+# Caching
+FEED_CACHE_TTL_SECONDS = float(os.getenv("FEED_CACHE_TTL_SECONDS", "30"))
+FEED_CACHE_MAX_ENTRIES = int(os.getenv("FEED_CACHE_MAX_ENTRIES", "256"))
+
+class TTLCache:
+    # In-process LRU whose entries also expire after `ttl` seconds
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+class SharedCacheBackend:
+    # Cache shared between workers (Redis, Memcached, ...); implement and pass to FeedCache
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+class InMemorySharedCache(SharedCacheBackend):
+    # Process-local stand-in with the same semantics, for tests and single-worker runs
+    def __init__(self, max_entries: int = 10000):
+        self.values = TTLCache(max_entries, ttl=0)
+        self.counters = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if key in self.counters:
+            return str(self.counters[key]).encode()
+        return self.values.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.values.set(key, value, ttl)
+
+    async def incr(self, key: str) -> int:
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+
+class CachedFeed(NamedTuple):
+    body: bytes
+    etag: str
+    next_cursor: Optional[str]
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({"body": self.body.decode(), "etag": self.etag, "next_cursor": self.next_cursor}).encode()
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "CachedFeed":
+        data = json.loads(raw)
+        return cls(data["body"].encode(), data["etag"], data["next_cursor"])
+
+class FeedCache:
+    # Read-through cache for public feeds. Keys embed a per-namespace generation,
+    # so invalidating bumps the generation instead of hunting down keys; with a
+    # shared backend the generation lives there and invalidation reaches every worker.
+    def __init__(self, local: TTLCache, shared: Optional[SharedCacheBackend] = None):
+        self.local = local
+        self.shared = shared
+        self.generations = {}
+        self.inflight = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def _generation(self, namespace: str) -> int:
+        if self.shared:
+            raw = await self.shared.get(f"{namespace}:generation")
+            return int(raw) if raw else 0
+        return self.generations.get(namespace, 0)
+
+    async def get(self, namespace: str, key: str, loader) -> CachedFeed:
+        cache_key = f"{namespace}:{await self._generation(namespace)}:{key}"
+        entry = self.local.get(cache_key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        if self.shared:
+            raw = await self.shared.get(cache_key)
+            if raw is not None:
+                self.shared_hits += 1
+                entry = CachedFeed.from_bytes(raw)
+                self.local.set(cache_key, entry)
+                return entry
+        pending = self.inflight.get(cache_key)
+        if pending:
+            # Another request is already loading this key; share its result
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        self.misses += 1
+        future = asyncio.ensure_future(loader())
+        self.inflight[cache_key] = future
+        try:
+            entry = await future
+        finally:
+            self.inflight.pop(cache_key, None)
+        self.local.set(cache_key, entry)
+        if self.shared:
+            await self.shared.set(cache_key, entry.to_bytes(), self.local.ttl)
+        return entry
+
+    async def invalidate(self, namespace: str) -> None:
+        if self.shared:
+            await self.shared.incr(f"{namespace}:generation")
+        else:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.shared_hits + self.coalesced) / lookups if lookups else 0.0,
+            "entries": len(self.local),
+        }
+
+feed_cache = FeedCache(TTLCache(FEED_CACHE_MAX_ENTRIES, FEED_CACHE_TTL_SECONDS))
+
+# Auth principal cache
+# get_current_user resolves a token to a compact principal kept in memory for a
+# short TTL, so authenticated routes don't re-read the user document per request.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+PRINCIPAL_PROJECTION = {"_id": 0, "username": 1, "email": 1, "student_id": 1, "course": 1, "year": 1}
+CREDENTIALS_PROJECTION = {**PRINCIPAL_PROJECTION, "password": 1}
+
+class UserPrincipal(NamedTuple):
+    username: str
+    email: str
+    student_id: str
+    course: str
+    year: int
+
+principal_cache = TTLCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS)
+
+def evict_principal(username: str) -> None:
+    # Call whenever a user's document changes or their access must end immediately
+    principal_cache.delete(username)
+
+# Rate limiting
+# Token buckets: each key holds up to `capacity` requests and regains
+# `capacity / period` per second. LLM chat and attendance scans are limited per
+# user. The bcrypt-heavy auth routes are limited per (client IP, username), so
+# students behind one campus NAT or proxy don't share a bucket, plus a looser
+# per-IP cap so one client can't spray guesses across usernames. Buckets live in a
+# RateLimitStore; the in-memory one is per worker, so multi-worker deployments
+# pass a shared store instead.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Only trust X-Forwarded-For behind a proxy that overwrites it
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+class RateLimit(NamedTuple):
+    capacity: float
+    refill_per_second: float
+
+def parse_rate_limit(value: str) -> RateLimit:
+    # "<requests>/<seconds>", e.g. "20/60" allows bursts of 20 and 20 a minute
+    requests, seconds = value.split("/")
+    return RateLimit(float(requests), float(requests) / float(seconds))
+
+RATE_LIMITS = {
+    "chat": parse_rate_limit(os.getenv("RATE_LIMIT_CHAT", "20/60")),
+    "auth": parse_rate_limit(os.getenv("RATE_LIMIT_AUTH", "10/60")),
+    "auth_ip": parse_rate_limit(os.getenv("RATE_LIMIT_AUTH_IP", "300/60")),
+    "attendance": parse_rate_limit(os.getenv("RATE_LIMIT_ATTENDANCE", "30/60")),
+}
+
+class RateLimitStore:
+    # Shared bucket storage for multi-worker deployments (e.g. a Redis script);
+    # take() must refill and consume atomically
+    async def take(self, key: str, limit: RateLimit) -> float:
+        """Consume one token; returns 0 if allowed, else seconds until one is available"""
+        raise NotImplementedError
+
+class InMemoryRateLimitStore(RateLimitStore):
+    # Per-process stand-in, also used in tests. A bucket expires once it would
+    # have refilled, which is the same as having no entry, and the LRU bound
+    # caps memory when many distinct clients show up at once.
+    def __init__(self, max_keys: int):
+        self.buckets = TTLCache(max_keys, ttl=0)
+
+    async def take(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        entry = self.buckets.get(key)
+        tokens = limit.capacity
+        if entry is not None:
+            stored, updated_at = entry
+            tokens = min(limit.capacity, stored + (now - updated_at) * limit.refill_per_second)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / limit.refill_per_second
+        self.buckets.set(key, (tokens, now), ttl=(limit.capacity - tokens) / limit.refill_per_second)
+        return retry_after
+
+class RateLimiter:
+    def __init__(self, store: RateLimitStore):
+        self.store = store
+
+    async def check(self, name: str, key: str) -> None:
+        retry_after = await self.store.take(f"{name}:{key}", RATE_LIMITS[name])
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+rate_limiter = RateLimiter(InMemoryRateLimitStore(RATE_LIMIT_MAX_KEYS))
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+# Chat sessions
+# One LLM client per (user, session) is reused across messages and evicted
+# when idle. Each session keeps a bounded window of recent turns, warmed once
+# from chat_history; clients are rebuilt from that window every
+# CHAT_CONTEXT_TURNS messages so the context sent to the model stays bounded.
+CHAT_SYSTEM_MESSAGE = "You are a helpful University of Greenwich assistant. Help students with information about courses, campus locations, events, library resources, and general university queries. The university has 3 campuses: Greenwich (SE London - historic World Heritage Site), Avery Hill (Eltham, London), and Medway (Kent). Be helpful, friendly, and concise."
+CHAT_MODEL_PROVIDER = "openai"
+CHAT_MODEL = "gpt-4o-mini"
+# Emergent universal keys are only accepted by Emergent's proxy, never by OpenAI itself
+EMERGENT_LLM_API_BASE = "https://integrations.emergentagent.com/llm"
+
+def chat_api_credentials(environ) -> Tuple[Optional[str], Optional[str]]:
+    """(api_key, api_base) for litellm; LLM_API_BASE overrides the default endpoint"""
+    if environ.get("LLM_API_KEY"):
+        return environ["LLM_API_KEY"], environ.get("LLM_API_BASE")
+    if environ.get("EMERGENT_LLM_KEY"):
+        return environ["EMERGENT_LLM_KEY"], environ.get("LLM_API_BASE") or EMERGENT_LLM_API_BASE
+    return None, environ.get("LLM_API_BASE")
+
+CHAT_API_KEY, CHAT_API_BASE = chat_api_credentials(os.environ)
+CHAT_CONTEXT_TURNS = int(os.getenv("CHAT_CONTEXT_TURNS", "10"))
+CHAT_SESSION_IDLE_SECONDS = float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "900"))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+
+# Answer cache
+# Standalone questions (the first message of a session, so no conversation
+# context) get the same answer for everyone: the system prompt holds no user
+# data. An exact tier matches normalised text; a similarity tier compares
+# hashed character-trigram vectors by cosine so rephrasings also hit. Cosine
+# alone can't tell "...open on Monday?" from "...on Sunday?" (0.91 against 0.92
+# for a true rephrase), so a similar hit must also use the same content words.
+# Answers may be time-sensitive (opening hours, term dates), so they expire
+# after an hour.
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(60 * 60)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.9"))  # 0 disables the tier
+ANSWER_CACHE_DIMENSIONS = 512
+# Words that don't change what is being asked; question words are kept
+ANSWER_CACHE_FILLER_WORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "were", "be", "s", "do", "does", "did", "can", "could", "would",
+    "will", "please", "i", "me", "my", "you", "tell", "know", "of", "to", "for",
+})
+
+def content_words(normalized: str) -> frozenset:
+    return frozenset(normalized.split()) - ANSWER_CACHE_FILLER_WORDS
+
+class AnswerCache:
+    def __init__(self, max_entries: int, ttl: float, similarity: float, dimensions: int = ANSWER_CACHE_DIMENSIONS):
+        self.exact = TTLCache(max_entries, ttl)
+        self.ttl = ttl
+        self.similarity = similarity
+        self.dimensions = dimensions
+        # Fixed-size ring of unit vectors, searched with one matrix-vector
+        # product; allocated by the first put
+        self.vectors = None
+        self.expires = None
+        self.answers = [None] * max_entries
+        self.words = [None] * max_entries
+        self.next_slot = 0
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(tokenize(text))
+
+    def embed(self, normalized: str):
+        padded = f" {normalized} "
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        buckets = [zlib.crc32(padded[i:i + 3].encode()) % self.dimensions for i in range(len(padded) - 2)]
+        np.add.at(vector, buckets, 1.0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, text: str) -> Optional[str]:
+        normalized = self.normalize(text)
+        answer = self.exact.get(normalized)
+        if answer is not None:
+            self.exact_hits += 1
+            return answer
+        if self.similarity > 0 and normalized and self.vectors is not None:
+            scores = self.vectors @ self.embed(normalized)
+            scores[self.expires < time.monotonic()] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity and self.words[best] == content_words(normalized):
+                self.similar_hits += 1
+                return self.answers[best]
+        self.misses += 1
+        return None
+
+    def put(self, text: str, answer: str) -> None:
+        normalized = self.normalize(text)
+        if not normalized:
+            return
+        self.exact.set(normalized, answer)
+        if self.similarity > 0:
+            if self.vectors is None:
+                self.vectors = np.zeros((len(self.answers), self.dimensions), dtype=np.float32)
+                self.expires = np.zeros(len(self.answers), dtype=np.float64)
+            slot = self.next_slot
+            self.vectors[slot] = self.embed(normalized)
+            self.expires[slot] = time.monotonic() + self.ttl
+            self.answers[slot] = answer
+            self.words[slot] = content_words(normalized)
+            self.next_slot = (slot + 1) % len(self.answers)
+
+    def clear(self) -> None:
+        self.exact.clear()
+        self.vectors = None
+        self.expires = None
+        self.answers = [None] * len(self.answers)
+        self.words = [None] * len(self.words)
+        self.next_slot = 0
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "entries": len(self.exact),
+        }
+
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY)
+
+class ChatSession:
+    def __init__(self, username: str, session_id: str):
+        self.username = username
+        self.session_id = session_id
+        self.lock = asyncio.Lock()
+        self.window = deque(maxlen=CHAT_CONTEXT_TURNS)  # (message, response) pairs
+        self.warmed = False
+        self.client = None
+        self.client_turns = 0
+        self.last_used = time.monotonic()
+
+    def build_client(self, client_factory):
+        initial_messages = [{"role": "system", "content": CHAT_SYSTEM_MESSAGE}]
+        for message, response in self.window:
+            initial_messages.append({"role": "user", "content": message})
+            initial_messages.append({"role": "assistant", "content": response})
+        self.client = client_factory(self.session_id, initial_messages)
+        self.client_turns = 0
+
+    async def warm(self, repo: Repository):
+        history = await repo.find(
+            {"username": self.username, "session_id": self.session_id},
+            sort=[("timestamp", -1), ("_id", -1)],
+            limit=CHAT_CONTEXT_TURNS,
+            projection={"_id": 0, "message": 1, "response": 1},
+        )
+        self.window.extend((turn["message"], turn["response"]) for turn in reversed(history))
+        self.warmed = True
+
+class StreamingLlmChat:
+    # Streams completions through litellm, relaying each delta as it arrives
+    def __init__(self, session_id: str, initial_messages: List[dict]):
+        self.session_id = session_id
+        self.messages = list(initial_messages)
+
+    async def stream_message(self, message: str):
+        self.messages.append({"role": "user", "content": message})
+        chunks = []
+        try:
+            response = await litellm.acompletion(
+                model=f"{CHAT_MODEL_PROVIDER}/{CHAT_MODEL}",
+                messages=self.messages,
+                api_key=CHAT_API_KEY,
+                api_base=CHAT_API_BASE,
+                stream=True,
+            )
+            async for part in response:
+                delta = part.choices[0].delta.content
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        except BaseException:
+            # A failed or abandoned reply leaves no half turn in the context
+            self.messages.pop()
+            raise
+        self.messages.append({"role": "assistant", "content": "".join(chunks)})
+
+def create_llm_client(session_id: str, initial_messages: List[dict]):
+    return StreamingLlmChat(session_id, initial_messages)
+
+async def stream_reply(client, message: str):
+    # Clients exposing stream_message yield text chunks as the model produces
+    # them; others deliver the whole completion as a single chunk.
+    stream_message = getattr(client, "stream_message", None)
+    if stream_message is None:
+        yield await client.send_message(message)
+        return
+    async for chunk in stream_message(message):
+        yield chunk
+
+class ChatSessionPool:
+    def __init__(self, max_sessions: int, idle_seconds: float, client_factory=create_llm_client):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.client_factory = client_factory
+        self.sessions = OrderedDict()
+
+    def _evict(self):
+        # Least recently used sessions sit at the front
+        now = time.monotonic()
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if len(self.sessions) <= self.max_sessions and now - session.last_used <= self.idle_seconds:
+                break
+            self.sessions.popitem(last=False)
+
+    def get(self, username: str, session_id: str) -> ChatSession:
+        # Keyed by user too, so a guessed session_id never exposes someone else's context
+        key = (username, session_id)
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = ChatSession(username, session_id)
+        self.sessions.move_to_end(key)
+        session.last_used = time.monotonic()
+        self._evict()
+        return session
+
+    async def stream(self, username: str, session_id: str, message: str):
+        session = self.get(username, session_id)
+        async with session.lock:
+            if not session.warmed:
+                await session.warm(chat_history_repo)
+            standalone = not session.window
+            cached = answer_cache.get(message) if standalone else None
+            if cached is not None:
+                # Recorded in the window, so a follow-up's client still sees this turn
+                session.window.append((message, cached))
+                session.last_used = time.monotonic()
+                yield cached
+                return
+            if session.client is None or session.client_turns >= CHAT_CONTEXT_TURNS:
+                session.build_client(self.client_factory)
+            chunks = []
+            started = time.perf_counter()
+            async for chunk in stream_reply(session.client, message):
+                chunks.append(chunk)
+                yield chunk
+            metrics.observe("llm", "reply", time.perf_counter() - started)
+            # Only completed replies enter the context window and answer cache
+            response = "".join(chunks)
+            session.client_turns += 1
+            session.window.append((message, response))
+            if standalone:
+                answer_cache.put(message, response)
+            session.last_used = time.monotonic()
+
+    async def send(self, username: str, session_id: str, message: str) -> str:
+        return "".join([chunk async for chunk in self.stream(username, session_id, message)])
+
+    def __len__(self):
+        return len(self.sessions)
+
+chat_sessions = ChatSessionPool(CHAT_SESSION_MAX, CHAT_SESSION_IDLE_SECONDS)
+
+# Attendance write-behind
+# A scan is acknowledged once buffered; buffered scans are written in one batch
+# when ATTENDANCE_FLUSH_SIZE are pending or every ATTENDANCE_FLUSH_SECONDS.
+# With ATTENDANCE_SPOOL_PATH set, pending scans are also appended to a local
+# file until their batch is written, and replayed from it on the next start.
+# Under serve.py each worker spools to its own file, suffixed with the worker
+# slot, which a replacement worker inherits along with the leftover scans.
+ATTENDANCE_FLUSH_SIZE = int(os.getenv("ATTENDANCE_FLUSH_SIZE", "200"))
+ATTENDANCE_FLUSH_SECONDS = float(os.getenv("ATTENDANCE_FLUSH_SECONDS", "0.5"))
+ATTENDANCE_SPOOL_PATH = os.getenv("ATTENDANCE_SPOOL_PATH")
+ATTENDANCE_RECENT_SCANS = 100000
+ATTENDANCE_RECENT_TTL_SECONDS = 6 * 60 * 60
+
+class AttendanceBuffer:
+    def __init__(self, repo: AttendanceRepository, flush_size: int, flush_seconds: float,
+                 spool_path: Optional[str] = None):
+        self.repo = repo
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.spool_path = spool_path
+        self.spool = None
+        self.pending: List[dict] = []
+        # Recent scans by (username, session), so repeats are answered without a write
+        self.recent = TTLCache(ATTENDANCE_RECENT_SCANS, ATTENDANCE_RECENT_TTL_SECONDS)
+        self.lock = asyncio.Lock()
+        self.due = asyncio.Event()
+        self.flushed = 0
+
+    def add(self, record: dict) -> Tuple[dict, bool]:
+        # Returns the stored record and whether this scan is a new one
+        key = (record["username"], record["session"])
+        existing = self.recent.get(key)
+        if existing is not None:
+            return existing, False
+        self.recent.set(key, record)
+        self.pending.append(record)
+        if self.spool is not None:
+            self.spool.write(json.dumps(record, default=json_default) + "\n")
+            self.spool.flush()
+        if len(self.pending) >= self.flush_size:
+            self.due.set()
+        return record, True
+
+    async def flush(self) -> int:
+        async with self.lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            try:
+                await self.repo.record_scans(batch)
+            except BaseException:
+                # Keep the batch ahead of scans that arrived meanwhile and retry next
+                # time; a cancelled flush (shutdown) is retried by drain()
+                self.pending[:0] = batch
+                raise
+            self.flushed += len(batch)
+            self._rewrite_spool()
+            return len(batch)
+
+    def _rewrite_spool(self):
+        # The spool only ever holds scans that are still pending
+        if self.spool is None:
+            return
+        temporary_path = f"{self.spool_path}.tmp"
+        with open(temporary_path, "w") as temporary:
+            for record in self.pending:
+                temporary.write(json.dumps(record, default=json_default) + "\n")
+            temporary.flush()
+            os.fsync(temporary.fileno())
+        self.spool.close()
+        os.replace(temporary_path, self.spool_path)
+        self.spool = open(self.spool_path, "a")
+
+    def open(self) -> int:
+        # Replays scans a previous run buffered but never wrote
+        if not self.spool_path:
+            return 0
+        replayed = 0
+        if os.path.exists(self.spool_path):
+            with open(self.spool_path) as spool:
+                for line in spool:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    record["_id"] = ObjectId(record["_id"])
+                    record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+                    self.recent.set((record["username"], record["session"]), record)
+                    self.pending.append(record)
+                    replayed += 1
+        self.spool = open(self.spool_path, "a")
+        self._rewrite_spool()
+        return replayed
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.due.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.due.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Attendance flush failed; %d scans pending", len(self.pending))
+
+    async def drain(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Attendance drain failed; %d scans left unwritten", len(self.pending))
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+def worker_spool_path(spool_path: Optional[str]) -> Optional[str]:
+    slot = os.getenv("WORKER_SLOT")
+    if spool_path and slot is not None:
+        return f"{spool_path}.{slot}"
+    return spool_path
+
+attendance_buffer = AttendanceBuffer(attendance_repo, ATTENDANCE_FLUSH_SIZE, ATTENDANCE_FLUSH_SECONDS,
+                                     ATTENDANCE_SPOOL_PATH)
 
 # JWT Config
 JWT_SECRET = os.getenv("JWT_SECRET")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_MINUTES = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", str(30 * 24 * 60)))  # 30 days
+
+# Token revocation
+# Revoked jtis live in Mongo (with a TTL index) and are mirrored into an
+# in-memory map that each worker re-syncs every REVOCATION_SYNC_SECONDS, so
+# checking revocation on the auth hot path never touches the database.
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "30"))
+
+class RevocationList:
+    def __init__(self):
+        self.revoked = {}  # 16-byte jti -> expiry (epoch seconds)
+        self.synced_until = None
+
+    @staticmethod
+    def _key(jti: str) -> bytes:
+        try:
+            return bytes.fromhex(jti)
+        except ValueError:
+            return jti.encode()
+
+    def add(self, jti: str, expires_at: datetime) -> None:
+        self.revoked[self._key(jti)] = expires_at.timestamp()
+
+    def __contains__(self, jti: str) -> bool:
+        return self._key(jti) in self.revoked
+
+    def __len__(self) -> int:
+        return len(self.revoked)
+
+    def prune(self) -> None:
+        now = time.time()
+        self.revoked = {key: expiry for key, expiry in self.revoked.items() if expiry > now}
+
+    async def sync(self, repo: Repository) -> None:
+        query = {}
+        if self.synced_until:
+            # Overlap the previous window so late-committed revocations aren't missed
+            query = {"revoked_at": {"$gt": self.synced_until - timedelta(seconds=REVOCATION_SYNC_SECONDS)}}
+        for record in await repo.find(query, projection={"_id": 0, "jti": 1, "expires_at": 1, "revoked_at": 1}):
+            self.add(record["jti"], record["expires_at"])
+            if not self.synced_until or record["revoked_at"] > self.synced_until:
+                self.synced_until = record["revoked_at"]
+        self.prune()
+
+revocation_list = RevocationList()
+
+async def sync_revocations_forever():
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            await revocation_list.sync(revoked_tokens_repo)
+        except Exception:
+            logger.exception("Revocation list sync failed")
+
+# QR attendance codes
+# A code reads "<session_id>.<window>.<signature>": an HMAC over a class session
+# and a QR_WINDOW_SECONDS time window, so scans are verified in memory without
+# a lookup. Class sessions are the distinct timetable classes, indexed by a
+# stable id and re-read every QR_SESSION_REFRESH_SECONDS; a code only scans
+# while its class is on (from QR_EARLY_MINUTES before the start until the end).
+def derive_qr_secret(qr_secret: Optional[str], jwt_secret: Optional[str]) -> bytes:
+    # Without a dedicated QR_SECRET, codes are signed with a key derived from the
+    # JWT secret, never the JWT secret itself, so the two never share a key
+    if qr_secret:
+        return qr_secret.encode()
+    if jwt_secret:
+        return hmac.new(jwt_secret.encode(), b"qr", hashlib.sha256).digest()
+    raise RuntimeError("Set QR_SECRET or JWT_SECRET: attendance codes can't be signed with an empty key")
+
+QR_SECRET = derive_qr_secret(os.getenv("QR_SECRET"), JWT_SECRET)
+QR_WINDOW_SECONDS = int(os.getenv("QR_WINDOW_SECONDS", "30"))
+QR_EARLY_MINUTES = int(os.getenv("QR_EARLY_MINUTES", "15"))
+QR_SESSION_REFRESH_SECONDS = float(os.getenv("QR_SESSION_REFRESH_SECONDS", "300"))
+# Who may display codes; left empty, nobody may
+QR_ISSUER_USERNAMES = {name.strip() for name in os.getenv("QR_ISSUER_USERNAMES", "").split(",") if name.strip()}
+TIMETABLE_TIMEZONE = ZoneInfo(os.getenv("TIMETABLE_TIMEZONE", "Europe/London"))
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+TIME_RANGE_PATTERN = re.compile(r"^\s*(\d{1,2})[:.](\d{2})\s*[-–]\s*(\d{1,2})[:.](\d{2})\s*$")
+CLASS_FIELDS = ("course", "day", "time", "location", "campus")
+
+def parse_weekday(day: str) -> Optional[int]:
+    prefix = day.strip().lower()[:3]
+    if len(prefix) == 3:
+        for index, name in enumerate(WEEKDAYS):
+            if name.startswith(prefix):
+                return index
+    return None
+
+def parse_time_range(value: str) -> Optional[Tuple[int, int]]:
+    # "09:00-11:00" -> (540, 660), in minutes since midnight
+    match = TIME_RANGE_PATTERN.match(value)
+    if not match:
+        return None
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+    return (start, end) if start < end <= 24 * 60 else None
+
+def normalize_day(value: str) -> str:
+    weekday = parse_weekday(value)
+    if weekday is None:
+        raise ValueError("expected a weekday such as Monday")
+    return WEEKDAYS[weekday].capitalize()
+
+def normalize_time_range(value: str) -> str:
+    time_range = parse_time_range(value)
+    if time_range is None:
+        raise ValueError("expected a time range such as 09:00-11:00")
+    return "-".join(f"{minute // 60:02d}:{minute % 60:02d}" for minute in time_range)
+
+def timetable_slot(entry: dict) -> dict:
+    # Structured day and time stored next to the strings on every timetable write
+    weekday = parse_weekday(entry.get("day") or "")
+    time_range = parse_time_range(entry.get("time") or "")
+    if weekday is None or time_range is None:
+        return {"weekday": None, "start_minute": None, "end_minute": None}
+    return {"weekday": weekday, "start_minute": time_range[0], "end_minute": time_range[1]}
+
+def timetable_now() -> datetime:
+    return datetime.now(TIMETABLE_TIMEZONE)
+
+class ClassSession(NamedTuple):
+    session_id: str
+    course: str
+    day: str
+    time: str
+    location: str
+    campus: str
+    weekday: int
+    start_minute: int
+    end_minute: int
+
+    def is_on(self, now: datetime) -> bool:
+        minute = now.hour * 60 + now.minute
+        return (now.weekday() == self.weekday
+                and self.start_minute - QR_EARLY_MINUTES <= minute <= self.end_minute)
+
+    def public(self) -> dict:
+        return {"session_id": self.session_id, **{field: getattr(self, field) for field in CLASS_FIELDS}}
+
+def class_session(entry: dict) -> Optional[ClassSession]:
+    weekday = parse_weekday(entry.get("day", ""))
+    time_range = parse_time_range(entry.get("time", ""))
+    if weekday is None or time_range is None:
+        return None
+    # Derived from the class itself, so every worker agrees on the id
+    key = "\x1f".join(entry[field] for field in CLASS_FIELDS)
+    session_id = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return ClassSession(session_id, *(entry[field] for field in CLASS_FIELDS), weekday, *time_range)
+
+class SessionIndex:
+    def __init__(self):
+        self.sessions = {}
+
+    def add(self, entry: dict) -> Optional[ClassSession]:
+        session = class_session(entry)
+        if session is not None:
+            self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[ClassSession]:
+        return self.sessions.get(session_id)
+
+    def active(self, now: datetime) -> List[ClassSession]:
+        return [session for session in self.sessions.values() if session.is_on(now)]
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    async def rebuild(self, repo: TimetableRepository) -> None:
+        sessions = {}
+        for entry in await repo.distinct_classes():
+            session = class_session(entry)
+            if session is not None:
+                sessions[session.session_id] = session
+        self.sessions = sessions
+
+session_index = SessionIndex()
+
+async def refresh_sessions_forever():
+    while True:
+        await asyncio.sleep(QR_SESSION_REFRESH_SECONDS)
+        try:
+            await session_index.rebuild(timetable_repo)
+        except Exception:
+            logger.exception("Class session index refresh failed")
+
+def qr_signature(session_id: str, window: int) -> str:
+    digest = hmac.new(QR_SECRET, f"{session_id}.{window}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).rstrip(b"=").decode()
+
+def issue_qr_code(session_id: str, at: Optional[float] = None) -> Tuple[str, float]:
+    # Returns the code and the epoch second at which the next one replaces it
+    window = int((time.time() if at is None else at) // QR_WINDOW_SECONDS)
+    return f"{session_id}.{window}.{qr_signature(session_id, window)}", (window + 1) * QR_WINDOW_SECONDS
+
+def verify_qr_code(code: str, at: Optional[float] = None, now: Optional[datetime] = None) -> ClassSession:
+    parts = code.split(".")
+    if len(parts) != 3 or not (parts[1].isascii() and parts[1].isdigit()):
+        raise HTTPException(status_code=400, detail="Invalid QR code")
+    session_id, window, signature = parts[0], int(parts[1]), parts[2]
+    if not hmac.compare_digest(signature.encode(), qr_signature(session_id, window).encode()):
+        raise HTTPException(status_code=400, detail="Invalid QR code")
+    current = int((time.time() if at is None else at) // QR_WINDOW_SECONDS)
+    # The previous window stays valid so a code shown just before rotating still scans
+    if window not in (current, current - 1):
+        raise HTTPException(status_code=400, detail="QR code expired")
+    session = session_index.get(session_id)
+    if session is None or not session.is_on(now or timetable_now()):
+        raise HTTPException(status_code=400, detail="Class is not in session")
+    return session
+
+# Weekly schedules
+# Each student's classes sorted by minute of the week (Monday 00:00 is 0), so
+# the today, next and date-range views and clash checks are bisect lookups.
+# Schedules are cached per worker and dropped on that worker's timetable
+# writes; other workers pick a write up once their copy expires.
+SCHEDULE_CACHE_TTL_SECONDS = float(os.getenv("SCHEDULE_CACHE_TTL_SECONDS", "60"))
+SCHEDULE_CACHE_MAX_ENTRIES = int(os.getenv("SCHEDULE_CACHE_MAX_ENTRIES", "10000"))
+TIMETABLE_RANGE_MAX_DAYS = 62
+MINUTES_PER_DAY = 24 * 60
+
+def week_minute(entry: dict) -> int:
+    return entry["weekday"] * MINUTES_PER_DAY + entry["start_minute"]
+
+class WeeklySchedule:
+    def __init__(self, classes: List[dict]):
+        self.classes = sorted(classes, key=week_minute)
+        self.starts = [week_minute(entry) for entry in self.classes]
+
+    def on_weekday(self, weekday: int) -> List[dict]:
+        low = bisect_left(self.starts, weekday * MINUTES_PER_DAY)
+        return self.classes[low:bisect_left(self.starts, (weekday + 1) * MINUTES_PER_DAY)]
+
+    def next_after(self, weekday: int, minute: int) -> Optional[Tuple[dict, int]]:
+        # The first class starting at or after the given time and how many days ahead it is
+        if not self.classes:
+            return None
+        index = bisect_left(self.starts, weekday * MINUTES_PER_DAY + minute)
+        entry = self.classes[index % len(self.classes)]
+        days_ahead = entry["weekday"] - weekday + (7 if index == len(self.classes) else 0)
+        return entry, days_ahead
+
+    def clashes(self, weekday: int, start_minute: int, end_minute: int) -> List[dict]:
+        # Classes never cross midnight, so only the same day's classes can overlap
+        low = bisect_left(self.starts, weekday * MINUTES_PER_DAY)
+        high = bisect_left(self.starts, weekday * MINUTES_PER_DAY + end_minute)
+        return [entry for entry in self.classes[low:high] if entry["end_minute"] > start_minute]
+
+class ScheduleIndex:
+    def __init__(self, repo: TimetableRepository, max_entries: int, ttl: float):
+        self.repo = repo
+        self.cache = TTLCache(max_entries, ttl)
+
+    async def get(self, username: str) -> WeeklySchedule:
+        schedule = self.cache.get(username)
+        if schedule is None:
+            classes = await self.repo.find({"username": username}, projection_for(TimetableItem))
+            schedule = WeeklySchedule([entry for entry in classes if entry.get("weekday") is not None])
+            self.cache.set(username, schedule)
+        return schedule
+
+    def invalidate(self, username: str) -> None:
+        self.cache.delete(username)
+
+schedule_index = ScheduleIndex(timetable_repo, SCHEDULE_CACHE_MAX_ENTRIES, SCHEDULE_CACHE_TTL_SECONDS)
+
+def class_occurrence(entry: dict, day: date) -> dict:
+    # Wall-clock arithmetic, so a 09:00 class stays at 09:00 across DST changes
+    midnight = datetime.combine(day, datetime.min.time(), tzinfo=TIMETABLE_TIMEZONE)
+    return {**entry, "date": day, "starts_at": midnight + timedelta(minutes=entry["start_minute"]),
+            "ends_at": midnight + timedelta(minutes=entry["end_minute"])}
+
+async def fill_timetable_slots(classes: List[dict]) -> None:
+    for entry in classes:
+        entry.update(timetable_slot(entry))
+
+async def invalidate_schedules(classes: List[dict]) -> None:
+    for username in {entry["username"] for entry in classes}:
+        schedule_index.invalidate(username)
+
+# Incremental sync
+# Clients keep a token and fetch only what changed after it. Each worker tails
+# a Mongo change stream (replica sets only) over the synced collections into
+# sync_changes. Entries are upserted by resume token, whose hex form sorts in
+# commit order, so the workers' duplicate writes collapse and each one's
+# in-order writes keep the log free of gaps. A sync re-reads the current
+# state of the items touched after the token: found items are upserted,
+# missing ones deleted. Tokens that have aged out of the log, or predate a
+# restart that lost the stream's place, get a full reset instead.
+SYNC_SOURCES = {
+    "timetable": (timetable_repo, TimetableItem),
+    "grades": (grades_repo, GradeItem),
+    "news": (news_repo, NewsItem),
+    "attendance": (attendance_repo, AttendanceItem),
+}
+SYNC_SHARED_COLLECTIONS = {"news"}
+SYNC_MAX_CHANGES = int(os.getenv("SYNC_MAX_CHANGES", "1000"))
+SYNC_FEED_ENABLED = os.getenv("SYNC_FEED_ENABLED", "true").lower() == "true"
+SYNC_FEED_BATCH_SIZE = 100
+SYNC_FEED_RETRY_SECONDS = 5.0
+CHANGE_STREAM_HISTORY_LOST = 286
+CHANGE_STREAM_UNSUPPORTED = 40573
+CHANGE_STREAM_PIPELINE = [{"$match": {
+    "ns.coll": {"$in": list(SYNC_SOURCES)},
+    "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+}}]
+
+def change_entry(event: dict) -> dict:
+    collection = event["ns"]["coll"]
+    # Deletes only carry the username when the collection records pre-images
+    document = event.get("fullDocument") or event.get("fullDocumentBeforeChange") or {}
+    return {
+        "_id": event["_id"]["_data"],
+        "collection": collection,
+        "item_id": event["documentKey"]["_id"],
+        "username": None if collection in SYNC_SHARED_COLLECTIONS else document.get("username"),
+        "created_at": datetime.utcnow(),
+    }
+
+async def feed_change_log(database, repo: ChangeLogRepository) -> None:
+    options = {"full_document": "updateLookup", "full_document_before_change": "whenAvailable"}
+    latest = await repo.latest()
+    stream = database.watch(CHANGE_STREAM_PIPELINE, resume_after={"_data": latest} if latest else None, **options)
+    try:
+        event = await stream.try_next()
+    except OperationFailure as e:
+        if e.code != CHANGE_STREAM_HISTORY_LOST:
+            raise
+        # The oplog has moved past the log; emptying it sends every client a reset
+        logger.warning("Change stream history lost; restarting the sync log")
+        await stream.close()
+        await repo.clear()
+        stream = database.watch(CHANGE_STREAM_PIPELINE, **options)
+        event = await stream.try_next()
+    async with stream:
+        while True:
+            entries = []
+            while event is not None:
+                entries.append(change_entry(event))
+                if len(entries) >= SYNC_FEED_BATCH_SIZE:
+                    break
+                event = await stream.try_next()
+            if entries:
+                await repo.record(entries)
+            event = await stream.try_next()
+
+async def feed_change_log_forever():
+    while True:
+        try:
+            await feed_change_log(mongo.database, change_log_repo)
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAM_UNSUPPORTED:
+                logger.warning("Change streams need a replica set; /api/sync will only return full resets")
+                return
+            logger.exception("Change log feed failed")
+        except Exception:
+            logger.exception("Change log feed failed")
+        await asyncio.sleep(SYNC_FEED_RETRY_SECONDS)
+
+async def sync_snapshot(name: str, username: str) -> dict:
+    repo, model = SYNC_SOURCES[name]
+    if name in SYNC_SHARED_COLLECTIONS:
+        # Shared feeds start from their first page, like the list route
+        items = await repo.find({}, projection_for(model), sort=[("created_at", DESCENDING), ("_id", DESCENDING)],
+                                limit=DEFAULT_PAGE_SIZE)
+    else:
+        items = await repo.find({"username": username}, projection_for(model))
+    return {"upserted": items, "deleted": []}
+
+async def sync_delta(name: str, item_ids: list, username: str) -> dict:
+    if not item_ids:
+        return {"upserted": [], "deleted": []}
+    repo, model = SYNC_SOURCES[name]
+    item_ids = list(dict.fromkeys(item_ids))
+    query = {"_id": {"$in": item_ids}}
+    if name not in SYNC_SHARED_COLLECTIONS:
+        query["username"] = username
+    items = await repo.find(query, projection_for(model))
+    present = {item["_id"] for item in items}
+    return {"upserted": items, "deleted": [item_id for item_id in item_ids if item_id not in present]}
+
+# Attendance analytics
+# Scans are rolled up into one attendance_daily document per day, refreshed for
+# today and yesterday every ATTENDANCE_ROLLUP_SECONDS: per-class counts keyed by
+# session id, and per-student counts as a packed uint16 vector whose columns
+# come from an append-only roster. A term's dashboard then reads ~90 small
+# documents and sums them as NumPy arrays, joined to timetable enrolment.
+# Every worker runs the rollup loop, but only the holder of a Mongo lease does
+# the work; the lease outlives two periods, so a dead holder is replaced.
+ATTENDANCE_ROLLUP_SECONDS = float(os.getenv("ATTENDANCE_ROLLUP_SECONDS", "300"))
+ANALYTICS_DEFAULT_DAYS = 28
+ANALYTICS_MAX_DAYS = 366
+# Who may see everyone's attendance analytics
+STAFF_USERNAMES = {name.strip() for name in os.getenv("STAFF_USERNAMES", "").split(",") if name.strip()}
+
+class StudentRoster:
+    def __init__(self, repo: Repository):
+        self.repo = repo
+        self.columns = {}
+        self.size = 0
+
+    async def load(self) -> None:
+        roster = await self.repo.find_one({"_id": "students"}, {"_id": 0, "usernames": 1}) or {}
+        usernames = roster.get("usernames", [])
+        columns = {}
+        for column, username in enumerate(usernames):
+            # Concurrent appends may repeat a name; its first column is the one in use
+            columns.setdefault(username, column)
+        self.columns, self.size = columns, len(usernames)
+
+    async def ensure(self, usernames) -> None:
+        await self.load()
+        missing = [username for username in usernames if username not in self.columns]
+        if missing:
+            await self.repo.update_one({"_id": "students"}, {"$push": {"usernames": {"$each": missing}}}, upsert=True)
+            await self.load()
+
+student_roster = StudentRoster(attendance_roster_repo)
+# Timetable-derived enrolment changes slowly; recomputed at most once per rollup period
+analytics_cache = TTLCache(8, ATTENDANCE_ROLLUP_SECONDS)
+
+def local_day_bounds(day: date) -> Tuple[datetime, datetime]:
+    # Timetable-local day as naive UTC datetimes, matching stored timestamps
+    start = datetime.combine(day, datetime.min.time(), TIMETABLE_TIMEZONE)
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time(), TIMETABLE_TIMEZONE)
+    return (start.astimezone(timezone.utc).replace(tzinfo=None), end.astimezone(timezone.utc).replace(tzinfo=None))
+
+async def roll_up_attendance(day: date) -> int:
+    start, end = local_day_bounds(day)
+    classes = {group["_id"].split(":", 1)[0]: group["attended"]
+               for group in await attendance_repo.count_by_session(start, end)}
+    students = {group["_id"]: group["attended"] for group in await attendance_repo.count_by_student(start, end)}
+    await student_roster.ensure(students)
+    counts = np.zeros(student_roster.size, dtype=np.uint16)
+    for username, attended in students.items():
+        counts[student_roster.columns[username]] = min(attended, np.iinfo(np.uint16).max)
+    key = day.isoformat()
+    await attendance_rollups_repo.update_one({"_id": key}, {"$set": {
+        "classes": classes,
+        "students": counts.tobytes(),
+        "rolled_up_at": datetime.utcnow(),
+    }}, upsert=True)
+    return len(students)
+
+async def roll_up_attendance_forever():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        today = timetable_now().date()
+        try:
+            if await leases_repo.acquire("attendance_rollup", owner, 2 * ATTENDANCE_ROLLUP_SECONDS):
+                # Yesterday too, for scans flushed after midnight
+                for day in (today - timedelta(days=1), today):
+                    await roll_up_attendance(day)
+        except Exception:
+            logger.exception("Attendance rollup failed")
+        await asyncio.sleep(ATTENDANCE_ROLLUP_SECONDS)
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def analytics_days(start: Optional[date], end: Optional[date]) -> List[date]:
+    today = timetable_now().date()
+    end = min(end or today, today)
+    start = start or end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {ANALYTICS_MAX_DAYS} days")
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+async def daily_rollups(days: List[date], field: str) -> List[dict]:
+    return await attendance_rollups_repo.find({"_id": {"$gte": days[0].isoformat(), "$lte": days[-1].isoformat()}},
+                                              projection={field: 1})
+
+async def cached_timetable_aggregate(name: str, compute):
+    value = analytics_cache.get(name)
+    if value is None:
+        value = await compute()
+        analytics_cache.set(name, value)
+    return value
+
+async def class_attendance_rates(days: List[date]) -> List[dict]:
+    sessions, enrolled = [], []
+    for group in await cached_timetable_aggregate("class_enrolment", timetable_repo.class_enrolment):
+        session = class_session(group["class"])
+        if session is not None:
+            sessions.append(session)
+            enrolled.append(group["students"])
+    if not sessions:
+        return []
+    position = {session.session_id: index for index, session in enumerate(sessions)}
+    weeks = sorted({week_start(day) for day in days})
+    week_position = {week: index for index, week in enumerate(weeks)}
+
+    # A class meets in a week only if its weekday falls inside the range
+    meets = np.zeros((7, len(weeks)), dtype=bool)
+    meets[[day.weekday() for day in days], [week_position[week_start(day)] for day in days]] = True
+    met = meets[[session.weekday for session in sessions]]
+
+    rows, columns, counts = [], [], []
+    for rollup in await daily_rollups(days, "classes"):
+        column = week_position[week_start(date.fromisoformat(rollup["_id"]))]
+        for session_id, attended in rollup.get("classes", {}).items():
+            if session_id in position:
+                rows.append(position[session_id])
+                columns.append(column)
+                counts.append(attended)
+    attended = np.zeros((len(sessions), len(weeks)))
+    np.add.at(attended, (rows, columns), counts)
+    rates = attended / np.array(enrolled, dtype=float)[:, None]
+
+    # Converted to Python lists in bulk; per-cell numpy scalar access dominates otherwise
+    labels = [week.isoformat() for week in weeks]
+    attended, rates, met = attended.astype(int).tolist(), np.round(rates, 4).tolist(), met.tolist()
+    return [
+        {**session.public(), "enrolled": enrolled[row], "weeks": [
+            {"week": labels[column], "attended": attended[row][column], "rate": rates[row][column]}
+            for column in range(len(weeks)) if met[row][column]
+        ]}
+        for row, session in enumerate(sessions)
+    ]
+
+async def students_below(days: List[date], threshold: float) -> List[dict]:
+    load = [entry for entry in await cached_timetable_aggregate("weekly_load", timetable_repo.weekly_load)
+            if parse_weekday(entry["day"]) is not None]
+    usernames = sorted({entry["username"] for entry in load})
+    if not usernames:
+        return []
+    position = {username: index for index, username in enumerate(usernames)}
+    weekly = np.zeros((len(usernames), 7))
+    rows = [position[entry["username"]] for entry in load]
+    np.add.at(weekly, (rows, [parse_weekday(entry["day"]) for entry in load]), [entry["classes"] for entry in load])
+    # Classes each student was timetabled for across the range
+    expected = weekly @ np.bincount([day.weekday() for day in days], minlength=7)
+
+    vectors = [np.frombuffer(rollup["students"], dtype=np.uint16) for rollup in await daily_rollups(days, "students")
+               if rollup.get("students")]
+    if any(len(vector) > student_roster.size for vector in vectors) or not student_roster.columns:
+        await student_roster.load()
+    totals = np.zeros(student_roster.size + 1)  # trailing zero column for students never rolled up
+    for vector in vectors:
+        totals[:len(vector)] += vector
+    attended = totals[[student_roster.columns.get(username, student_roster.size) for username in usernames]]
+    rates = np.minimum(np.divide(attended, expected, out=np.zeros_like(attended), where=expected > 0), 1.0)
+
+    below = np.nonzero((expected > 0) & (rates < threshold))[0]
+    return [{"username": usernames[index], "attended": int(attended[index]), "expected": int(expected[index]),
+             "rate": round(float(rates[index]), 4)} for index in below[np.argsort(rates[below], kind="stable")]]
+
+# Password hashing
+# Pinning min/max to the configured cost makes passlib flag any stored hash
+# with a different cost factor, so it gets rehashed on the next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+def create_pwd_context():
+    return passlib_context.CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+        bcrypt__max_rounds=BCRYPT_ROUNDS,
+    )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 # Models
@@ -53,14 +2230,15 @@ class UserLogin(BaseModel):
 
 class CourseGrade(BaseModel):
     name: str
-    grade: str
-    credits: int
+    grade: Annotated[str, AfterValidator(normalize_grade)]
+    credits: int = Field(gt=0)
+    year: Optional[int] = None
 
 class TimetableClass(BaseModel):
     course: str
-    time: str
+    time: Annotated[str, AfterValidator(normalize_time_range)]
     location: str
-    day: str
+    day: Annotated[str, AfterValidator(normalize_day)]
     campus: str
 
 class NewsEvent(BaseModel):
@@ -85,48 +2263,437 @@ class ChatMessage(BaseModel):
     message: str
     session_id: Optional[str] = None
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class PasswordHasher:
+    # bcrypt releases the GIL while hashing, so a thread pool gives real
+    # parallelism without the pickling overhead of a process pool.
+    def __init__(self, context_factory, workers: int, max_pending: int):
+        self.context_factory = context_factory
+        self._context = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def _run(self, operation: str, func, *args):
+        # Only touched from the event loop thread, so no lock is needed
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            metrics.observe("bcrypt", operation, time.perf_counter() - started)
+
+    @property
+    def context(self):
+        # Built on first use, so passlib is only imported by workers that hash
+        if self._context is None:
+            self._context = self.context_factory()
+        return self._context
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        return await self._run("verify", self.context.verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher(create_pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    await ensure_indexes(mongo.database)
+    backfilled = await library_repo.backfill_search_fields()
+    if backfilled:
+        logger.info("Backfilled search fields on %d library books", backfilled)
+    backfilled = await timetable_repo.backfill_slots()
+    if backfilled:
+        logger.info("Backfilled slots on %d timetable classes", backfilled)
+    if INDEX_SELF_CHECK:
+        offenders = [item for item in await check_query_plans(mongo.database) if item["collscan"]]
+        if offenders:
+            raise RuntimeError(f"Queries without index support: {offenders}")
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    try:
+        await revocation_list.sync(revoked_tokens_repo)
+    except Exception:
+        logger.exception("Initial revocation list sync failed")
+    app.state.revocation_sync_task = asyncio.create_task(sync_revocations_forever())
+
+@app.on_event("startup")
+async def start_attendance_buffer():
+    # Resolved here rather than at import, which happens before the fork under serve.py
+    attendance_buffer.spool_path = worker_spool_path(ATTENDANCE_SPOOL_PATH)
+    replayed = attendance_buffer.open()
+    if replayed:
+        logger.info("Replaying %d spooled attendance scans", replayed)
+    app.state.attendance_flush_task = asyncio.create_task(attendance_buffer.run())
+
+@app.on_event("startup")
+async def start_session_index():
+    try:
+        await session_index.rebuild(timetable_repo)
+    except Exception:
+        logger.exception("Initial class session index build failed")
+    app.state.session_refresh_task = asyncio.create_task(refresh_sessions_forever())
+
+@app.on_event("startup")
+async def start_attendance_rollups():
+    app.state.attendance_rollup_task = asyncio.create_task(roll_up_attendance_forever())
+
+@app.on_event("startup")
+async def start_sync_feed():
+    app.state.sync_feed_task = asyncio.create_task(feed_change_log_forever()) if SYNC_FEED_ENABLED else None
+
+@app.on_event("shutdown")
+async def stop_sync_feed():
+    if app.state.sync_feed_task:
+        app.state.sync_feed_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_attendance_rollups():
+    app.state.attendance_rollup_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_session_refresh():
+    app.state.session_refresh_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    app.state.revocation_sync_task.cancel()
+
+@app.on_event("shutdown")
+async def drain_attendance_buffer():
+    # Runs before the Mongo client is closed
+    task = app.state.attendance_flush_task
+    task.cancel()
+    try:
+        # A flush cut off mid-write puts its batch back before drain() retries it
+        await task
+    except asyncio.CancelledError:
+        pass
+    await attendance_buffer.drain()
+
+@app.on_event("shutdown")
+async def close_mongo_client():
+    mongo.close()
+
+@app.on_event("shutdown")
+async def close_password_hasher():
+    password_hasher.shutdown()
+
+# Bulk import
+# Uploads (CSV with a header row, or NDJSON) are parsed line by line off the
+# request stream and validated per row; valid rows are written in unordered
+# insert_many chunks, the next chunk being parsed while the previous one is
+# written. Rows may name another student only when the caller is an import admin.
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ERRORS = 1000
+IMPORT_ADMIN_USERNAMES = {name.strip() for name in os.getenv("IMPORT_ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+async def upload_lines(request: Request):
+    # Yields raw lines; each is decoded as its own row, so a stray non-UTF-8
+    # byte fails that row rather than the whole upload
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.removeprefix(b"\xef\xbb\xbf").rstrip(b"\r")
+    if buffer:
+        yield buffer.removeprefix(b"\xef\xbb\xbf").rstrip(b"\r")
+
+async def upload_rows(request: Request, is_csv: bool):
+    # Yields (row_number, row, error); blank lines and the CSV header aren't rows
+    header = None
+    row_number = 0
+    async for raw in upload_lines(request):
+        if not raw.strip():
+            continue
+        if is_csv and header is None:
+            # Undecodable header bytes become U+FFFD; rows then fail on the unknown column
+            header = [name.strip() for name in next(csv.reader([raw.decode("utf-8", errors="replace")]))]
+            continue
+        row_number += 1
+        try:
+            line = raw.decode("utf-8")
+            if is_csv:
+                values = next(csv.reader([line]))
+                if len(values) != len(header):
+                    raise ValueError(f"expected {len(header)} columns, got {len(values)}")
+                row = dict(zip(header, values))
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("expected a JSON object")
+        except UnicodeDecodeError as e:
+            yield row_number, None, f"not valid UTF-8 (byte {e.start + 1})"
+            continue
+        except (ValueError, csv.Error) as e:
+            yield row_number, None, str(e)
+            continue
+        yield row_number, row, None
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+
+async def bulk_import(request: Request, repo: Repository, model, user: UserPrincipal,
+                      before_write=None, after_write=None) -> dict:
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        is_csv = True
+    elif "ndjson" in content_type or "json" in content_type:
+        is_csv = False
+    else:
+        raise HTTPException(status_code=415, detail="Upload text/csv or application/x-ndjson")
+
+    created_at = datetime.utcnow()
+    result = {"inserted": 0, "failed": 0, "errors": []}
+
+    def fail(row_number: int, message: str):
+        result["failed"] += 1
+        if len(result["errors"]) < IMPORT_MAX_ERRORS:
+            result["errors"].append({"row": row_number, "error": message})
+
+    async def write(documents: List[dict], row_numbers: List[int]):
+        if before_write:
+            await before_write(documents)
+        written = documents
+        try:
+            result["inserted"] += len(await repo.insert_many(documents, ordered=False))
+        except BulkWriteError as e:
+            result["inserted"] += e.details.get("nInserted", 0)
+            failed = set()
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                fail(row_numbers[error["index"]], error.get("errmsg", "write failed"))
+            written = [document for index, document in enumerate(documents) if index not in failed]
+        if after_write and written:
+            await after_write(written)
+
+    documents, row_numbers = [], []
+    pending = None
+    try:
+        async for row_number, row, error in upload_rows(request, is_csv):
+            if error is None:
+                username = str(row.pop("username", None) or user.username)
+                if username != user.username:
+                    try:
+                        require_importer(user)
+                    except HTTPException as e:
+                        error = e.detail
+            if error is None:
+                try:
+                    document = model(**row).dict()
+                except ValidationError as e:
+                    error = validation_message(e)
+            if error is not None:
+                fail(row_number, error)
+                continue
+            document["username"] = username
+            document["created_at"] = created_at
+            documents.append(document)
+            row_numbers.append(row_number)
+            if len(documents) >= IMPORT_CHUNK_SIZE:
+                if pending:
+                    await pending
+                pending = asyncio.create_task(write(documents, row_numbers))
+                documents, row_numbers = [], []
+    finally:
+        if pending:
+            await pending
+    if documents:
+        await write(documents, row_numbers)
+    result["errors"].sort(key=lambda item: item["row"])
+    return result
+
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def require_staff(user: UserPrincipal) -> None:
+    if user.username not in STAFF_USERNAMES:
+        raise HTTPException(status_code=403, detail="Staff access required")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def require_importer(user: UserPrincipal) -> None:
+    if user.username not in IMPORT_ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="not permitted to import rows for another user")
 
-def create_access_token(data: dict):
+async def student_years(usernames: List[str]) -> dict:
+    if not usernames:
+        return {}
+    students = await users_repo.find({"username": {"$in": list(set(usernames))}}, {"_id": 0, "username": 1, "year": 1})
+    return {student["username"]: student.get("year") for student in students}
+
+async def fill_grade_years(grades: List[dict]) -> None:
+    # Imported grades without a year belong to the student's current year
+    missing = [grade["username"] for grade in grades if grade.get("year") is None]
+    if not missing:
+        return
+    years = await student_years(missing)
+    for grade in grades:
+        if grade.get("year") is None:
+            grade["year"] = years.get(grade["username"])
+
+def require_qr_issuer(user: UserPrincipal) -> None:
+    if user.username not in QR_ISSUER_USERNAMES:
+        raise HTTPException(status_code=403, detail="Not permitted to display attendance codes")
+
+async def ndjson_lines(documents):
+    async for document in documents:
+        yield orjson.dumps(document, default=json_default) + b"\n"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def feed_page(namespace: str, repo: Repository, limit: int, cursor: Optional[str],
+                    sort_field: str, direction: int, projection: dict) -> CachedFeed:
+    async def load() -> CachedFeed:
+        items, next_cursor = await repo.find_page({}, sort_field, direction, limit, cursor, projection)
+        body = orjson.dumps(items, default=json_default)
+        return CachedFeed(body, f'"{hashlib.sha1(body).hexdigest()}"', next_cursor)
+
+    return await feed_cache.get(namespace, f"{limit}:{cursor or ''}", load)
+
+async def cached_feed(request: Request, namespace: str, repo: Repository, page: PageParams,
+                      sort_field: str, direction: int, projection: dict) -> Response:
+    entry = await feed_page(namespace, repo, page.limit or DEFAULT_PAGE_SIZE, page.cursor, sort_field, direction,
+                            projection)
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.next_cursor:
+        headers["X-Next-Cursor"] = entry.next_cursor
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=json_default)}\n\n"
+
+async def save_chat_turn(username: str, session_id: str, message: str, response: str) -> None:
+    await chat_history_repo.insert_one({
+        "username": username,
+        "session_id": session_id,
+        "message": message,
+        "response": response,
+        "timestamp": datetime.utcnow()
+    })
+
+async def paginate(repo: Repository, page: PageParams, query: dict, sort_field: Optional[str], direction: int,
+                   projection: dict, default_limit: int = DEFAULT_PAGE_SIZE) -> Response:
+    if page.format == "ndjson":
+        # Streams everything after the cursor unless the caller set a limit
+        documents = repo.iterate(query, sort_field, direction, page.cursor, page.limit or 0, projection)
+        return StreamingResponse(ndjson_lines(documents), media_type="application/x-ndjson")
+    items, next_cursor = await repo.find_page(query, sort_field, direction, page.limit or default_limit, page.cursor,
+                                              projection)
+    return FastJSONResponse(items, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+async def verify_password(plain_password: str, hashed_password: str):
+    # Returns (valid, new_hash); new_hash is set when the stored hash needs upgrading
+    return await password_hasher.verify_and_update(plain_password, hashed_password)
+
+def _create_token(data: dict, token_type: str, expire_minutes: int) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    expire = datetime.utcnow() + timedelta(minutes=expire_minutes)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": token_type})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=ALGORITHM)
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def create_access_token(data: dict):
+    return _create_token(data, "access", ACCESS_TOKEN_EXPIRE_MINUTES)
+
+def create_refresh_token(data: dict):
+    return _create_token(data, "refresh", REFRESH_TOKEN_EXPIRE_MINUTES)
+
+def issue_tokens(username: str) -> dict:
+    return {
+        "token": create_access_token({"sub": username}),
+        "refresh_token": create_refresh_token({"sub": username}),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def decode_token(token: str, token_type: str = "access") -> dict:
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return username
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    # Tokens issued before refresh tokens existed carry no type and act as access tokens
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("jti") and payload["jti"] in revocation_list:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return payload
+
+async def revoke_token(payload: dict) -> bool:
+    # Returns False if the token had already been revoked (e.g. by a concurrent request)
+    if not payload.get("jti"):
+        return False
+    expires_at = datetime.utcfromtimestamp(payload["exp"])
+    revocation_list.add(payload["jti"], expires_at)
+    return await revoked_tokens_repo.insert_if_absent({"jti": payload["jti"]}, {
+        "jti": payload["jti"],
+        "username": payload["sub"],
+        "expires_at": expires_at,
+        "revoked_at": datetime.utcnow(),
+    })
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserPrincipal:
+    username = decode_token(credentials.credentials)["sub"]
+    principal = principal_cache.get(username)
+    if principal is None:
+        user = await users_repo.get_principal(username)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        principal = UserPrincipal(*(user.get(field) for field in UserPrincipal._fields))
+        principal_cache.set(username, principal)
+    return principal
+
+def user_rate_limit(name: str):
+    async def check(user: UserPrincipal = Depends(get_current_user)) -> None:
+        await rate_limiter.check(name, user.username)
+    return check
+
+async def check_auth_rate_limit(request: Request, username: str) -> None:
+    ip = client_ip(request)
+    await rate_limiter.check("auth_ip", ip)
+    await rate_limiter.check("auth", f"{ip}:{username}")
 
 # Auth Routes
-@app.post("/api/auth/register")
-async def register(user: UserRegister):
-    if db.users.find_one({"username": user.username}):
+@app.post("/api/auth/register", response_model=AuthResponse)
+async def register(user: UserRegister, request: Request):
+    await check_auth_rate_limit(request, user.username)
+    if await users_repo.exists({"username": user.username}):
         raise HTTPException(status_code=400, detail="Username already exists")
     
-    if db.users.find_one({"email": user.email}):
+    if await users_repo.exists({"email": user.email}):
         raise HTTPException(status_code=400, detail="Email already exists")
     
     user_dict = user.dict()
-    user_dict["password"] = hash_password(user.password)
+    user_dict["password"] = await hash_password(user.password)
     user_dict["created_at"] = datetime.utcnow()
     
-    result = db.users.insert_one(user_dict)
-    token = create_access_token({"sub": user.username})
+    await users_repo.insert_one(user_dict)
     
     return {
-        "token": token,
+        **issue_tokens(user.username),
         "user": {
             "username": user.username,
             "email": user.email,
@@ -136,16 +2703,22 @@ async def register(user: UserRegister):
         }
     }
 
-@app.post("/api/auth/login")
-async def login(user: UserLogin):
-    db_user = db.users.find_one({"username": user.username})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+@app.post("/api/auth/login", response_model=AuthResponse)
+async def login(user: UserLogin, request: Request):
+    await check_auth_rate_limit(request, user.username)
+    db_user = await users_repo.get_credentials(user.username)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    valid, new_hash = await verify_password(user.password, db_user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_access_token({"sub": user.username})
+    if new_hash:
+        await users_repo.set_password(user.username, new_hash)
     
     return {
-        "token": token,
+        **issue_tokens(user.username),
         "user": {
             "username": db_user["username"],
             "email": db_user["email"],
@@ -155,191 +2728,374 @@ async def login(user: UserLogin):
         }
     }
 
-@app.get("/api/auth/me")
-async def get_me(username: str = Depends(get_current_user)):
-    user = db.users.find_one({"username": username})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+@app.post("/api/auth/refresh", response_model=TokenResponse)
+async def refresh(request: RefreshRequest):
+    payload = decode_token(request.refresh_token, "refresh")
+    if not await users_repo.get_principal(payload["sub"]):
+        raise HTTPException(status_code=401, detail="Invalid token")
     
-    return {
-        "username": user["username"],
-        "email": user["email"],
-        "student_id": user["student_id"],
-        "course": user["course"],
-        "year": user["year"]
-    }
+    # Refresh tokens are single-use: rotating them limits the damage of a leaked one
+    if not await revoke_token(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return issue_tokens(payload["sub"])
 
-# Timetable Routes
-@app.get("/api/timetable")
-async def get_timetable(username: str = Depends(get_current_user)):
-    user = db.users.find_one({"username": username})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    timetable = list(db.timetable.find({"username": username}))
-    for item in timetable:
-        item["_id"] = str(item["_id"])
+@app.post("/api/auth/logout")
+async def logout(request: LogoutRequest, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    access_payload = decode_token(credentials.credentials)
+    await revoke_token(access_payload)
+    if request.refresh_token:
+        try:
+            refresh_payload = decode_token(request.refresh_token, "refresh")
+        except HTTPException:
+            refresh_payload = None
+        if refresh_payload and refresh_payload["sub"] == access_payload["sub"]:
+            await revoke_token(refresh_payload)
+    evict_principal(access_payload["sub"])
     
-    return timetable
+    return {"message": "Logged out successfully"}
+
+@app.get("/api/auth/me", response_model=UserProfile)
+async def get_me(user: UserPrincipal = Depends(get_current_user)):
+    return user._asdict()
+
+# Timetable Routes
+@app.get("/api/timetable", response_model=List[TimetableItem])
+async def get_timetable(page: PageParams = Depends(), user: UserPrincipal = Depends(get_current_user)):
+    return await paginate(timetable_repo, page, {"username": user.username}, None, ASCENDING,
+                          projection_for(TimetableItem), default_limit=MAX_PAGE_SIZE)
+
+@app.get("/api/timetable/today", response_model=List[ClassOccurrenceItem])
+async def get_timetable_today(user: UserPrincipal = Depends(get_current_user)):
+    today = timetable_now().date()
+    schedule = await schedule_index.get(user.username)
+    return FastJSONResponse([class_occurrence(entry, today) for entry in schedule.on_weekday(today.weekday())])
+
+@app.get("/api/timetable/next", response_model=Optional[ClassOccurrenceItem])
+async def get_next_class(user: UserPrincipal = Depends(get_current_user)):
+    now = timetable_now()
+    schedule = await schedule_index.get(user.username)
+    upcoming = schedule.next_after(now.weekday(), now.hour * 60 + now.minute)
+    if upcoming is None:
+        return FastJSONResponse(None)
+    entry, days_ahead = upcoming
+    return FastJSONResponse(class_occurrence(entry, now.date() + timedelta(days=days_ahead)))
+
+@app.get("/api/timetable/range", response_model=List[ClassOccurrenceItem])
+async def get_timetable_range(start: date, end: date, user: UserPrincipal = Depends(get_current_user)):
+    if end < start or (end - start).days >= TIMETABLE_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400,
+                            detail=f"end must be on or after start and within {TIMETABLE_RANGE_MAX_DAYS} days")
+    schedule = await schedule_index.get(user.username)
+    days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+    return FastJSONResponse([class_occurrence(entry, day)
+                             for day in days for entry in schedule.on_weekday(day.weekday())])
 
 @app.post("/api/timetable")
-async def add_timetable(timetable_class: TimetableClass, username: str = Depends(get_current_user)):
+async def add_timetable(timetable_class: TimetableClass, allow_clash: bool = False,
+                        user: UserPrincipal = Depends(get_current_user)):
     timetable_dict = timetable_class.dict()
-    timetable_dict["username"] = username
+    timetable_dict.update(timetable_slot(timetable_dict))
+    if not allow_clash:
+        schedule = await schedule_index.get(user.username)
+        clashes = schedule.clashes(timetable_dict["weekday"], timetable_dict["start_minute"],
+                                   timetable_dict["end_minute"])
+        if clashes:
+            raise HTTPException(status_code=409, detail={
+                "message": "Class overlaps your timetable; retry with allow_clash=true to add it anyway",
+                "clashes": [{"id": str(entry["_id"]), **{field: entry[field] for field in CLASS_FIELDS}}
+                            for entry in clashes],
+            })
+    timetable_dict["username"] = user.username
     timetable_dict["created_at"] = datetime.utcnow()
     
-    result = db.timetable.insert_one(timetable_dict)
-    timetable_dict["_id"] = str(result.inserted_id)
+    timetable_dict["_id"] = await timetable_repo.insert_one(timetable_dict)
+    schedule_index.invalidate(user.username)
+    session_index.add(timetable_dict)
     
     return timetable_dict
 
+@app.post("/api/timetable/import")
+async def import_timetable(request: Request, user: UserPrincipal = Depends(get_current_user)):
+    # Imports are not checked for clashes; a term's timetable may legitimately overlap
+    result = await bulk_import(request, timetable_repo, TimetableClass, user,
+                               before_write=fill_timetable_slots, after_write=invalidate_schedules)
+    if result["inserted"]:
+        await session_index.rebuild(timetable_repo)
+    return result
+
 # Grades Routes
-@app.get("/api/grades")
-async def get_grades(username: str = Depends(get_current_user)):
-    user = db.users.find_one({"username": username})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    grades = list(db.grades.find({"username": username}))
-    for item in grades:
-        item["_id"] = str(item["_id"])
-    
-    return grades
+@app.get("/api/grades", response_model=List[GradeItem])
+async def get_grades(page: PageParams = Depends(), user: UserPrincipal = Depends(get_current_user)):
+    return await paginate(grades_repo, page, {"username": user.username}, None, ASCENDING,
+                          projection_for(GradeItem), default_limit=MAX_PAGE_SIZE)
 
 @app.post("/api/grades")
-async def add_grade(grade: CourseGrade, username: str = Depends(get_current_user)):
+async def add_grade(grade: CourseGrade, user: UserPrincipal = Depends(get_current_user)):
     grade_dict = grade.dict()
-    grade_dict["username"] = username
+    grade_dict["username"] = user.username
+    grade_dict["year"] = grade.year or user.year
     grade_dict["created_at"] = datetime.utcnow()
     
-    result = db.grades.insert_one(grade_dict)
-    grade_dict["_id"] = str(result.inserted_id)
+    grade_dict["_id"] = await grades_repo.insert_one(grade_dict)
+    # Not atomic with the insert; the summary backfill repairs any drift
+    await grade_summaries_repo.apply([grade_dict])
     
     return grade_dict
 
+@app.get("/api/grades/summary")
+async def get_grades_summary(user: UserPrincipal = Depends(get_current_user)):
+    return await grade_summaries_repo.get_summary(user.username)
+
+@app.post("/api/grades/import")
+async def import_grades(request: Request, user: UserPrincipal = Depends(get_current_user)):
+    return await bulk_import(request, grades_repo, CourseGrade, user,
+                             before_write=fill_grade_years, after_write=grade_summaries_repo.apply)
+
 # News & Events Routes
-@app.get("/api/news")
-async def get_news():
-    news = list(db.news.find().sort("created_at", -1).limit(50))
-    for item in news:
-        item["_id"] = str(item["_id"])
-    return news
+@app.get("/api/news", response_model=List[NewsItem])
+async def get_news(request: Request, page: PageParams = Depends()):
+    if page.format == "ndjson":
+        return await paginate(news_repo, page, {}, "created_at", DESCENDING, projection_for(NewsItem))
+    return await cached_feed(request, "news", news_repo, page, "created_at", DESCENDING, projection_for(NewsItem))
 
 @app.post("/api/news")
-async def create_news(news: NewsEvent, username: str = Depends(get_current_user)):
+async def create_news(news: NewsEvent, user: UserPrincipal = Depends(get_current_user)):
     news_dict = news.dict()
     news_dict["created_at"] = datetime.utcnow()
-    news_dict["author"] = username
+    news_dict["author"] = user.username
     
-    result = db.news.insert_one(news_dict)
-    news_dict["_id"] = str(result.inserted_id)
+    news_dict["_id"] = await news_repo.insert_one(news_dict)
+    await feed_cache.invalidate("news")
     
     return news_dict
 
-@app.get("/api/events")
-async def get_events():
-    events = list(db.events.find().sort("date", 1).limit(50))
-    for item in events:
-        item["_id"] = str(item["_id"])
-    return events
+@app.get("/api/events", response_model=List[EventItem])
+async def get_events(request: Request, page: PageParams = Depends()):
+    if page.format == "ndjson":
+        return await paginate(events_repo, page, {}, "date", ASCENDING, projection_for(EventItem))
+    return await cached_feed(request, "events", events_repo, page, "date", ASCENDING, projection_for(EventItem))
 
 # Library Routes
-@app.get("/api/library")
-async def search_library(query: Optional[str] = None):
-    if query:
-        books = list(db.library.find({
-            "$or": [
-                {"title": {"$regex": query, "$options": "i"}},
-                {"author": {"$regex": query, "$options": "i"}},
-                {"isbn": {"$regex": query, "$options": "i"}}
-            ]
-        }).limit(50))
-    else:
-        books = list(db.library.find().limit(50))
-    
-    for item in books:
-        item["_id"] = str(item["_id"])
-    
-    return books
+@app.get("/api/library", response_model=List[LibraryItem])
+async def search_library(
+    query: Optional[str] = None,
+    campus: Optional[str] = None,
+    available: Optional[bool] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    books, next_cursor = await library_repo.search(query, library_filters(campus, available), limit, cursor)
+    return FastJSONResponse(books, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
 
 @app.post("/api/library")
-async def add_book(book: LibraryBook, username: str = Depends(get_current_user)):
+async def add_book(book: LibraryBook, user: UserPrincipal = Depends(get_current_user)):
     book_dict = book.dict()
     book_dict["created_at"] = datetime.utcnow()
     
-    result = db.library.insert_one(book_dict)
-    book_dict["_id"] = str(result.inserted_id)
+    book_dict["_id"] = await library_repo.insert_one({**book_dict, **library_search_fields(book_dict)})
     
     return book_dict
 
+@app.get("/api/library/autocomplete")
+async def autocomplete_library(prefix: str, campus: Optional[str] = None, available: Optional[bool] = None):
+    books, _ = await library_repo.search_prefix(prefix, library_filters(campus, available), limit=10,
+                                                projection=AUTOCOMPLETE_PROJECTION)
+    return [{"title": book["title"], "author": book["author"]} for book in books]
+
 # Attendance Routes
-@app.post("/api/attendance")
-async def mark_attendance(record: AttendanceRecord, username: str = Depends(get_current_user)):
-    # Verify QR code exists
+@app.post("/api/attendance", dependencies=[Depends(user_rate_limit("attendance"))])
+async def mark_attendance(record: AttendanceRecord, user: UserPrincipal = Depends(get_current_user)):
+    session = verify_qr_code(record.qr_code)
     attendance_dict = record.dict()
-    attendance_dict["username"] = username
+    attendance_dict["class_name"] = session.course
+    attendance_dict["username"] = user.username
     attendance_dict["timestamp"] = datetime.utcnow()
+    # One mark per student per class meeting, however many codes it rotates through
+    attendance_dict["session"] = f"{session.session_id}:{timetable_now().date().isoformat()}"
+    attendance_dict["_id"] = ObjectId()
     
-    result = db.attendance.insert_one(attendance_dict)
-    attendance_dict["_id"] = str(result.inserted_id)
+    stored, created = attendance_buffer.add(attendance_dict)
     
-    return {"message": "Attendance marked successfully", "record": attendance_dict}
+    message = "Attendance marked successfully" if created else "Attendance already marked"
+    return {"message": message, "record": {**stored, "_id": str(stored["_id"])}}
 
-@app.get("/api/attendance")
-async def get_attendance(username: str = Depends(get_current_user)):
-    attendance = list(db.attendance.find({"username": username}).sort("timestamp", -1))
-    for item in attendance:
-        item["_id"] = str(item["_id"])
-    
-    return attendance
+@app.get("/api/attendance/sessions")
+async def get_active_sessions(user: UserPrincipal = Depends(get_current_user)):
+    require_qr_issuer(user)
+    return [session.public() for session in session_index.active(timetable_now())]
+
+@app.get("/api/attendance/sessions/{session_id}/qr")
+async def get_session_qr_code(session_id: str, user: UserPrincipal = Depends(get_current_user)):
+    require_qr_issuer(user)
+    session = session_index.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Class session not found")
+    if not session.is_on(timetable_now()):
+        raise HTTPException(status_code=400, detail="Class is not in session")
+    code, rotates_at = issue_qr_code(session_id)
+    return {"qr_code": code, "expires_at": datetime.utcfromtimestamp(rotates_at), "session": session.public()}
+
+@app.get("/api/attendance", response_model=List[AttendanceItem])
+async def get_attendance(page: PageParams = Depends(), user: UserPrincipal = Depends(get_current_user)):
+    return await paginate(attendance_repo, page, {"username": user.username}, "timestamp", DESCENDING,
+                          projection_for(AttendanceItem))
+
+# Sync Routes
+@app.get("/api/sync")
+async def sync_changes(since: Optional[str] = None, collections: Optional[str] = None,
+                       user: UserPrincipal = Depends(get_current_user)):
+    names = parse_name_list(collections, tuple(SYNC_SOURCES), "collections")
+    # Read first: changes landing while the sections load are replayed next time
+    latest = await change_log_repo.latest()
+    if since is None or not await change_log_repo.exists({"_id": since}):
+        sections = await asyncio.gather(*(sync_snapshot(name, user.username) for name in names))
+        return FastJSONResponse({"token": latest, "reset": True, "more": False, "changes": dict(zip(names, sections))})
+    entries = await change_log_repo.changed_after(since, latest, user.username, names, SYNC_MAX_CHANGES + 1)
+    more = len(entries) > SYNC_MAX_CHANGES
+    if more:
+        entries = entries[:SYNC_MAX_CHANGES]
+    changed = {name: [] for name in names}
+    for entry in entries:
+        changed[entry["collection"]].append(entry["item_id"])
+    sections = await asyncio.gather(*(sync_delta(name, item_ids, user.username) for name, item_ids in changed.items()))
+    return FastJSONResponse({"token": entries[-1]["_id"] if more else latest, "reset": False, "more": more,
+                             "changes": dict(zip(names, sections))})
+
+# Dashboard Routes
+# The home tab in one round trip: the token is checked once and the sections
+# are queried concurrently. Each list section is the first page of its route,
+# whose cursor continues there.
+DASHBOARD_SECTIONS = ("user", "timetable", "grades", "news", "attendance")
+
+async def dashboard_page(repo: Repository, query: dict, sort_field: Optional[str], direction: int,
+                         model: type, limit: int) -> dict:
+    items, next_cursor = await repo.find_page(query, sort_field, direction, limit, None, projection_for(model))
+    return {"items": items, "next_cursor": next_cursor}
+
+async def dashboard_news() -> dict:
+    # Served from the same cached page as GET /api/news
+    entry = await feed_page("news", news_repo, DEFAULT_PAGE_SIZE, None, "created_at", DESCENDING,
+                            projection_for(NewsItem))
+    return {"items": orjson.loads(entry.body), "next_cursor": entry.next_cursor}
+
+def parse_name_list(value: Optional[str], allowed, parameter: str) -> List[str]:
+    if value is None:
+        return list(allowed)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if not names or set(names) - set(allowed):
+        raise HTTPException(status_code=400,
+                            detail=f"{parameter} must be a comma-separated subset of {', '.join(allowed)}")
+    return list(dict.fromkeys(names))
+
+@app.get("/api/dashboard")
+async def get_dashboard(fields: Optional[str] = None, user: UserPrincipal = Depends(get_current_user)):
+    sections = parse_name_list(fields, DASHBOARD_SECTIONS, "fields")
+    mine = {"username": user.username}
+    loaders = {
+        "timetable": lambda: dashboard_page(timetable_repo, mine, None, ASCENDING, TimetableItem, MAX_PAGE_SIZE),
+        "grades": lambda: dashboard_page(grades_repo, mine, None, ASCENDING, GradeItem, MAX_PAGE_SIZE),
+        "news": dashboard_news,
+        "attendance": lambda: dashboard_page(attendance_repo, mine, "timestamp", DESCENDING, AttendanceItem,
+                                             DEFAULT_PAGE_SIZE),
+    }
+    queried = [name for name in sections if name in loaders]
+    results = dict(zip(queried, await asyncio.gather(*(loaders[name]() for name in queried))))
+    return FastJSONResponse({name: user._asdict() if name == "user" else results[name] for name in sections})
 
 # AI Chatbot Routes
-@app.post("/api/chat")
-async def chat(chat_msg: ChatMessage, username: str = Depends(get_current_user)):
+@app.post("/api/chat", dependencies=[Depends(user_rate_limit("chat"))])
+async def chat(chat_msg: ChatMessage, user: UserPrincipal = Depends(get_current_user)):
     try:
-        api_key = os.getenv("EMERGENT_LLM_KEY")
-        session_id = chat_msg.session_id or f"{username}_{datetime.utcnow().timestamp()}"
-        
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=session_id,
-            system_message="You are a helpful University of Greenwich assistant. Help students with information about courses, campus locations, events, library resources, and general university queries. The university has 3 campuses: Greenwich (SE London - historic World Heritage Site), Avery Hill (Eltham, London), and Medway (Kent). Be helpful, friendly, and concise."
-        )
+        session_id = chat_msg.session_id or f"{user.username}_{datetime.utcnow().timestamp()}"
         
-        chat.with_model("openai", "gpt-4o-mini")
-        
-        user_message = UserMessage(text=chat_msg.message)
-        response = await chat.send_message(user_message)
+        response = await chat_sessions.send(user.username, session_id, chat_msg.message)
         
         # Store chat history
-        chat_record = {
-            "username": username,
-            "session_id": session_id,
-            "message": chat_msg.message,
-            "response": response,
-            "timestamp": datetime.utcnow()
-        }
-        db.chat_history.insert_one(chat_record)
+        await save_chat_turn(user.username, session_id, chat_msg.message, response)
         
         return {"response": response, "session_id": session_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
-@app.get("/api/chat/history")
-async def get_chat_history(username: str = Depends(get_current_user), session_id: Optional[str] = None):
-    query = {"username": username}
+@app.post("/api/chat/stream", dependencies=[Depends(user_rate_limit("chat"))])
+async def chat_stream(chat_msg: ChatMessage, user: UserPrincipal = Depends(get_current_user)):
+    session_id = chat_msg.session_id or f"{user.username}_{datetime.utcnow().timestamp()}"
+    
+    async def events():
+        chunks = []
+        try:
+            async for chunk in chat_sessions.stream(user.username, session_id, chat_msg.message):
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            response = "".join(chunks)
+            # Persist only once the reply is complete
+            await save_chat_turn(user.username, session_id, chat_msg.message, response)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Chat error: {str(e)}"})
+            return
+        yield sse_event("done", {"response": response, "session_id": session_id})
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/chat/history", response_model=List[ChatHistoryItem])
+async def get_chat_history(page: PageParams = Depends(),
+                           user: UserPrincipal = Depends(get_current_user), session_id: Optional[str] = None):
+    query = {"username": user.username}
     if session_id:
         query["session_id"] = session_id
     
-    history = list(db.chat_history.find(query).sort("timestamp", 1).limit(100))
-    for item in history:
-        item["_id"] = str(item["_id"])
-    
-    return history
+    return await paginate(chat_history_repo, page, query, "timestamp", ASCENDING, projection_for(ChatHistoryItem),
+                          default_limit=100)
+
+# Analytics Routes
+@app.get("/api/analytics/attendance/classes")
+async def get_class_attendance_rates(start: Optional[date] = None, end: Optional[date] = None,
+                                     user: UserPrincipal = Depends(get_current_user)):
+    require_staff(user)
+    return await class_attendance_rates(analytics_days(start, end))
+
+@app.get("/api/analytics/attendance/students")
+async def get_students_below(start: Optional[date] = None, end: Optional[date] = None,
+                             below: float = Query(0.7, ge=0, le=1), user: UserPrincipal = Depends(get_current_user)):
+    require_staff(user)
+    return await students_below(analytics_days(start, end), below)
+
+@app.post("/api/admin/attendance-rollups")
+async def rebuild_attendance_rollups(start: date, end: date, user: UserPrincipal = Depends(get_current_user)):
+    require_staff(user)
+    days = analytics_days(start, end)
+    for day in days:
+        await roll_up_attendance(day)
+    return {"days": len(days)}
+
+# Maintenance Routes
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/index-check")
+async def index_check(user: UserPrincipal = Depends(get_current_user)):
+    require_staff(user)
+    report = await check_query_plans(mongo.database)
+    offenders = [item for item in report if item["collscan"]]
+    if offenders:
+        raise HTTPException(status_code=503, detail={"message": "Collection scans detected", "queries": offenders})
+    return {"status": "ok", "queries": report}
+
+@app.get("/api/admin/cache-stats")
+async def cache_stats(user: UserPrincipal = Depends(get_current_user)):
+    require_staff(user)
+    return {"feeds": feed_cache.stats(), "chat_sessions": len(chat_sessions), "chat_answers": answer_cache.stats()}
+
+@app.post("/api/admin/grade-summaries/backfill")
+async def backfill_grade_summaries(user: UserPrincipal = Depends(get_current_user)):
+    require_staff(user)
+    return {"students": await grade_summaries_repo.backfill(grades_repo)}
 
 # Seed data endpoint (for development)
 @app.post("/api/seed")
-async def seed_data(username: str = Depends(get_current_user)):
+async def seed_data(user: UserPrincipal = Depends(get_current_user)):
     # Seed some sample news
     sample_news = [
         {
@@ -397,14 +3153,16 @@ async def seed_data(username: str = Depends(get_current_user)):
     ]
     
     # Insert only if collections are empty
-    if db.news.count_documents({}) == 0:
-        db.news.insert_many(sample_news)
+    if await news_repo.count({}) == 0:
+        await news_repo.insert_many(sample_news)
+        await feed_cache.invalidate("news")
     
-    if db.library.count_documents({}) == 0:
-        db.library.insert_many(sample_books)
+    if await library_repo.count({}) == 0:
+        await library_repo.insert_many([{**book, **library_search_fields(book)} for book in sample_books])
     
     return {"message": "Sample data seeded successfully"}
 
 if __name__ == "__main__":
+    # Single-process development server; production runs serve.py
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
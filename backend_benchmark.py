@@ -0,0 +1,729 @@
+#!/usr/bin/env python3
+"""
+Load Benchmarks for University of Greenwich App
+Measures latency percentiles of the API endpoints under concurrent load
+
+Run the server with rate limits well above the load generated here (e.g.
+RATE_LIMIT_AUTH, RATE_LIMIT_AUTH_IP, RATE_LIMIT_CHAT and RATE_LIMIT_ATTENDANCE set to
+"1000000/1"),
+otherwise throttled requests show up as errors.
+"""
+
+import requests
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Configuration
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://localhost:8001/api")
+BENCH_USERNAME = os.getenv("BENCH_USERNAME", "benchuser")
+BENCH_PASSWORD = os.getenv("BENCH_PASSWORD", "bench123")
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+REQUESTS_PER_ROUTE = int(os.getenv("BENCH_REQUESTS", "1000"))
+SERVER_CORES = int(os.getenv("BENCH_SERVER_CORES", str(os.cpu_count() or 1)))
+# In-process benchmarks talk to Mongo directly and use a scratch database
+BENCH_MONGO_URL = os.getenv("BENCH_MONGO_URL")
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "university_db_bench")
+LIBRARY_CATALOGUE_SIZE = int(os.getenv("BENCH_LIBRARY_SIZE", "500000"))
+LIBRARY_TARGET_MS = 10.0
+ANALYTICS_STUDENTS = int(os.getenv("BENCH_ANALYTICS_STUDENTS", "20000"))
+ANALYTICS_CLASSES = 2000
+ANALYTICS_TERM_DAYS = 84
+ANALYTICS_TARGET_MS = 50.0
+SERIALIZATION_ITEMS = int(os.getenv("BENCH_SERIALIZATION_ITEMS", "10000"))
+METRICS_OVERHEAD_TARGET = 0.02
+# serve.py is launched locally, so its workers share the host with the load
+# generator; keep workers + load processes within the core count for clean numbers
+SCALING_WORKERS = [int(n) for n in os.getenv(
+    "BENCH_SCALING_WORKERS",
+    ",".join(str(n) for n in sorted({1, 2, 4, 8, 16, max(1, SERVER_CORES // 2)}) if n <= max(1, SERVER_CORES // 2)),
+).split(",")]
+SCALING_LOAD_PROCESSES = int(os.getenv("BENCH_LOAD_PROCESSES", str(max(1, SERVER_CORES // 2))))
+SCALING_CONNECTIONS = 32
+SCALING_SECONDS = float(os.getenv("BENCH_SCALING_SECONDS", "10"))
+SCALING_PORT = int(os.getenv("BENCH_SCALING_PORT", "8101"))
+SCALING_EFFICIENCY_TARGET = 0.8
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+WORDS = ["introduction", "advanced", "principles", "computer", "science", "business", "management",
+         "engineering", "mathematics", "history", "maritime", "design", "networks", "systems", "data",
+         "analysis", "law", "nursing", "pharmacy", "architecture", "economics", "psychology", "biology",
+         "chemistry", "physics", "marketing", "finance", "software", "security", "education"]
+SURNAMES = ["Smith", "Doe", "Johnson", "Patel", "Okafor", "Nguyen", "Brown", "Garcia", "Khan", "Williams"]
+CAMPUSES = ["Greenwich", "Avery Hill", "Medway"]
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def hammer(url, token, seconds, connections):
+    """Load generator process: count 200 responses from `connections` keep-alive loops"""
+    import aiohttp
+
+    async def run():
+        completed = 0
+        deadline = time.perf_counter() + seconds
+        connector = aiohttp.TCPConnector(limit=connections)
+        async with aiohttp.ClientSession(connector=connector, headers={"Authorization": f"Bearer {token}"}) as session:
+            async def loop():
+                nonlocal completed
+                while time.perf_counter() < deadline:
+                    async with session.get(url) as response:
+                        await response.read()
+                        completed += response.status == 200
+            await asyncio.gather(*(loop() for _ in range(connections)))
+        return completed
+
+    return asyncio.run(run())
+
+class UniversityAppBenchmark:
+    def __init__(self):
+        self.base_url = BASE_URL
+        self.token = None
+        self.session = requests.Session()
+        self.results = []
+        self.loop = asyncio.new_event_loop()
+
+    def log_result(self, name, latencies, errors, elapsed):
+        """Log benchmark results"""
+        result = {
+            "benchmark": name,
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.results.append(result)
+        print(f"{name:<28} {result['throughput']:>9.1f} req/s  "
+              f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+              f"p99 {result['p99_ms']:>8.2f} ms  errors {errors}")
+        return result
+
+    def authenticate(self):
+        """Register (if needed) and log in the benchmark user"""
+        self.session.post(f"{self.base_url}/auth/register", json={
+            "username": BENCH_USERNAME,
+            "email": f"{BENCH_USERNAME}@greenwich.ac.uk",
+            "password": BENCH_PASSWORD,
+            "student_id": "BENCH0001",
+            "course": "Computer Science",
+            "year": 2
+        })
+        response = self.session.post(f"{self.base_url}/auth/login", json={
+            "username": BENCH_USERNAME,
+            "password": BENCH_PASSWORD
+        })
+        if response.status_code != 200:
+            print(f"❌ Login failed with status {response.status_code}: {response.text}")
+            return False
+        self.token = response.json()["token"]
+        self.session.headers.update({"Authorization": f"Bearer {self.token}"})
+        self.session.post(f"{self.base_url}/seed")
+        return True
+
+    def run_concurrent(self, name, method, path, json_body=None, params=None,
+                       total=REQUESTS_PER_ROUTE, concurrency=CONCURRENCY):
+        """Fire `total` requests at `path` from `concurrency` threads and record latencies"""
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        url = f"{self.base_url}{path}"
+
+        def one_request(i):
+            session = requests.Session()
+            body = json_body(i) if callable(json_body) else json_body
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, json=body, params=params, headers=headers)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - start, ok
+
+        return self.run_pool(name, one_request, total, concurrency)
+
+    def run_pool(self, name, one_request, total, concurrency):
+        """Run `one_request(i)` -> (latency, ok) `total` times from `concurrency` threads"""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(one_request, range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for latency, _ in samples]
+        errors = sum(1 for _, ok in samples if not ok)
+        return self.log_result(name, latencies, errors, elapsed)
+
+    def benchmark_concurrent_reads(self):
+        """Concurrent latency of the Mongo-backed read routes"""
+        self.run_concurrent("GET /auth/me", "GET", "/auth/me")
+        self.run_concurrent("GET /timetable", "GET", "/timetable")
+        self.run_concurrent("GET /timetable/today", "GET", "/timetable/today")
+        self.run_concurrent("GET /timetable/next", "GET", "/timetable/next")
+        self.run_concurrent("GET /grades", "GET", "/grades")
+        self.run_concurrent("GET /news", "GET", "/news")
+        self.run_concurrent("GET /events", "GET", "/events")
+        self.run_concurrent("GET /library?query=", "GET", "/library", params={"query": "Computer"})
+        self.run_concurrent("GET /attendance", "GET", "/attendance")
+        self.run_concurrent("GET /chat/history", "GET", "/chat/history")
+        self.run_concurrent("GET /sync (reset)", "GET", "/sync")
+        token = self.session.get(f"{self.base_url}/sync").json()["token"]
+        if token:
+            self.run_concurrent("GET /sync?since= (delta)", "GET", "/sync", params={"since": token})
+
+    def benchmark_dashboard(self):
+        """Home tab load: one GET /dashboard against the five sequential calls it replaces"""
+        headers = {"Authorization": f"Bearer {self.token}"}
+
+        def home_tab(paths):
+            def one_request(i):
+                session = requests.Session()
+                start = time.perf_counter()
+                try:
+                    ok = all(session.get(f"{self.base_url}{path}", headers=headers).status_code < 400
+                             for path in paths)
+                except requests.RequestException:
+                    ok = False
+                return time.perf_counter() - start, ok
+            return one_request
+
+        total = max(1, REQUESTS_PER_ROUTE // 5)
+        sequential = self.run_pool("home tab (5 calls)", home_tab(
+            ["/auth/me", "/timetable", "/grades", "/news", "/attendance"]), total, CONCURRENCY)
+        dashboard = self.run_pool("home tab (GET /dashboard)", home_tab(["/dashboard"]), total, CONCURRENCY)
+        print(f"{'  speedup':<28} p50 {sequential['p50_ms'] / dashboard['p50_ms']:>5.1f}x  "
+              f"p99 {sequential['p99_ms'] / dashboard['p99_ms']:>5.1f}x")
+
+    def benchmark_concurrent_writes(self):
+        """Concurrent latency of the Mongo-backed write routes"""
+        self.run_concurrent("POST /timetable", "POST", "/timetable", json_body={
+            "course": "Benchmark Systems",
+            "time": "09:00-11:00",
+            "location": "Room QA075",
+            "day": "Monday",
+            "campus": "Greenwich"
+        }, params={"allow_clash": "true"})
+        # 300 classes running all day today, each scanned with its current signed code
+        run_id = uuid.uuid4().hex[:8]
+        today = datetime.now().strftime("%A")
+        courses = [f"Benchmark Systems {run_id} {i}" for i in range(300)]
+        self.session.post(f"{self.base_url}/timetable/import", headers={"Content-Type": "text/csv"},
+                          data="course,time,location,day,campus\n" + "".join(
+                              f"{course},00:00-23:59,Room QA075,{today},Greenwich\n" for course in courses))
+        sessions = [item for item in self.session.get(f"{self.base_url}/attendance/sessions").json()
+                    if item["course"] in courses]
+        codes = [self.session.get(f"{self.base_url}/attendance/sessions/{item['session_id']}/qr").json()["qr_code"]
+                 for item in sessions] or ["missing"]
+        self.run_concurrent("POST /attendance", "POST", "/attendance", json_body=lambda i: {
+            "class_name": "Benchmark Systems",
+            "qr_code": codes[i % len(codes)]
+        })
+        # A 300-seat lecture scanning in at once; repeats of one class are deduplicated
+        self.run_concurrent("POST /attendance (lecture burst)", "POST", "/attendance", json_body=lambda i: {
+            "class_name": "Benchmark Systems",
+            "qr_code": codes[i % len(codes)]
+        }, total=600, concurrency=300)
+
+    def benchmark_login_throughput(self):
+        """Login throughput (bcrypt verification) normalised per server core"""
+        result = self.run_concurrent("POST /auth/login", "POST", "/auth/login", json_body={
+            "username": BENCH_USERNAME,
+            "password": BENCH_PASSWORD
+        }, total=max(1, REQUESTS_PER_ROUTE // 10))
+        print(f"{'  per core':<28} {result['throughput'] / SERVER_CORES:>9.1f} logins/s/core "
+              f"({SERVER_CORES} cores)")
+        # Reads issued alongside a login storm should stay fast while bcrypt runs off-loop
+        with ThreadPoolExecutor(max_workers=1) as background:
+            storm = background.submit(self.run_concurrent, "POST /auth/login (storm)", "POST", "/auth/login",
+                                      {"username": BENCH_USERNAME, "password": BENCH_PASSWORD},
+                                      None, max(1, REQUESTS_PER_ROUTE // 10))
+            self.run_concurrent("GET /news during storm", "GET", "/news", total=REQUESTS_PER_ROUTE // 4,
+                                concurrency=max(1, CONCURRENCY // 5))
+            storm.result()
+
+    def time_async(self, name, make_call, iterations):
+        """Time `iterations` awaited calls produced by `make_call(i)`"""
+        async def measure():
+            latencies = []
+            started = time.perf_counter()
+            for i in range(iterations):
+                start = time.perf_counter()
+                await make_call(i)
+                latencies.append(time.perf_counter() - start)
+            return latencies, time.perf_counter() - started
+
+        latencies, elapsed = self.loop.run_until_complete(measure())
+        return self.log_result(name, latencies, 0, elapsed)
+
+    def benchmark_library_search(self):
+        """Library search modes over a synthetic catalogue (needs BENCH_MONGO_URL)"""
+        if not BENCH_MONGO_URL:
+            print("⏭️  Skipped: set BENCH_MONGO_URL to run in-process Mongo benchmarks")
+            return
+        import server
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        loop = self.loop
+        database = AsyncIOMotorClient(BENCH_MONGO_URL)[BENCH_DB_NAME]
+        library = server.LibraryRepository(database.library)
+        rng = random.Random(42)
+
+        async def build_catalogue():
+            if await library.count({}) >= LIBRARY_CATALOGUE_SIZE:
+                return
+            await database.library.drop()
+            batch = []
+            for n in range(LIBRARY_CATALOGUE_SIZE):
+                book = {
+                    "title": " ".join(rng.sample(WORDS, 3)).title(),
+                    "author": f"{rng.choice(WORDS).title()} {rng.choice(SURNAMES)}",
+                    "isbn": f"978-1-{n:06d}-00-{n % 10}",
+                    "available": rng.random() < 0.7,
+                    "location": f"Floor {rng.randint(1, 4)}",
+                    "campus": rng.choice(CAMPUSES),
+                    "created_at": datetime.utcnow()
+                }
+                batch.append({**book, **server.library_search_fields(book)})
+                if len(batch) == 10000:
+                    await library.insert_many(batch)
+                    batch = []
+            if batch:
+                await library.insert_many(batch)
+
+        print(f"Preparing {LIBRARY_CATALOGUE_SIZE} book catalogue in {BENCH_DB_NAME}...")
+        loop.run_until_complete(build_catalogue())
+        loop.run_until_complete(server.ensure_indexes(database))
+
+        iterations = 200
+        isbns = [server.normalize_isbn(f"978-1-{n:06d}-00-{n % 10}")
+                 for n in rng.sample(range(LIBRARY_CATALOGUE_SIZE), iterations)]
+        filters = server.library_filters("Medway", True)
+        results = [
+            self.time_async("library isbn exact", lambda i: library.find_by_isbn(isbns[i], {}, 50), iterations),
+            self.time_async("library text ranked", lambda i: library.search_text(
+                f"{WORDS[i % len(WORDS)]} {WORDS[(i * 7) % len(WORDS)]}", filters, 50), iterations),
+            self.time_async("library prefix autocomplete", lambda i: library.search_prefix(
+                WORDS[i % len(WORDS)][:4], {}, 10), iterations),
+        ]
+        for result in results:
+            verdict = "✅" if result["p99_ms"] < LIBRARY_TARGET_MS else "❌"
+            print(f"  {verdict} {result['benchmark']}: p99 {result['p99_ms']:.2f} ms (target < {LIBRARY_TARGET_MS} ms)")
+
+    def benchmark_mongo_calls_per_request(self):
+        """Mongo read operations per authenticated request, from serverStatus opcounters"""
+        if not BENCH_MONGO_URL:
+            print("⏭️  Skipped: set BENCH_MONGO_URL to the server's Mongo to count operations")
+            return
+        from pymongo import MongoClient
+
+        admin = MongoClient(BENCH_MONGO_URL).admin
+        requests_per_route = 200
+
+        def read_ops():
+            counters = admin.command("serverStatus")["opcounters"]
+            return counters["query"] + counters["getmore"]
+
+        for path in ["/auth/me", "/timetable", "/grades"]:
+            self.session.get(f"{self.base_url}{path}")  # warm the principal cache
+            before = read_ops()
+            for _ in range(requests_per_route):
+                self.session.get(f"{self.base_url}{path}")
+            per_request = (read_ops() - before) / requests_per_route
+            print(f"GET {path:<24} {per_request:>9.2f} Mongo reads/request")
+
+    def benchmark_mongo_bytes_per_request(self):
+        """Bytes Mongo sends per request (serverStatus network.bytesOut) and HTTP body bytes per request"""
+        if not BENCH_MONGO_URL:
+            print("⏭️  Skipped: set BENCH_MONGO_URL to the server's Mongo to measure wire bytes")
+            return
+        from pymongo import MongoClient
+
+        admin = MongoClient(BENCH_MONGO_URL).admin
+        requests_per_route = 200
+
+        def bytes_out():
+            return admin.command("serverStatus")["network"]["bytesOut"]
+
+        for method, path, body in [("POST", "/auth/login", {"username": BENCH_USERNAME, "password": BENCH_PASSWORD}),
+                                   ("GET", "/auth/me", None), ("GET", "/timetable", None),
+                                   ("GET", "/grades", None), ("GET", "/attendance", None),
+                                   ("GET", "/library", None)]:
+            self.session.request(method, f"{self.base_url}{path}", json=body)
+            response_bytes = 0
+            before = bytes_out()
+            for _ in range(requests_per_route):
+                response_bytes += len(self.session.request(method, f"{self.base_url}{path}", json=body).content)
+            # Each serverStatus reply is itself counted once in the delta
+            mongo_bytes = (bytes_out() - before) / requests_per_route
+            print(f"{method} {path:<23} {mongo_bytes:>9.0f} Mongo bytes/request  "
+                  f"{response_bytes / requests_per_route:>9.0f} response bytes/request")
+
+    def benchmark_auth_hot_path(self):
+        """In-process get_current_user throughput with and without a large revocation list"""
+        os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+        import server
+        from fastapi.security import HTTPAuthorizationCredentials
+
+        iterations = 20000
+        credentials = HTTPAuthorizationCredentials(
+            scheme="Bearer", credentials=server.create_access_token({"sub": BENCH_USERNAME}))
+        server.principal_cache.set(BENCH_USERNAME, server.UserPrincipal(
+            BENCH_USERNAME, f"{BENCH_USERNAME}@greenwich.ac.uk", "BENCH0001", "Computer Science", 2))
+
+        def run(label):
+            result = self.time_async(label, lambda i: server.get_current_user(credentials), iterations)
+            print(f"{'  throughput':<28} {result['throughput']:>9.0f} calls/s")
+
+        server.revocation_list.revoked.clear()
+        run("get_current_user (empty)")
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        for _ in range(100000):
+            server.revocation_list.add(os.urandom(16).hex(), expires_at)
+        run(f"get_current_user ({len(server.revocation_list)} revoked)")
+        server.revocation_list.revoked.clear()
+
+    def benchmark_chat_answer_cache(self):
+        """Latency of repeated FAQ questions: first ask reaches the LLM, repeats hit the answer cache"""
+        questions = [
+            ("Where is the Avery Hill library?", "Where's the Avery Hill library?"),
+            ("When does the spring term start?", "when does the spring term start"),
+            ("How do I reset my student portal password?", "How do I reset my student portal password"),
+        ]
+        run_id = uuid.uuid4().hex[:8]
+
+        def ask(message, i):
+            start = time.perf_counter()
+            response = self.session.post(f"{self.base_url}/chat", json={
+                "message": message, "session_id": f"bench_{run_id}_{i}"})
+            return time.perf_counter() - start, response.status_code < 400
+
+        def record(name, samples):
+            self.log_result(name, [latency for latency, _ in samples],
+                            sum(1 for _, ok in samples if not ok), sum(latency for latency, _ in samples))
+
+        record("POST /chat (cold)", [ask(question, i) for i, (question, _) in enumerate(questions)])
+        repeats = max(1, REQUESTS_PER_ROUTE // 100)
+        record("POST /chat (cached)", [ask(variant, len(questions) + i)
+                                       for i in range(repeats) for _, variant in questions])
+        stats = self.session.get(f"{self.base_url}/admin/cache-stats").json().get("chat_answers", {})
+        print(f"{'  answer cache hit rate':<28} {stats.get('hit_rate', 0.0):>9.1%}")
+
+    def benchmark_bulk_import(self):
+        """Rows per second through the CSV and NDJSON bulk import endpoints"""
+        rows = max(1, REQUESTS_PER_ROUTE * 20)
+        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+        timetable_csv = "course,time,location,day,campus\n" + "".join(
+            f"Module {i},09:00-11:00,Room QA{i % 500:03d},{days[i % 5]},{CAMPUSES[i % 3]}\n" for i in range(rows))
+        grades_ndjson = "".join(
+            json.dumps({"name": f"Module {i}", "grade": "B", "credits": 15}) + "\n" for i in range(rows))
+
+        for name, path, content_type, body in [
+            ("POST /timetable/import (csv)", "/timetable/import", "text/csv", timetable_csv),
+            ("POST /grades/import (ndjson)", "/grades/import", "application/x-ndjson", grades_ndjson),
+        ]:
+            start = time.perf_counter()
+            response = self.session.post(f"{self.base_url}{path}", data=body.encode(),
+                                         headers={"Content-Type": content_type})
+            elapsed = time.perf_counter() - start
+            result = response.json() if response.status_code < 400 else {"inserted": 0, "failed": rows}
+            self.log_result(name, [elapsed], result["failed"], elapsed)
+            print(f"{'  rows/s':<28} {result['inserted'] / elapsed:>9.0f} ({result['inserted']} rows)")
+
+    def benchmark_qr_validation(self):
+        """In-process QR code validations per second against a populated class session index"""
+        os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+        import server
+
+        iterations = 100000
+        today = server.timetable_now().strftime("%A")
+        for i in range(5000):
+            server.session_index.add({"course": f"Module {i}", "day": today, "time": "00:00-23:59",
+                                      "location": f"Room QA{i % 500:03d}", "campus": CAMPUSES[i % 3]})
+        session_ids = list(server.session_index.sessions)
+        codes = [server.issue_qr_code(session_id)[0] for session_id in session_ids]
+
+        started = time.perf_counter()
+        latencies = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            server.verify_qr_code(codes[i % len(codes)])
+            latencies.append(time.perf_counter() - start)
+        result = self.log_result("verify_qr_code", latencies, 0, time.perf_counter() - started)
+        print(f"{'  throughput':<28} {result['throughput']:>9.0f} validations/s "
+              f"({len(server.session_index)} sessions)")
+        server.session_index.sessions.clear()
+
+    def benchmark_serialization(self):
+        """In-process rendering of a large list response: per-item loop and jsonable_encoder vs orjson"""
+        os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+        import server
+        from bson import ObjectId
+        from fastapi.encoders import jsonable_encoder
+        from fastapi.responses import JSONResponse
+
+        started_at = datetime.utcnow()
+        documents = [{"_id": ObjectId(), "class_name": f"Module {i % 400}",
+                      "timestamp": started_at - timedelta(minutes=i)} for i in range(SERIALIZATION_ITEMS)]
+        iterations = 20
+
+        def render_standard(i):
+            items = [dict(document) for document in documents]
+            start = time.perf_counter()
+            for item in items:
+                item["_id"] = str(item["_id"])
+            JSONResponse(jsonable_encoder(items))
+            return time.perf_counter() - start
+
+        def render_fast(i):
+            start = time.perf_counter()
+            server.FastJSONResponse(documents)
+            return time.perf_counter() - start
+
+        results = []
+        for name, render in [("render loop+jsonable_encoder", render_standard), ("render FastJSONResponse", render_fast)]:
+            latencies = [render(i) for i in range(iterations)]
+            results.append(self.log_result(name, latencies, 0, sum(latencies)))
+        print(f"{'  speedup':<28} {results[0]['p50_ms'] / results[1]['p50_ms']:>9.1f}x "
+              f"({SERIALIZATION_ITEMS} items per response)")
+
+    def benchmark_metrics_overhead(self):
+        """In-process ASGI throughput of GET /api/auth/me with the metrics middleware on and off"""
+        os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+        import server
+
+        token = server.create_access_token({"sub": BENCH_USERNAME})
+        server.principal_cache.set(BENCH_USERNAME, server.UserPrincipal(
+            BENCH_USERNAME, f"{BENCH_USERNAME}@greenwich.ac.uk", "BENCH0001", "Computer Science", 2))
+        headers = [(b"authorization", f"Bearer {token}".encode())]
+        requests_per_round = 500
+        rounds = 100
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            pass
+
+        async def run_round():
+            started = time.perf_counter()
+            for _ in range(requests_per_round):
+                # The router writes the matched route into the scope, so each request needs its own
+                await server.app({"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+                                  "method": "GET", "scheme": "http", "path": "/api/auth/me", "raw_path": b"/api/auth/me",
+                                  "root_path": "", "query_string": b"", "headers": headers,
+                                  "client": ("127.0.0.1", 50000), "server": ("testserver", 80)}, receive, send)
+            return time.perf_counter() - started
+
+        def timed_round(enabled):
+            server.metrics.enabled = enabled
+            return self.loop.run_until_complete(run_round())
+
+        enabled = server.metrics.enabled
+        pairs = []
+        timed_round(True)  # warm up
+        # Short back-to-back rounds see the same machine state, and the median
+        # pair ignores rounds hit by a scheduler hiccup; collections are paused
+        # so their timing doesn't land on one side
+        gc.disable()
+        try:
+            for round_number in range(rounds):
+                order = (True, False) if round_number % 2 == 0 else (False, True)
+                timings = dict(zip(order, (timed_round(mode) for mode in order)))
+                pairs.append((timings[True], timings[False]))
+        finally:
+            gc.enable()
+            server.metrics.enabled = enabled
+
+        overhead = statistics.median(on / off for on, off in pairs) - 1
+        with_metrics = rounds * requests_per_round / sum(on for on, _ in pairs)
+        without_metrics = rounds * requests_per_round / sum(off for _, off in pairs)
+        verdict = "✅" if overhead < METRICS_OVERHEAD_TARGET else "❌"
+        print(f"{'GET /api/auth/me no metrics':<28} {without_metrics:>9.0f} req/s")
+        print(f"{'GET /api/auth/me metrics':<28} {with_metrics:>9.0f} req/s")
+        print(f"  {verdict} metrics overhead {overhead * 100:.2f}% (target < {METRICS_OVERHEAD_TARGET * 100:.0f}%)")
+
+    def benchmark_worker_scaling(self):
+        """Throughput of serve.py with 1..N pre-forked workers on GET /api/auth/me (needs BENCH_MONGO_URL)"""
+        if not BENCH_MONGO_URL:
+            print("⏭️  Skipped: set BENCH_MONGO_URL to launch serve.py against a scratch database")
+            return
+        base_url = f"http://127.0.0.1:{SCALING_PORT}/api"
+        env = {**os.environ, "PORT": str(SCALING_PORT), "MONGO_URL": BENCH_MONGO_URL, "MONGO_DB_NAME": BENCH_DB_NAME,
+               "JWT_SECRET": os.getenv("JWT_SECRET", "benchmark-secret"), "RATE_LIMIT_AUTH": "1000000/1", "RATE_LIMIT_AUTH_IP": "1000000/1"}
+        backend = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+        processes = SCALING_LOAD_PROCESSES
+
+        def login():
+            credentials = {"username": BENCH_USERNAME, "password": BENCH_PASSWORD}
+            deadline = time.monotonic() + 60
+            while time.monotonic() < deadline:
+                try:
+                    requests.post(f"{base_url}/auth/register", json={
+                        **credentials, "email": f"{BENCH_USERNAME}@greenwich.ac.uk", "student_id": "BENCH0001",
+                        "course": "Computer Science", "year": 2,
+                    })
+                    response = requests.post(f"{base_url}/auth/login", json=credentials)
+                    if response.status_code == 200:
+                        return response.json()["token"]
+                except requests.ConnectionError:
+                    pass
+                time.sleep(0.5)
+            raise RuntimeError("serve.py did not come up")
+
+        baseline = None
+        for workers in SCALING_WORKERS:
+            server = subprocess.Popen([sys.executable, "serve.py"], cwd=backend, env={**env, "WEB_CONCURRENCY": str(workers)},
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                token = login()
+                arguments = [[f"{base_url}/auth/me"] * processes, [token] * processes]
+                with ProcessPoolExecutor(processes) as pool:
+                    # Warm-up fills every worker's principal cache
+                    list(pool.map(hammer, *arguments, [1.0] * processes, [SCALING_CONNECTIONS] * processes))
+                    completed = sum(pool.map(hammer, *arguments, [SCALING_SECONDS] * processes,
+                                             [SCALING_CONNECTIONS] * processes))
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+            throughput = completed / SCALING_SECONDS
+            baseline = baseline or throughput
+            efficiency = throughput / (baseline * workers)
+            print(f"{f'serve.py {workers} worker(s)':<28} {throughput:>9.0f} req/s  {efficiency * 100:>5.1f}% of linear")
+        verdict = "✅" if efficiency >= SCALING_EFFICIENCY_TARGET else "❌"
+        print(f"  {verdict} {workers} workers at {efficiency * 100:.0f}% of linear scaling "
+              f"(target >= {SCALING_EFFICIENCY_TARGET * 100:.0f}%)")
+
+    def benchmark_attendance_analytics(self):
+        """Term-long attendance dashboards over synthetic daily rollups (needs BENCH_MONGO_URL)"""
+        if not BENCH_MONGO_URL:
+            print("⏭️  Skipped: set BENCH_MONGO_URL to run in-process Mongo benchmarks")
+            return
+        os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+        import numpy as np
+        import server
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        database = AsyncIOMotorClient(BENCH_MONGO_URL)[BENCH_DB_NAME]
+        server.timetable_repo.collection = database.timetable
+        server.attendance_rollups_repo.collection = database.attendance_daily
+        server.attendance_roster_repo.collection = database.attendance_roster
+        rng = np.random.default_rng(42)
+        days = server.analytics_days(server.timetable_now().date() - timedelta(days=ANALYTICS_TERM_DAYS - 1), None)
+        weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+        classes = [{"course": f"Module {i}", "day": weekdays[i % 5], "time": f"{9 + i % 8:02d}:00-{10 + i % 8:02d}:00",
+                    "location": f"Room QA{i % 500:03d}", "campus": CAMPUSES[i % 3]} for i in range(ANALYTICS_CLASSES)]
+        usernames = [f"student{n:06d}" for n in range(ANALYTICS_STUDENTS)]
+
+        async def build_term():
+            if await database.attendance_daily.count_documents({}) >= len(days):
+                return
+            for name in ("timetable", "attendance_daily", "attendance_roster"):
+                await database[name].drop()
+            batch = []
+            for n, username in enumerate(usernames):
+                for i in rng.choice(len(classes), 10, replace=False):
+                    batch.append({**classes[i], "username": username})
+                if len(batch) >= 10000:
+                    await database.timetable.insert_many(batch)
+                    batch = []
+            if batch:
+                await database.timetable.insert_many(batch)
+            await database.attendance_roster.insert_one({"_id": "students", "usernames": usernames})
+            sessions = [server.class_session(entry) for entry in classes]
+            for day in days:
+                on = [session.session_id for session in sessions if session.weekday == day.weekday()]
+                await database.attendance_daily.insert_one({
+                    "_id": day.isoformat(),
+                    "classes": {session_id: int(rng.integers(50, 100)) for session_id in on},
+                    "students": rng.integers(0, 3, len(usernames), dtype=np.uint16).tobytes(),
+                })
+
+        print(f"Preparing {len(days)}-day term for {ANALYTICS_STUDENTS} students in {BENCH_DB_NAME}...")
+        self.loop.run_until_complete(build_term())
+        iterations = 50
+        results = [
+            self.time_async("class rates per week (term)",
+                            lambda i: server.class_attendance_rates(days), iterations),
+            self.time_async("students below 70% (term)",
+                            lambda i: server.students_below(days, 0.7), iterations),
+        ]
+        for result in results:
+            verdict = "✅" if result["p50_ms"] < ANALYTICS_TARGET_MS else "❌"
+            print(f"  {verdict} {result['benchmark']}: p50 {result['p50_ms']:.2f} ms (target < {ANALYTICS_TARGET_MS} ms)")
+
+    def run_all_benchmarks(self):
+        """Run all benchmarks in sequence"""
+        print(f"🚀 Starting University of Greenwich App Backend Benchmarks")
+        print(f"📍 Benchmarking against: {self.base_url}")
+        print(f"⚙️  Concurrency: {CONCURRENCY}, requests per route: {REQUESTS_PER_ROUTE}")
+        print("=" * 60)
+
+        if not self.authenticate():
+            return False
+
+        print("\n📖 CONCURRENT READS")
+        self.benchmark_concurrent_reads()
+
+        print("\n🏠 DASHBOARD")
+        self.benchmark_dashboard()
+
+        print("\n✍️  CONCURRENT WRITES")
+        self.benchmark_concurrent_writes()
+
+        print("\n📥 BULK IMPORT")
+        self.benchmark_bulk_import()
+
+        print("\n🗄️  MONGO CALLS PER REQUEST")
+        self.benchmark_mongo_calls_per_request()
+        self.benchmark_mongo_bytes_per_request()
+
+        print("\n🧵 WORKER SCALING")
+        self.benchmark_worker_scaling()
+
+        print("\n📈 METRICS OVERHEAD")
+        self.benchmark_metrics_overhead()
+
+        print("\n🧾 RESPONSE SERIALIZATION")
+        self.benchmark_serialization()
+
+        print("\n📷 QR VALIDATION")
+        self.benchmark_qr_validation()
+
+        print("\n🛡️  AUTH HOT PATH")
+        self.benchmark_auth_hot_path()
+
+        print("\n💬 CHAT ANSWER CACHE")
+        self.benchmark_chat_answer_cache()
+
+        print("\n🔑 LOGIN THROUGHPUT")
+        self.benchmark_login_throughput()
+
+        print("\n🔎 LIBRARY SEARCH")
+        self.benchmark_library_search()
+
+        print("\n📊 ATTENDANCE ANALYTICS")
+        self.benchmark_attendance_analytics()
+
+        print("\n" + "=" * 60)
+        worst = max(self.results, key=lambda result: result["p99_ms"])
+        print(f"Worst p99: {worst['benchmark']} at {worst['p99_ms']:.2f} ms")
+        return all(result["errors"] == 0 for result in self.results)
+
+if __name__ == "__main__":
+    benchmark = UniversityAppBenchmark()
+    success = benchmark.run_all_benchmarks()
+    sys.exit(0 if success else 1)
@@ -6,6 +6,7 @@ Tests all API endpoints with proper authentication and data validation
 
 import requests
 import json
+import os
 import sys
 from datetime import datetime
 
@@ -13,6 +14,12 @@ from datetime import datetime
 BASE_URL = "https://uni-greenwich-hub.preview.emergentagent.com/api"
 TEST_USERNAME = "testuser"
 TEST_PASSWORD = "test123"
+# Must be listed in the server's QR_ISSUER_USERNAMES
+QR_ISSUER_USERNAME = os.getenv("QR_ISSUER_USERNAME", "lecturer")
+QR_ISSUER_PASSWORD = os.getenv("QR_ISSUER_PASSWORD", "lecturer123")
+# Must be listed in the server's STAFF_USERNAMES
+STAFF_USERNAME = os.getenv("STAFF_USERNAME", QR_ISSUER_USERNAME)
+STAFF_PASSWORD = os.getenv("STAFF_PASSWORD", QR_ISSUER_PASSWORD)
 
 class UniversityAppTester:
     def __init__(self):
@@ -36,6 +43,22 @@ class UniversityAppTester:
         if details and not success:
             print(f"   Details: {details}")
     
+    def login_headers(self, username, password):
+        """Register (if needed) and log in another account; returns its auth headers"""
+        self.session.post(f"{self.base_url}/auth/register", headers={"Authorization": None}, json={
+            "username": username,
+            "email": f"{username}@greenwich.ac.uk",
+            "password": password,
+            "student_id": "STAFF0001",
+            "course": "Staff",
+            "year": 1
+        })
+        response = self.session.post(f"{self.base_url}/auth/login", headers={"Authorization": None},
+                                     json={"username": username, "password": password})
+        if response.status_code != 200:
+            return None
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+    
     def test_user_registration(self):
         """Test user registration endpoint"""
         try:
@@ -120,6 +143,49 @@ class UniversityAppTester:
             self.log_result("Get Current User", False, f"Get user error: {str(e)}")
             return False
     
+    def test_token_refresh_and_logout(self):
+        """Test refresh token rotation and revocation on logout"""
+        try:
+            response = self.session.post(f"{self.base_url}/auth/login", json={
+                "username": TEST_USERNAME,
+                "password": TEST_PASSWORD
+            })
+            if response.status_code != 200 or "refresh_token" not in response.json():
+                self.log_result("Token Refresh", False, "Login did not return a refresh token", response.text)
+                return False
+            
+            tokens = response.json()
+            response = requests.post(f"{self.base_url}/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+            if response.status_code != 200:
+                self.log_result("Token Refresh", False, f"Refresh failed with status {response.status_code}", response.text)
+                return False
+            
+            rotated = response.json()
+            response = requests.post(f"{self.base_url}/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+            if response.status_code != 401:
+                self.log_result("Token Refresh", False, f"Reused refresh token was accepted with status {response.status_code}")
+                return False
+            self.log_result("Token Refresh", True, "Refresh token rotated and old one rejected")
+            
+            headers = {"Authorization": f"Bearer {rotated['token']}"}
+            response = requests.post(f"{self.base_url}/auth/logout", headers=headers,
+                                     json={"refresh_token": rotated["refresh_token"]})
+            if response.status_code != 200:
+                self.log_result("Logout", False, f"Logout failed with status {response.status_code}", response.text)
+                return False
+            
+            response = requests.get(f"{self.base_url}/auth/me", headers=headers)
+            if response.status_code == 401:
+                self.log_result("Logout", True, "Access token revoked after logout")
+                return True
+            else:
+                self.log_result("Logout", False, f"Revoked token still accepted with status {response.status_code}")
+                return False
+                
+        except Exception as e:
+            self.log_result("Token Refresh", False, f"Token refresh error: {str(e)}")
+            return False
+    
     def test_timetable_operations(self):
         """Test timetable GET and POST operations"""
         try:
@@ -145,7 +211,8 @@ class UniversityAppTester:
                 "campus": "Greenwich"
             }
             
-            response = self.session.post(f"{self.base_url}/timetable", json=new_class)
+            # Re-runs reuse the test account, so the class may already be on its timetable
+            response = self.session.post(f"{self.base_url}/timetable", json=new_class, params={"allow_clash": "true"})
             if response.status_code == 200:
                 data = response.json()
                 if "_id" in data and data["course"] == new_class["course"]:
@@ -224,6 +291,28 @@ class UniversityAppTester:
             search_results = response.json()
             self.log_result("Library Search (Query)", True, f"Found {len(search_results)} books matching '{search_query}'")
             
+            # Test ISBN exact match ignores hyphenation
+            response = self.session.get(f"{self.base_url}/library", params={"query": "9780123456789"})
+            if response.status_code != 200:
+                self.log_result("Library Search (ISBN)", False, f"ISBN search failed with status {response.status_code}", response.text)
+                return False
+            
+            isbn_results = response.json()
+            if all(book["isbn"].replace("-", "") == "9780123456789" for book in isbn_results):
+                self.log_result("Library Search (ISBN)", True, f"Found {len(isbn_results)} books by normalized ISBN")
+            else:
+                self.log_result("Library Search (ISBN)", False, "ISBN search returned non-matching books", isbn_results)
+                return False
+            
+            # Test prefix autocomplete
+            response = self.session.get(f"{self.base_url}/library/autocomplete", params={"prefix": "Comp"})
+            if response.status_code != 200:
+                self.log_result("Library Autocomplete", False, f"Autocomplete failed with status {response.status_code}", response.text)
+                return False
+            
+            suggestions = response.json()
+            self.log_result("Library Autocomplete", True, f"Got {len(suggestions)} suggestions for 'Comp'")
+            
             # Test adding a book (requires authentication)
             if self.token:
                 new_book = {
@@ -258,10 +347,54 @@ class UniversityAppTester:
                 self.log_result("QR Attendance", False, "No authentication token available")
                 return False
             
+            # Unsigned codes must be refused
+            response = self.session.post(f"{self.base_url}/attendance", json={
+                "class_name": "Advanced Software Engineering",
+                "qr_code": "QR_CODE_12345_LECTURE_HALL_A"
+            })
+            if response.status_code != 400:
+                self.log_result("QR Attendance Forged Code", False, f"Expected 400, got {response.status_code}", response.text)
+                return False
+            self.log_result("QR Attendance Forged Code", True, "Unsigned QR code rejected")
+            
+            # Add a class running all day today and display its current code; it
+            # overlaps anything else on today's timetable, so allow the clash
+            response = self.session.post(f"{self.base_url}/timetable", json={
+                "course": "Advanced Software Engineering",
+                "time": "00:00-23:59",
+                "location": "Lecture Hall A",
+                "day": datetime.now().strftime("%A"),
+                "campus": "Greenwich"
+            }, params={"allow_clash": "true"})
+            if response.status_code != 200:
+                self.log_result("QR Attendance Class", False, f"Adding today's class failed with status {response.status_code}", response.text)
+                return False
+            
+            # Students may not display codes; only the lecturer's account can
+            response = self.session.get(f"{self.base_url}/attendance/sessions")
+            if response.status_code != 403:
+                self.log_result("QR Attendance Issuer Only", False, f"Expected 403 for a student, got {response.status_code}", response.text)
+                return False
+            self.log_result("QR Attendance Issuer Only", True, "Students cannot display attendance codes")
+            issuer_headers = self.login_headers(QR_ISSUER_USERNAME, QR_ISSUER_PASSWORD)
+            if issuer_headers is None:
+                self.log_result("QR Attendance Issuer Login", False, f"Could not log in as {QR_ISSUER_USERNAME}")
+                return False
+            sessions = self.session.get(f"{self.base_url}/attendance/sessions", headers=issuer_headers).json()
+            session = next((item for item in sessions if item["course"] == "Advanced Software Engineering"), None)
+            if session is None:
+                self.log_result("QR Attendance Sessions", False, "Class not listed as active", sessions)
+                return False
+            response = self.session.get(f"{self.base_url}/attendance/sessions/{session['session_id']}/qr",
+                                        headers=issuer_headers)
+            if response.status_code != 200:
+                self.log_result("QR Attendance Code", False, f"Code issue failed with status {response.status_code}", response.text)
+                return False
+            
             # Test marking attendance
             attendance_data = {
                 "class_name": "Advanced Software Engineering",
-                "qr_code": "QR_CODE_12345_LECTURE_HALL_A"
+                "qr_code": response.json()["qr_code"]
             }
             
             response = self.session.post(f"{self.base_url}/attendance", json=attendance_data)
@@ -341,6 +474,15 @@ class UniversityAppTester:
                 self.log_result("News GET", False, f"Get news failed with status {response.status_code}", response.text)
                 return False
             
+            # Test conditional GET against the cached feed
+            etag = response.headers.get("ETag")
+            response = self.session.get(f"{self.base_url}/news", headers={"If-None-Match": etag or ""})
+            if etag and response.status_code == 304:
+                self.log_result("News ETag", True, "Unchanged feed answered with 304 Not Modified")
+            else:
+                self.log_result("News ETag", False, f"Expected 304 for matching ETag, got {response.status_code}", etag)
+                return False
+            
             # Test GET events (no auth required)
             response = self.session.get(f"{self.base_url}/events")
             if response.status_code == 200:
@@ -374,6 +516,80 @@ class UniversityAppTester:
             self.log_result("News Endpoints", False, f"News endpoints error: {str(e)}")
             return False
     
+    def test_pagination(self):
+        """Test keyset pagination and NDJSON streaming on list endpoints"""
+        try:
+            if not self.token:
+                self.log_result("Pagination", False, "No authentication token available")
+                return False
+            
+            # Walk attendance one record per page and compare with the streamed export
+            seen_ids = []
+            cursor = None
+            while True:
+                params = {"limit": 1}
+                if cursor:
+                    params["cursor"] = cursor
+                response = self.session.get(f"{self.base_url}/attendance", params=params)
+                if response.status_code != 200:
+                    self.log_result("Pagination", False, f"Paged GET failed with status {response.status_code}", response.text)
+                    return False
+                seen_ids.extend(item["_id"] for item in response.json())
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor or len(seen_ids) >= 20:
+                    break
+            
+            if len(seen_ids) != len(set(seen_ids)):
+                self.log_result("Pagination", False, "Duplicate records across pages", seen_ids)
+                return False
+            self.log_result("Pagination", True, f"Walked {len(seen_ids)} pages without duplicates")
+            
+            response = self.session.get(f"{self.base_url}/attendance", params={"format": "ndjson", "limit": len(seen_ids)})
+            if response.status_code != 200:
+                self.log_result("NDJSON Streaming", False, f"Streamed GET failed with status {response.status_code}", response.text)
+                return False
+            
+            streamed_ids = [json.loads(line)["_id"] for line in response.text.splitlines() if line]
+            if streamed_ids == seen_ids:
+                self.log_result("NDJSON Streaming", True, f"Streamed {len(streamed_ids)} records in page order")
+                return True
+            else:
+                self.log_result("NDJSON Streaming", False, "Streamed records differ from paged records", streamed_ids)
+                return False
+                
+        except Exception as e:
+            self.log_result("Pagination", False, f"Pagination error: {str(e)}")
+            return False
+    
+    def test_index_check(self):
+        """Test that every route's query is served by an index"""
+        try:
+            if not self.token:
+                self.log_result("Index Check", False, "No authentication token available")
+                return False
+            
+            response = self.session.get(f"{self.base_url}/admin/index-check")
+            if response.status_code != 403:
+                self.log_result("Index Check Staff Only", False, f"Expected 403 for a student, got {response.status_code}", response.text)
+                return False
+            staff_headers = self.login_headers(STAFF_USERNAME, STAFF_PASSWORD)
+            if staff_headers is None:
+                self.log_result("Index Check Staff Login", False, f"Could not log in as {STAFF_USERNAME}")
+                return False
+            
+            response = self.session.get(f"{self.base_url}/admin/index-check", headers=staff_headers)
+            if response.status_code == 200:
+                data = response.json()
+                self.log_result("Index Check", True, f"{len(data['queries'])} route queries use indexes")
+                return True
+            else:
+                self.log_result("Index Check", False, f"Index check failed with status {response.status_code}", response.text)
+                return False
+                
+        except Exception as e:
+            self.log_result("Index Check", False, f"Index check error: {str(e)}")
+            return False
+    
     def run_all_tests(self):
         """Run all backend tests in sequence"""
         print(f"🚀 Starting University of Greenwich App Backend Tests")
@@ -387,6 +603,7 @@ class UniversityAppTester:
         
         if login_success:
             self.test_get_current_user()
+            self.test_token_refresh_and_logout()
         
         # Core functionality tests
         print("\n📚 CORE FUNCTIONALITY TESTS")
@@ -396,6 +613,11 @@ class UniversityAppTester:
         self.test_qr_attendance()
         self.test_ai_chatbot()
         self.test_news_endpoints()
+        self.test_pagination()
+        
+        # Maintenance tests
+        print("\n🛠️  MAINTENANCE TESTS")
+        self.test_index_check()
         
         # Summary
         print("\n" + "=" * 60)
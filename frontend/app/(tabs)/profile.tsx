@@ -21,6 +21,12 @@ interface Grade {
   credits: number;
 }
 
+interface GradeSummary {
+  credits: number;
+  gpa: number | null;
+  classification: string | null;
+}
+
 interface AttendanceRecord {
   _id: string;
   class_name: string;
@@ -31,16 +37,19 @@ export default function Profile() {
   const router = useRouter();
   const { user, logout } = useAuthStore();
   const [grades, setGrades] = useState<Grade[]>([]);
+  const [summary, setSummary] = useState<GradeSummary | null>(null);
   const [attendance, setAttendance] = useState<AttendanceRecord[]>([]);
   const [loading, setLoading] = useState(true);
 
   const fetchData = async () => {
     try {
-      const [gradesRes, attendanceRes] = await Promise.all([
+      const [gradesRes, summaryRes, attendanceRes] = await Promise.all([
         api.get('/grades'),
+        api.get('/grades/summary'),
         api.get('/attendance'),
       ]);
       setGrades(gradesRes.data);
+      setSummary(summaryRes.data);
       setAttendance(attendanceRes.data);
     } catch (error) {
       console.error('Error fetching profile data:', error);
@@ -67,25 +76,8 @@ export default function Profile() {
     ]);
   };
 
-  const calculateGPA = () => {
-    if (grades.length === 0) return 'N/A';
-    const gradePoints: { [key: string]: number } = {
-      'A+': 4.0, 'A': 4.0, 'A-': 3.7,
-      'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-      'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-      'D': 1.0, 'F': 0.0
-    };
-    
-    let totalPoints = 0;
-    let totalCredits = 0;
-    
-    grades.forEach(grade => {
-      const points = gradePoints[grade.grade] || 0;
-      totalPoints += points * grade.credits;
-      totalCredits += grade.credits;
-    });
-    
-    return totalCredits > 0 ? (totalPoints / totalCredits).toFixed(2) : 'N/A';
+  const formatGPA = () => {
+    return summary?.gpa != null ? summary.gpa.toFixed(2) : 'N/A';
   };
 
   return (
@@ -120,7 +112,10 @@ export default function Profile() {
         <Text style={styles.sectionTitle}>Academic Performance</Text>
         <View style={styles.gpaCard}>
           <Text style={styles.gpaLabel}>GPA</Text>
-          <Text style={styles.gpaValue}>{calculateGPA()}</Text>
+          <Text style={styles.gpaValue}>{formatGPA()}</Text>
+          {summary?.classification && (
+            <Text style={styles.gpaLabel}>{summary.classification}</Text>
+          )}
         </View>
         
         {loading ? (
@@ -32,7 +32,7 @@ export default function Login() {
     setLoading(true);
     try {
       const response = await api.post('/auth/login', { username, password });
-      await setAuth(response.data.token, response.data.user);
+      await setAuth(response.data.token, response.data.user, response.data.refresh_token);
       router.replace('/(tabs)');
     } catch (error: any) {
       Alert.alert('Error', error.response?.data?.detail || 'Login failed');
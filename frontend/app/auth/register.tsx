@@ -43,7 +43,7 @@ export default function Register() {
         course,
         year: parseInt(year),
       });
-      await setAuth(response.data.token, response.data.user);
+      await setAuth(response.data.token, response.data.user, response.data.refresh_token);
       router.replace('/(tabs)');
     } catch (error: any) {
       Alert.alert('Error', error.response?.data?.detail || 'Registration failed');
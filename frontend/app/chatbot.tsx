@@ -13,7 +13,7 @@ import {
 } from 'react-native';
 import { useRouter } from 'expo-router';
 import { Ionicons } from '@expo/vector-icons';
-import api from '../src/utils/api';
+import { streamChat } from '../src/utils/api';
 import Colors from '../src/constants/Colors';
 
 interface Message {
@@ -57,29 +57,32 @@ export default function Chatbot() {
     setInputText('');
     setLoading(true);
 
+    const aiMessageId = (Date.now() + 1).toString();
+    let started = false;
+
     try {
-      const response = await api.post('/chat', {
-        message: userMessage.text,
-        session_id: sessionId,
+      // Show the reply as it streams in instead of waiting for the whole completion
+      await streamChat({ message: userMessage.text, session_id: sessionId }, (text) => {
+        if (!started) {
+          started = true;
+          setMessages(prev => [...prev, { id: aiMessageId, text, isUser: false, timestamp: new Date() }]);
+        } else {
+          setMessages(prev => prev.map(message =>
+            message.id === aiMessageId ? { ...message, text: message.text + text } : message
+          ));
+        }
+        scrollViewRef.current?.scrollToEnd({ animated: false });
       });
-
-      const aiMessage: Message = {
-        id: (Date.now() + 1).toString(),
-        text: response.data.response,
-        isUser: false,
-        timestamp: new Date(),
-      };
-
-      setMessages(prev => [...prev, aiMessage]);
       
       // Scroll to bottom
       setTimeout(() => {
         scrollViewRef.current?.scrollToEnd({ animated: true });
       }, 100);
     } catch (error: any) {
+      setMessages(prev => prev.filter(message => message.id !== aiMessageId));
       Alert.alert(
         'Error',
-        error.response?.data?.detail || 'Failed to get response from AI'
+        error.message || 'Failed to get response from AI'
       );
     } finally {
       setLoading(false);
@@ -138,7 +141,7 @@ export default function Chatbot() {
             </Text>
           </View>
         ))}
-        {loading && (
+        {loading && messages[messages.length - 1]?.isUser && (
           <View style={[styles.messageBubble, styles.aiBubble]}>
             <ActivityIndicator size="small" color={Colors.primary} />
           </View>
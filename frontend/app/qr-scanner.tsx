@@ -33,7 +33,7 @@ export default function QRScanner() {
     setLoading(true);
 
     try {
-      // Assuming QR code data is in format: "CLASS_NAME"
+      // QR codes carry a signed, rotating session code; the server resolves the class
       await api.post('/attendance', {
         class_name: data,
         qr_code: data,
@@ -1,5 +1,6 @@
 import { create } from 'zustand';
 import AsyncStorage from '@react-native-async-storage/async-storage';
+import api from '../utils/api';
 
 interface User {
   username: string;
@@ -13,7 +14,7 @@ interface AuthState {
   token: string | null;
   user: User | null;
   isLoading: boolean;
-  setAuth: (token: string, user: User) => Promise<void>;
+  setAuth: (token: string, user: User, refreshToken?: string) => Promise<void>;
   logout: () => Promise<void>;
   loadAuth: () => Promise<void>;
 }
@@ -23,14 +24,25 @@ export const useAuthStore = create<AuthState>((set) => ({
   user: null,
   isLoading: true,
   
-  setAuth: async (token, user) => {
+  setAuth: async (token, user, refreshToken) => {
     await AsyncStorage.setItem('token', token);
+    if (refreshToken) {
+      await AsyncStorage.setItem('refresh_token', refreshToken);
+    }
     await AsyncStorage.setItem('user', JSON.stringify(user));
     set({ token, user, isLoading: false });
   },
   
   logout: async () => {
+    // Revoke both tokens server-side so a copied token stops working; sign out locally even if offline
+    try {
+      const refreshToken = await AsyncStorage.getItem('refresh_token');
+      await api.post('/auth/logout', { refresh_token: refreshToken });
+    } catch (error) {
+      console.error('Error logging out:', error);
+    }
     await AsyncStorage.removeItem('token');
+    await AsyncStorage.removeItem('refresh_token');
     await AsyncStorage.removeItem('user');
     set({ token: null, user: null });
   },
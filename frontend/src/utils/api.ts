@@ -22,4 +22,118 @@ api.interceptors.request.use(
   (error) => Promise.reject(error)
 );
 
+// Access tokens are short-lived: on a 401, swap the refresh token for a new pair and retry once
+let refreshing: Promise<string | null> | null = null;
+
+const refreshAccessToken = async (): Promise<string | null> => {
+  const refreshToken = await AsyncStorage.getItem('refresh_token');
+  if (!refreshToken) {
+    return null;
+  }
+  try {
+    const response = await axios.post(`${API_URL}/api/auth/refresh`, { refresh_token: refreshToken });
+    await AsyncStorage.setItem('token', response.data.token);
+    await AsyncStorage.setItem('refresh_token', response.data.refresh_token);
+    return response.data.token;
+  } catch (error) {
+    await AsyncStorage.removeItem('refresh_token');
+    return null;
+  }
+};
+
+// Concurrent 401s share one refresh
+const refreshOnce = (): Promise<string | null> => {
+  refreshing = refreshing || refreshAccessToken().finally(() => { refreshing = null; });
+  return refreshing;
+};
+
+api.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const original = error.config;
+    if (error.response?.status !== 401 || !original || original._retried || original.url?.startsWith('/auth/')) {
+      return Promise.reject(error);
+    }
+    original._retried = true;
+    const token = await refreshOnce();
+    if (!token) {
+      return Promise.reject(error);
+    }
+    original.headers.Authorization = `Bearer ${token}`;
+    return api(original);
+  }
+);
+
+type ChatReply = { response: string; session_id: string };
+
+// Server-Sent Events over XHR: React Native's fetch can't read a response body incrementally.
+// XHR bypasses the axios interceptors, so a 401 is refreshed and retried here.
+export const streamChat = async (
+  body: { message: string; session_id: string },
+  onToken: (text: string) => void
+): Promise<ChatReply> => {
+  try {
+    return await openChatStream(body, await AsyncStorage.getItem('token'), onToken);
+  } catch (error) {
+    if ((error as { status?: number }).status !== 401) {
+      throw error;
+    }
+    const token = await refreshOnce();
+    if (!token) {
+      throw error;
+    }
+    return openChatStream(body, token, onToken);
+  }
+};
+
+const openChatStream = (
+  body: { message: string; session_id: string },
+  token: string | null,
+  onToken: (text: string) => void
+): Promise<ChatReply> =>
+  new Promise((resolve, reject) => {
+    const xhr = new XMLHttpRequest();
+    let seen = 0;
+    let buffer = '';
+    let done: ChatReply | null = null;
+    let errorDetail: string | null = null;
+
+    const consume = () => {
+      buffer += xhr.responseText.slice(seen);
+      seen = xhr.responseText.length;
+      const blocks = buffer.split('\n\n');
+      buffer = blocks.pop() || '';
+      for (const block of blocks) {
+        const lines = block.split('\n');
+        const event = lines.find((line) => line.startsWith('event: '))?.slice(7);
+        const data = lines.find((line) => line.startsWith('data: '))?.slice(6);
+        if (!event || !data) continue;
+        const payload = JSON.parse(data);
+        if (event === 'token') onToken(payload.text);
+        else if (event === 'done') done = payload;
+        else if (event === 'error') errorDetail = payload.detail;
+      }
+    };
+
+    xhr.open('POST', `${API_URL}/api/chat/stream`);
+    xhr.setRequestHeader('Content-Type', 'application/json');
+    xhr.setRequestHeader('Accept', 'text/event-stream');
+    if (token) {
+      xhr.setRequestHeader('Authorization', `Bearer ${token}`);
+    }
+    xhr.onprogress = consume;
+    xhr.onload = () => {
+      consume();
+      if (xhr.status >= 400) {
+        reject(Object.assign(new Error(`Chat failed with status ${xhr.status}`), { status: xhr.status }));
+      } else if (done) {
+        resolve(done);
+      } else {
+        reject(new Error(errorDetail || 'Chat stream ended unexpectedly'));
+      }
+    };
+    xhr.onerror = () => reject(new Error('Network error'));
+    xhr.send(JSON.stringify(body));
+  });
+
 export default api;
\ No newline at end of file
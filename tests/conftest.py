@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+
+import mongomock_motor
+import motor.motor_asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+# In-memory stand-in for the Mongo server; must be in place before server creates its client
+motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager: startup hooks (index builds, revocation
+    # sync) need a real Mongo server and are exercised by backend_test.py instead
+    return TestClient(server.app)
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    yield
+    asyncio.run(server.mongo.client.drop_database(server.MONGO_DB_NAME))
+    server.principal_cache.clear()
+    server.feed_cache.local.clear()
+    server.chat_sessions.sessions.clear()
+    server.attendance_buffer.pending.clear()
+    server.attendance_buffer.recent.clear()
+    server.session_index.sessions.clear()
+    server.student_roster.columns.clear()
+    server.analytics_cache.clear()
+    server.answer_cache.clear()
+    server.schedule_index.cache.clear()
+    server.revocation_list.revoked.clear()
+    server.rate_limiter.store.buckets.clear()
+    server.metrics.requests.clear()
+    server.metrics.started = 0
+    server.metrics.dependencies.clear()
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post("/api/auth/register", json={
+        "username": "teststudent",
+        "email": "teststudent@greenwich.ac.uk",
+        "password": "test123",
+        "student_id": "STU000001",
+        "course": "Computer Science",
+        "year": 2,
+    })
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['token']}"}
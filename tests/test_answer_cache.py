@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+class CountingLlm:
+    calls = 0
+
+    def __init__(self, session_id, initial_messages):
+        self.initial_messages = initial_messages
+
+    async def send_message(self, message):
+        CountingLlm.calls += 1
+        return f"Answer to: {message}"
+
+
+@pytest.fixture(autouse=True)
+def counting_llm(monkeypatch):
+    CountingLlm.calls = 0
+    monkeypatch.setattr(server.chat_sessions, "client_factory", CountingLlm)
+
+
+def ask(username, session_id, message):
+    return asyncio.run(server.chat_sessions.send(username, session_id, message))
+
+
+def test_rephrased_standalone_question_is_served_from_cache():
+    first = ask("alice", "s1", "Where is the Avery Hill library?")
+    exact = ask("bob", "s2", "where is the avery hill library")
+    similar = ask("carol", "s3", "Where's the Avery Hill library?")
+
+    assert first == exact == similar
+    assert CountingLlm.calls == 1
+    stats = server.answer_cache.stats()
+    assert (stats["exact_hits"], stats["similar_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_unrelated_question_misses():
+    ask("alice", "s1", "Where is the Avery Hill library?")
+    ask("bob", "s2", "When does the spring term start?")
+
+    assert CountingLlm.calls == 2
+
+
+def test_follow_up_questions_bypass_cache():
+    ask("alice", "s1", "Where is the Avery Hill library?")
+    ask("alice", "s1", "What are its opening hours?")
+    ask("bob", "s2", "Where is the Avery Hill library?")
+    ask("bob", "s2", "What are its opening hours?")
+
+    # Only bob's first question is answered from cache; follow-ups depend on context
+    assert CountingLlm.calls == 3
+
+
+def test_cached_turn_is_kept_as_context():
+    ask("alice", "s1", "Where is the Avery Hill library?")
+    ask("bob", "s2", "Where is the Avery Hill library?")
+    ask("bob", "s2", "What are its opening hours?")
+
+    session = server.chat_sessions.get("bob", "s2")
+    assert session.client.initial_messages[1:3] == [
+        {"role": "user", "content": "Where is the Avery Hill library?"},
+        {"role": "assistant", "content": "Answer to: Where is the Avery Hill library?"},
+    ]
+
+
+def test_entries_expire():
+    cache = server.AnswerCache(max_entries=4, ttl=-1, similarity=0.9)
+    cache.put("Where is the Avery Hill library?", "answer")
+
+    assert cache.get("Where is the Avery Hill library?") is None
+    assert cache.get("Where's the Avery Hill library?") is None
+
+
+def test_near_miss_questions_are_not_served_each_others_answers():
+    cache = server.AnswerCache(max_entries=4, ttl=60, similarity=0.9)
+    cache.put("What time does the library open on Monday?", "8am")
+    cache.put("Where is the Avery Hill library?", "Southwood site")
+
+    sunday = cache.embed(cache.normalize("What time does the library open on Sunday?"))
+    assert float(cache.vectors[0] @ sunday) >= cache.similarity
+    assert cache.get("What time does the library open on Sunday?") is None
+    assert cache.get("Where is the Medway library?") is None
+    assert cache.get("What time does the library open on Monday") == "8am"
+    assert cache.get("Please tell me where the Avery Hill library is") is None
+    assert cache.get("Where's the Avery Hill library?") == "Southwood site"
+
+
+def test_cache_stats_are_staff_only(client, auth_headers, monkeypatch):
+    assert client.get("/api/admin/cache-stats", headers=auth_headers).status_code == 403
+    monkeypatch.setattr(server, "STAFF_USERNAMES", {"teststudent"})
+    response = client.get("/api/admin/cache-stats", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert set(response.json()) == {"feeds", "chat_sessions", "chat_answers"}
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import server
+
+# Monday 5 and Monday 12 October 2026
+WEEK_ONE = date(2026, 10, 5)
+WEEK_TWO = date(2026, 10, 12)
+LECTURE = {"course": "Software Engineering", "day": "Monday", "time": "09:00-11:00",
+           "location": "Room QA080", "campus": "Greenwich"}
+SEMINAR = {"course": "Databases", "day": "Wednesday", "time": "14:00-16:00",
+           "location": "Room QM065", "campus": "Avery Hill"}
+
+
+@pytest.fixture
+def staff_headers(auth_headers, monkeypatch):
+    monkeypatch.setattr(server, "STAFF_USERNAMES", {"teststudent"})
+    return auth_headers
+
+
+@pytest.fixture(autouse=True)
+def term(monkeypatch):
+    # Pin "today" to the Sunday ending week two
+    monkeypatch.setattr(server, "timetable_now", lambda: datetime(2026, 10, 18, 12, 0, tzinfo=server.TIMETABLE_TIMEZONE))
+    enrolment = [("alice", LECTURE), ("bob", LECTURE), ("carol", LECTURE), ("alice", SEMINAR), ("bob", SEMINAR)]
+    asyncio.run(server.timetable_repo.insert_many([{**entry, "username": username} for username, entry in enrolment]))
+
+
+def attend(username, entry, day):
+    session = server.class_session(entry)
+    asyncio.run(server.attendance_repo.insert_one({
+        "username": username, "class_name": entry["course"], "qr_code": "code",
+        "session": f"{session.session_id}:{day.isoformat()}",
+        "timestamp": datetime.combine(day, datetime.min.time()) + timedelta(hours=9, minutes=5),
+    }))
+
+
+def roll_up(*days):
+    for day in days:
+        asyncio.run(server.roll_up_attendance(day))
+
+
+def test_class_rates_per_week(client, staff_headers):
+    attend("alice", LECTURE, WEEK_ONE)
+    attend("bob", LECTURE, WEEK_ONE)
+    attend("carol", LECTURE, WEEK_ONE)
+    attend("alice", LECTURE, WEEK_TWO)
+    attend("alice", SEMINAR, WEEK_ONE + timedelta(days=2))
+    roll_up(WEEK_ONE, WEEK_ONE + timedelta(days=2), WEEK_TWO)
+
+    response = client.get("/api/analytics/attendance/classes", headers=staff_headers,
+                          params={"start": WEEK_ONE.isoformat(), "end": "2026-10-18"})
+
+    rates = {(item["course"], week["week"]): (week["attended"], item["enrolled"], week["rate"])
+             for item in response.json() for week in item["weeks"]}
+    assert rates == {
+        ("Software Engineering", "2026-10-05"): (3, 3, 1.0),
+        ("Software Engineering", "2026-10-12"): (1, 3, 0.3333),
+        ("Databases", "2026-10-05"): (1, 2, 0.5),
+        ("Databases", "2026-10-12"): (0, 2, 0.0),
+    }
+
+
+def test_students_below_threshold(client, staff_headers):
+    for day in (WEEK_ONE, WEEK_TWO):
+        attend("alice", LECTURE, day)
+        attend("alice", SEMINAR, day + timedelta(days=2))
+        attend("bob", LECTURE, day)
+    attend("carol", LECTURE, WEEK_TWO)
+    roll_up(WEEK_ONE, WEEK_ONE + timedelta(days=2), WEEK_TWO, WEEK_TWO + timedelta(days=2))
+
+    response = client.get("/api/analytics/attendance/students", headers=staff_headers,
+                          params={"start": WEEK_ONE.isoformat(), "end": "2026-10-18", "below": 0.7})
+
+    assert response.json() == [
+        {"username": "bob", "attended": 2, "expected": 4, "rate": 0.5},
+        {"username": "carol", "attended": 1, "expected": 2, "rate": 0.5},
+    ]
+
+
+def test_rollup_rerun_replaces_the_day():
+    attend("alice", LECTURE, WEEK_ONE)
+    roll_up(WEEK_ONE)
+    roll_up(WEEK_ONE)
+
+    rollups = asyncio.run(server.attendance_rollups_repo.find({}, None))
+    assert [list(rollup["classes"].values()) for rollup in rollups] == [[1]]
+    assert asyncio.run(server.attendance_roster_repo.find_one({"_id": "students"}, None))["usernames"] == ["alice"]
+
+
+def test_only_one_worker_holds_the_rollup_lease():
+    def acquire(owner, seconds=60):
+        return asyncio.run(server.leases_repo.acquire("attendance_rollup", owner, seconds))
+
+    assert acquire("worker-1")
+    assert not acquire("worker-2")
+    assert acquire("worker-1", seconds=-1)
+    # The holder stopped renewing, so another worker takes over
+    assert acquire("worker-2")
+    assert not acquire("worker-1")
+
+
+def test_rollup_endpoint_and_staff_only(client, auth_headers, monkeypatch):
+    assert client.get("/api/analytics/attendance/classes", headers=auth_headers).status_code == 403
+
+    monkeypatch.setattr(server, "STAFF_USERNAMES", {"teststudent"})
+    attend("alice", LECTURE, WEEK_TWO)
+    response = client.post("/api/admin/attendance-rollups", headers=auth_headers,
+                           params={"start": WEEK_ONE.isoformat(), "end": WEEK_TWO.isoformat()})
+
+    assert response.json() == {"days": 8}
+    assert asyncio.run(server.attendance_rollups_repo.count({})) == 8
+
+
+def test_range_is_validated(client, staff_headers):
+    response = client.get("/api/analytics/attendance/students", headers=staff_headers,
+                          params={"start": "2026-10-18", "end": "2026-10-01"})
+
+    assert response.status_code == 400
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+class FailingRepository:
+    async def record_scans(self, records):
+        raise ConnectionError("mongo unavailable")
+
+
+def scan(client, auth_headers, course, at=None):
+    # Registers an all-day class for today and scans its current code
+    session = server.session_index.add({"course": course, "day": server.timetable_now().strftime("%A"),
+                                        "time": "00:00-23:59", "location": "Room QA080", "campus": "Greenwich"})
+    qr_code, _ = server.issue_qr_code(session.session_id, at)
+    return client.post("/api/attendance", headers=auth_headers, json={"class_name": course, "qr_code": qr_code})
+
+
+def record(session, username="a"):
+    return {"_id": server.ObjectId(), "username": username, "qr_code": "code", "session": session,
+            "class_name": "X", "timestamp": server.datetime.utcnow()}
+
+
+def attendance(client, auth_headers):
+    return client.get("/api/attendance", headers=auth_headers).json()
+
+
+def test_scan_is_acknowledged_before_it_is_written(client, auth_headers):
+    response = scan(client, auth_headers, "Databases")
+
+    assert response.json()["message"] == "Attendance marked successfully"
+    assert attendance(client, auth_headers) == []
+    assert asyncio.run(server.attendance_buffer.flush()) == 1
+    assert [item["_id"] for item in attendance(client, auth_headers)] == [response.json()["record"]["_id"]]
+
+
+def test_repeated_scans_are_deduplicated(client, auth_headers):
+    first = scan(client, auth_headers, "Databases").json()
+    # The code has rotated since, but it is the same class meeting
+    repeat = scan(client, auth_headers, "Databases", at=server.time.time() - server.QR_WINDOW_SECONDS).json()
+    scan(client, auth_headers, "Networks")
+
+    assert repeat["message"] == "Attendance already marked"
+    assert repeat["record"] == first["record"]
+    asyncio.run(server.attendance_buffer.flush())
+    assert sorted(item["class_name"] for item in attendance(client, auth_headers)) == ["Databases", "Networks"]
+
+
+def test_replayed_scans_are_not_written_twice(client, auth_headers):
+    scan(client, auth_headers, "Databases")
+    asyncio.run(server.attendance_buffer.flush())
+    server.attendance_buffer.recent.clear()
+
+    scan(client, auth_headers, "Databases")
+    asyncio.run(server.attendance_buffer.flush())
+
+    assert len(attendance(client, auth_headers)) == 1
+
+
+def test_flush_is_due_once_batch_is_full(monkeypatch, client, auth_headers):
+    monkeypatch.setattr(server.attendance_buffer, "flush_size", 2)
+    server.attendance_buffer.due.clear()
+
+    scan(client, auth_headers, "Databases")
+    assert not server.attendance_buffer.due.is_set()
+    scan(client, auth_headers, "Networks")
+    assert server.attendance_buffer.due.is_set()
+
+
+def test_failed_flush_keeps_scans_pending():
+    buffer = server.AttendanceBuffer(FailingRepository(), 10, 1)
+    buffer.add(record("s1"))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(buffer.flush())
+    assert len(buffer.pending) == 1
+
+
+def test_spool_survives_a_crash(tmp_path):
+    spool_path = str(tmp_path / "attendance.spool")
+    crashed = server.AttendanceBuffer(FailingRepository(), 10, 1, spool_path)
+    crashed.open()
+    for session in ["s1", "s2"]:
+        crashed.add(record(session))
+    crashed.spool.write('{"_id": "torn')
+    crashed.spool.flush()
+
+    restarted = server.AttendanceBuffer(server.attendance_repo, 10, 1, spool_path)
+    assert restarted.open() == 2
+    assert asyncio.run(restarted.flush()) == 2
+    assert asyncio.run(server.attendance_repo.count({"username": "a"})) == 2
+    with open(spool_path) as spool:
+        assert spool.read() == ""
+    asyncio.run(restarted.drain())
+
+
+class SlowRepository:
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.written = []
+
+    async def record_scans(self, records):
+        self.started.set()
+        await asyncio.sleep(0.05)
+        self.written.extend(records)
+        return len(records)
+
+
+def test_shutdown_mid_flush_still_writes_the_batch(monkeypatch):
+    repo = SlowRepository()
+    buffer = server.AttendanceBuffer(repo, 1, 60)
+    monkeypatch.setattr(server, "attendance_buffer", buffer)
+
+    async def shut_down_during_flush():
+        server.app.state.attendance_flush_task = asyncio.create_task(buffer.run())
+        buffer.add(record("s1"))
+        await repo.started.wait()
+        await server.drain_attendance_buffer()
+
+    asyncio.run(shut_down_during_flush())
+
+    assert [item["session"] for item in repo.written] == ["s1"]
+    assert buffer.pending == []
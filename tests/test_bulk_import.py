@@ -0,0 +1,77 @@
+import json
+
+import server
+
+CSV_HEADERS = {"Content-Type": "text/csv"}
+NDJSON_HEADERS = {"Content-Type": "application/x-ndjson"}
+
+
+def test_csv_timetable_import(client, auth_headers):
+    body = (
+        "course,time,location,day,campus\n"
+        "Software Engineering,09:00-11:00,Room QA080,Monday,Greenwich\n"
+        "\"Databases, Advanced\",14:00-16:00,Room QM065,Tuesday,Avery Hill\n"
+    )
+    response = client.post("/api/timetable/import", headers={**auth_headers, **CSV_HEADERS}, content=body)
+
+    assert response.json() == {"inserted": 2, "failed": 0, "errors": []}
+    courses = [item["course"] for item in client.get("/api/timetable", headers=auth_headers).json()]
+    assert sorted(courses) == ["Databases, Advanced", "Software Engineering"]
+
+
+def test_ndjson_grade_import_reports_row_errors(client, auth_headers):
+    rows = [
+        {"name": "Algorithms", "grade": "A", "credits": 15},
+        {"name": "Networks", "grade": "B"},
+        "not an object",
+        {"name": "Security", "grade": "A-", "credits": "thirty"},
+        {"name": "AI", "grade": "B+", "credits": 30},
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\n{broken"
+    response = client.post("/api/grades/import", headers={**auth_headers, **NDJSON_HEADERS}, content=body)
+
+    result = response.json()
+    assert (result["inserted"], result["failed"]) == (2, 4)
+    assert [error["row"] for error in result["errors"]] == [2, 3, 4, 6]
+    assert "credits" in result["errors"][0]["error"]
+    names = {item["name"] for item in client.get("/api/grades", headers=auth_headers).json()}
+    assert names == {"Algorithms", "AI"}
+
+
+def test_non_utf8_row_is_a_row_error(client, auth_headers):
+    body = (
+        "course,time,location,day,campus\n".encode()
+        + "Caf\xe9 Culture,09:00-11:00,Room QA080,Monday,Greenwich\n".encode("latin-1")
+        + "Software Engineering,14:00-16:00,Room QM065,Tuesday,Greenwich\n".encode()
+    )
+    response = client.post("/api/timetable/import", headers={**auth_headers, **CSV_HEADERS}, content=body)
+
+    assert response.status_code == 200
+    assert response.json() == {"inserted": 1, "failed": 1, "errors": [{"row": 1, "error": "not valid UTF-8 (byte 4)"}]}
+
+
+def test_import_writes_in_chunks(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, "IMPORT_CHUNK_SIZE", 3)
+    body = "".join(json.dumps({"name": f"Module {i}", "grade": "B", "credits": 15}) + "\n" for i in range(10))
+
+    response = client.post("/api/grades/import", headers={**auth_headers, **NDJSON_HEADERS}, content=body)
+
+    assert response.json()["inserted"] == 10
+
+
+def test_rows_for_other_users_need_import_admin(client, auth_headers, monkeypatch):
+    body = json.dumps({"username": "someoneelse", "name": "Algorithms", "grade": "A", "credits": 15})
+
+    response = client.post("/api/grades/import", headers={**auth_headers, **NDJSON_HEADERS}, content=body)
+    assert response.json()["errors"] == [{"row": 1, "error": "not permitted to import rows for another user"}]
+
+    monkeypatch.setattr(server, "IMPORT_ADMIN_USERNAMES", {"teststudent"})
+    response = client.post("/api/grades/import", headers={**auth_headers, **NDJSON_HEADERS}, content=body)
+    assert response.json()["inserted"] == 1
+
+
+def test_unsupported_content_type(client, auth_headers):
+    response = client.post("/api/grades/import", headers={**auth_headers, "Content-Type": "text/plain"},
+                           content="name,grade,credits")
+
+    assert response.status_code == 415
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+TOKEN_DELAY = 0.05
+
+
+class FakeStreamingLlm:
+    # Local stand-in for the LLM: emits its reply a word at a time with a delay
+    def __init__(self, session_id, initial_messages):
+        self.session_id = session_id
+        self.initial_messages = initial_messages
+
+    async def stream_message(self, message):
+        for word in f"You said: {message}".split(" "):
+            await asyncio.sleep(TOKEN_DELAY)
+            yield word + " "
+
+
+class FailingLlm(FakeStreamingLlm):
+    async def stream_message(self, message):
+        yield "partial "
+        raise RuntimeError("upstream timeout")
+
+
+@pytest.fixture(autouse=True)
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(server.chat_sessions, "client_factory", FakeStreamingLlm)
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_emits_tokens_then_done(client, auth_headers):
+    response = client.post("/api/chat/stream", headers=auth_headers,
+                           json={"message": "hello", "session_id": "s1"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    tokens = [data["text"] for event, data in events if event == "token"]
+    assert tokens == ["You ", "said: ", "hello "]
+    assert events[-1] == ("done", {"response": "You said: hello ", "session_id": "s1"})
+
+
+def test_stream_persists_final_message(client, auth_headers):
+    client.post("/api/chat/stream", headers=auth_headers, json={"message": "hello", "session_id": "s1"})
+
+    history = client.get("/api/chat/history", headers=auth_headers, params={"session_id": "s1"}).json()
+    assert [(item["message"], item["response"]) for item in history] == [("hello", "You said: hello ")]
+
+
+def test_first_token_arrives_before_generation_finishes():
+    async def measure():
+        started = time.perf_counter()
+        arrivals = []
+        async for _ in server.chat_sessions.stream("teststudent", "s1", "one two three four"):
+            arrivals.append(time.perf_counter() - started)
+        return arrivals
+
+    arrivals = asyncio.run(measure())
+
+    assert len(arrivals) == 6
+    assert arrivals[0] < TOKEN_DELAY * 3
+    assert arrivals[-1] >= TOKEN_DELAY * 6
+
+
+def test_stream_error_is_reported_and_not_persisted(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server.chat_sessions, "client_factory", FailingLlm)
+
+    response = client.post("/api/chat/stream", headers=auth_headers,
+                           json={"message": "hello", "session_id": "s1"})
+
+    events = parse_sse(response.text)
+    assert events[0] == ("token", {"text": "partial "})
+    assert events[-1] == ("error", {"detail": "Chat error: upstream timeout"})
+    assert client.get("/api/chat/history", headers=auth_headers).json() == []
+
+
+def test_new_client_is_warmed_from_chat_history(client, auth_headers):
+    client.post("/api/chat/stream", headers=auth_headers, json={"message": "my name is Ada", "session_id": "s1"})
+    server.chat_sessions.sessions.clear()  # as if another worker picked up the session
+
+    client.post("/api/chat/stream", headers=auth_headers, json={"message": "what is my name?", "session_id": "s1"})
+
+    session = server.chat_sessions.get("teststudent", "s1")
+    contents = [message["content"] for message in session.client.initial_messages]
+    assert contents[1:] == ["my name is Ada", "You said: my name is Ada "]
+
+
+def test_litellm_client_relays_deltas_as_they_arrive(monkeypatch):
+    requests = []
+
+    async def acompletion(**kwargs):
+        requests.append({**kwargs, "messages": list(kwargs["messages"])})
+
+        async def parts():
+            for text in ["Open ", None, "9am"]:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+        return parts()
+
+    monkeypatch.setattr(server, "litellm", SimpleNamespace(acompletion=acompletion))
+    monkeypatch.setattr(server, "CHAT_API_KEY", "sk-emergent-test")
+    monkeypatch.setattr(server, "CHAT_API_BASE", server.EMERGENT_LLM_API_BASE)
+    client = server.create_llm_client("s1", [{"role": "system", "content": "Be brief"}])
+
+    async def ask(message):
+        return [chunk async for chunk in client.stream_message(message)]
+
+    assert asyncio.run(ask("When does the library open?")) == ["Open ", "9am"]
+    assert requests[0]["stream"] is True
+    assert (requests[0]["api_key"], requests[0]["api_base"]) == ("sk-emergent-test", server.EMERGENT_LLM_API_BASE)
+    assert requests[0]["messages"][-1] == {"role": "user", "content": "When does the library open?"}
+    assert client.messages[-1] == {"role": "assistant", "content": "Open 9am"}
+
+
+def test_emergent_key_is_sent_to_the_emergent_proxy():
+    emergent = {"EMERGENT_LLM_KEY": "sk-emergent-test"}
+
+    assert server.chat_api_credentials(emergent) == ("sk-emergent-test", server.EMERGENT_LLM_API_BASE)
+    assert server.chat_api_credentials({**emergent, "LLM_API_BASE": "http://proxy"}) == ("sk-emergent-test", "http://proxy")
+    # A provider's own key goes to the provider unless a base is configured
+    assert server.chat_api_credentials({**emergent, "LLM_API_KEY": "sk-openai"}) == ("sk-openai", None)
+    assert server.chat_api_credentials({}) == (None, None)
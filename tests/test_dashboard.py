@@ -0,0 +1,57 @@
+import asyncio
+
+import server
+
+
+def test_dashboard_matches_the_routes_it_replaces(client, auth_headers):
+    client.post("/api/timetable", headers=auth_headers, json={
+        "course": "Algorithms", "time": "09:00-11:00", "location": "QA080", "day": "Monday", "campus": "Greenwich",
+    })
+    client.post("/api/grades", headers=auth_headers, json={"name": "Algorithms", "grade": "A", "credits": 15})
+    client.post("/api/news", headers=auth_headers, json={"title": "Open day", "content": "Tours", "category": "Campus"})
+
+    dashboard = client.get("/api/dashboard", headers=auth_headers).json()
+
+    assert list(dashboard) == list(server.DASHBOARD_SECTIONS)
+    assert dashboard["user"] == client.get("/api/auth/me", headers=auth_headers).json()
+    for section in ["timetable", "grades", "news", "attendance"]:
+        assert dashboard[section] == {
+            "items": client.get(f"/api/{section}", headers=auth_headers).json(), "next_cursor": None,
+        }, section
+    assert len(dashboard["timetable"]["items"]) == len(dashboard["news"]["items"]) == 1
+
+
+def test_fields_select_sections(client, auth_headers, monkeypatch):
+    queried = []
+    find_page = server.Repository.find_page
+
+    async def record(self, *args):
+        queried.append(self.collection.name)
+        return await find_page(self, *args)
+
+    monkeypatch.setattr(server.Repository, "find_page", record)
+
+    response = client.get("/api/dashboard", headers=auth_headers, params={"fields": "grades,user"})
+
+    assert list(response.json()) == ["grades", "user"]
+    assert queried == ["grades"]
+    assert client.get("/api/dashboard", headers=auth_headers, params={"fields": "grades,salary"}).status_code == 400
+    assert client.get("/api/dashboard", headers=auth_headers, params={"fields": ""}).status_code == 400
+
+
+def test_sections_are_queried_concurrently(client, auth_headers, monkeypatch):
+    arrived = []
+    find_page = server.Repository.find_page
+
+    async def barrier(self, *args):
+        # Completes only once all four section queries are in flight together
+        arrived.append(self.collection.name)
+        async with asyncio.timeout(2):
+            while len(arrived) < 4:
+                await asyncio.sleep(0.001)
+        return await find_page(self, *args)
+
+    monkeypatch.setattr(server.Repository, "find_page", barrier)
+
+    assert client.get("/api/dashboard", headers=auth_headers).status_code == 200
+    assert sorted(arrived) == ["attendance", "grades", "news", "timetable"]
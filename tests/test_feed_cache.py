@@ -0,0 +1,67 @@
+import asyncio
+
+import server
+
+NEWS = {"title": "Freshers' Fair", "content": "Stalls on the Greenwich campus", "category": "Events"}
+
+
+def post_news(client, auth_headers, title):
+    response = client.post("/api/news", headers=auth_headers, json={**NEWS, "title": title})
+    assert response.status_code == 200, response.text
+
+
+def test_matching_etag_gets_304(client, auth_headers):
+    post_news(client, auth_headers, "Freshers' Fair")
+    first = client.get("/api/news")
+    etag = first.headers["ETag"]
+
+    for if_none_match in [etag, f"W/{etag}", f'"stale", {etag}', "*"]:
+        response = client.get("/api/news", headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+    assert client.get("/api/news", headers={"If-None-Match": '"stale"'}).json() == first.json()
+
+
+def test_posting_news_invalidates_the_cached_feed(client, auth_headers):
+    post_news(client, auth_headers, "Freshers' Fair")
+    hits, misses = server.feed_cache.hits, server.feed_cache.misses
+    etag = client.get("/api/news").headers["ETag"]
+    client.get("/api/events")
+    assert client.get("/api/news").headers["ETag"] == etag
+    assert (server.feed_cache.hits - hits, server.feed_cache.misses - misses) == (1, 2)
+
+    post_news(client, auth_headers, "Library Extended Hours")
+    response = client.get("/api/news", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [item["title"] for item in response.json()] == ["Library Extended Hours", "Freshers' Fair"]
+    # Other feeds keep their entries
+    client.get("/api/events")
+    assert (server.feed_cache.hits - hits, server.feed_cache.misses - misses) == (2, 3)
+
+
+def test_workers_share_entries_and_invalidation_through_the_backend():
+    shared = server.InMemorySharedCache()
+    first = server.FeedCache(server.TTLCache(10, 60), shared)
+    second = server.FeedCache(server.TTLCache(10, 60), shared)
+    loads = []
+
+    def loader(body):
+        async def load():
+            loads.append(body)
+            return server.CachedFeed(body, f'"{body.decode()}"', None)
+        return load
+
+    async def scenario():
+        assert (await first.get("news", "20:", loader(b"v1"))).body == b"v1"
+        assert (await second.get("news", "20:", loader(b"unused"))).body == b"v1"
+        await second.invalidate("news")
+        assert (await first.get("news", "20:", loader(b"v2"))).body == b"v2"
+        assert (await second.get("news", "20:", loader(b"unused"))).body == b"v2"
+
+    asyncio.run(scenario())
+
+    assert loads == [b"v1", b"v2"]
+    assert (first.misses, first.shared_hits, second.misses, second.shared_hits) == (2, 0, 0, 2)
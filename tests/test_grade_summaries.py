@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import server
+
+
+def add_grade(client, auth_headers, name, grade, credits, year=None):
+    body = {"name": name, "grade": grade, "credits": credits}
+    if year is not None:
+        body["year"] = year
+    response = client.post("/api/grades", headers=auth_headers, json=body)
+    assert response.status_code == 200, response.text
+
+
+def summary(client, auth_headers):
+    return client.get("/api/grades/summary", headers=auth_headers).json()
+
+
+def test_empty_summary(client, auth_headers):
+    assert summary(client, auth_headers) == {
+        "credits": 0, "modules": 0, "gpa": None, "classification": None, "years": []}
+
+
+def test_summary_is_maintained_on_add_grade(client, auth_headers):
+    add_grade(client, auth_headers, "Algorithms", "A", 30, year=1)
+    add_grade(client, auth_headers, "Networks", "B", 15, year=1)
+    add_grade(client, auth_headers, "Security", "C+", 15)  # student's current year (2)
+
+    result = summary(client, auth_headers)
+
+    assert (result["credits"], result["modules"], result["gpa"]) == (60, 3, 3.33)
+    assert result["classification"] == "Upper Second (2:1)"
+    assert result["years"] == [
+        {"year": 1, "credits": 45, "modules": 2, "gpa": 3.67, "classification": "Upper Second (2:1)"},
+        {"year": 2, "credits": 15, "modules": 1, "gpa": 2.3, "classification": "Lower Second (2:2)"},
+    ]
+
+
+def test_unknown_grades_and_non_positive_credits_are_rejected(client, auth_headers):
+    for body in [{"name": "AI", "grade": "Z", "credits": 15}, {"name": "AI", "grade": "B", "credits": -15},
+                 {"name": "AI", "grade": "B", "credits": 0}]:
+        assert client.post("/api/grades", headers=auth_headers, json=body).status_code == 422
+
+    rows = [{"name": "AI", "grade": "Z", "credits": 15}, {"name": "Networks", "grade": "b+", "credits": -15},
+            {"name": "Algorithms", "grade": " a- ", "credits": 15}]
+    response = client.post("/api/grades/import", headers={**auth_headers, "Content-Type": "application/x-ndjson"},
+                           content="\n".join(json.dumps(row) for row in rows))
+
+    assert [(error["row"], error["error"].split(":")[0]) for error in response.json()["errors"]] == [
+        (1, "grade"), (2, "credits")]
+    assert [grade["grade"] for grade in client.get("/api/grades", headers=auth_headers).json()] == ["A-"]
+    assert (summary(client, auth_headers)["credits"], summary(client, auth_headers)["gpa"]) == (15, 3.7)
+
+
+def test_imported_grades_update_summary(client, auth_headers):
+    body = "\n".join(json.dumps(row) for row in [
+        {"name": "Algorithms", "grade": "A", "credits": 30},
+        {"name": "Networks", "grade": "B", "credits": 15, "year": 1},
+    ])
+    client.post("/api/grades/import", headers={**auth_headers, "Content-Type": "application/x-ndjson"}, content=body)
+
+    result = summary(client, auth_headers)
+
+    assert (result["credits"], result["modules"]) == (45, 2)
+    assert [(year["year"], year["credits"]) for year in result["years"]] == [(1, 15), (2, 30)]
+
+
+def test_backfill_matches_incremental_totals(client, auth_headers, monkeypatch):
+    add_grade(client, auth_headers, "Algorithms", "A", 30, year=1)
+    add_grade(client, auth_headers, "Networks", "B-", 15)
+    # A legacy grade without a year, and a summary that has drifted
+    asyncio.run(server.grades_repo.insert_one({"username": "teststudent", "name": "AI", "grade": "B+", "credits": 15}))
+    expected_overall = {"credits": 60, "modules": 3, "gpa": 3.5, "classification": "Upper Second (2:1)"}
+    asyncio.run(server.grade_summaries_repo.update_one({"_id": "teststudent"}, {"$inc": {"credits": 100}}))
+
+    assert client.post("/api/admin/grade-summaries/backfill", headers=auth_headers).status_code == 403
+    monkeypatch.setattr(server, "STAFF_USERNAMES", {"teststudent"})
+    response = client.post("/api/admin/grade-summaries/backfill", headers=auth_headers)
+
+    assert response.json() == {"students": 1}
+    result = summary(client, auth_headers)
+    assert {key: result[key] for key in expected_overall} == expected_overall
+    assert [(year["year"], year["credits"]) for year in result["years"]] == [(1, 30), (2, 30)]
+
+
+def test_backfill_runs_in_batches():
+    grades = [{"username": f"student{i}", "name": "Algorithms", "grade": "B", "credits": 15} for i in range(7)]
+    asyncio.run(server.grades_repo.insert_many(grades))
+
+    students = asyncio.run(server.grade_summaries_repo.backfill(server.grades_repo, batch_size=3, concurrency=2))
+
+    assert students == 7
+    assert asyncio.run(server.grade_summaries_repo.get_summary("student6"))["gpa"] == 3.0
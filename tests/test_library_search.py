@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+import server
+
+BOOKS = [
+    {"title": "Introduction to Algorithms", "author": "Thomas H. Cormen", "isbn": "978-0-262-03384-8",
+     "available": True, "location": "Computing Section", "campus": "Greenwich"},
+    {"title": "Algebra and Trigonometry", "author": "Michael Sullivan", "isbn": "0-321-71656-X",
+     "available": False, "location": "Maths Section", "campus": "Medway"},
+    {"title": "Database System Concepts", "author": "Abraham Silberschatz", "isbn": "0-07-352332-1",
+     "available": True, "location": "Computing Section", "campus": "Greenwich"},
+]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("978-0-262-03384-8", "9780262033848"),
+    ("978 0 262 03384 8", "9780262033848"),
+    ("0-306-40615-2", "9780306406157"),
+    ("0-8044-2957-x", "9780804429573"),
+    ("080442957X", "9780804429573"),
+    ("algorithms", None),
+    ("978-0-262", None),
+    ("X-306-40615-2", None),
+])
+def test_normalize_isbn(value, expected):
+    assert server.normalize_isbn(value) == expected
+
+
+def test_search_fields_are_lowercase_word_tokens():
+    fields = server.library_search_fields(BOOKS[0])
+
+    assert fields == {
+        "search_terms": ["algorithms", "cormen", "h", "introduction", "thomas", "to"],
+        "isbn_normalized": "9780262033848",
+    }
+    assert server.library_search_fields({"title": "C++ Primer"})["isbn_normalized"] is None
+
+
+def prefix_search(query, books=BOOKS):
+    # What {"search_terms": {"$all": patterns}} selects; mongomock can't run $all with regexes
+    patterns = server.prefix_patterns(query)
+    return sorted(book["title"] for book in books
+                  if patterns and all(any(pattern.match(term) for term in server.library_search_fields(book)
+                                          ["search_terms"]) for pattern in patterns))
+
+
+def test_prefix_patterns_match_every_token_as_a_word_prefix():
+    assert [pattern.pattern for pattern in server.prefix_patterns("Alg  corm!")] == ["^alg", "^corm"]
+    assert prefix_search("alg") == ["Algebra and Trigonometry", "Introduction to Algorithms"]
+    assert prefix_search("Alg corm") == ["Introduction to Algorithms"]
+    assert prefix_search("silber dat") == ["Database System Concepts"]
+    # Tokens are anchored at word starts, and punctuation never reaches the regex
+    assert prefix_search("gorithms") == []
+    assert prefix_search("alg.*") == ["Algebra and Trigonometry", "Introduction to Algorithms"]
+    assert server.prefix_patterns("?!") == []
+
+
+@pytest.fixture
+def books():
+    asyncio.run(server.library_repo.insert_many([{**book, **server.library_search_fields(book)} for book in BOOKS]))
+
+
+def test_isbn_query_finds_either_spelling(client, books):
+    for query in ["0-262-03384-4", "9780262033848"]:
+        response = client.get("/api/library", params={"query": query})
+        assert [book["title"] for book in response.json()] == ["Introduction to Algorithms"]
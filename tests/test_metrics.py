@@ -0,0 +1,66 @@
+import threading
+from types import SimpleNamespace
+
+import server
+
+
+def metric_lines(client, prefix):
+    return [line for line in client.get("/metrics").text.splitlines() if line.startswith(prefix)]
+
+
+def test_requests_are_labelled_by_route_template(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, "QR_ISSUER_USERNAMES", {"teststudent"})
+    client.get("/api/attendance/sessions/abc123/qr", headers=auth_headers)
+    client.get("/api/attendance/sessions/def456/qr", headers=auth_headers)
+    client.get("/api/no-such-route")
+
+    requests = metric_lines(client, "http_requests_total")
+    assert 'http_requests_total{method="GET",route="/api/attendance/sessions/{session_id}/qr",status="404"} 2' \
+        in requests
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in requests
+    assert not any("abc123" in line for line in requests)
+    assert metric_lines(client, "http_requests_in_flight") == ["http_requests_in_flight 1"]
+
+
+def test_dependency_timings_cover_bcrypt(client, auth_headers):
+    client.post("/api/auth/login", json={"username": "teststudent", "password": "test123"})
+
+    counts = metric_lines(client, "dependency_duration_seconds_count")
+    assert 'dependency_duration_seconds_count{dependency="bcrypt",operation="hash"} 1' in counts
+    assert 'dependency_duration_seconds_count{dependency="bcrypt",operation="verify"} 1' in counts
+
+
+def test_histogram_buckets_render_cumulatively():
+    histogram = server.Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    lines = []
+
+    server.render_histogram(lines, "latency", 'route="/x"', histogram)
+
+    assert lines == [
+        'latency_bucket{route="/x",le="0.1"} 2',
+        'latency_bucket{route="/x",le="1.0"} 3',
+        'latency_bucket{route="/x",le="+Inf"} 4',
+        'latency_sum{route="/x"} 3.65',
+        'latency_count{route="/x"} 4',
+    ]
+
+
+def test_mongo_timings_merge_per_thread_shards():
+    timer = server.MongoCommandTimer()
+
+    def record():
+        for _ in range(1000):
+            timer.succeeded(SimpleNamespace(command_name="find", duration_micros=2000))
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    histogram = timer.histograms()["find"]
+    assert len(timer.shards) == 4
+    assert sum(histogram.counts) == 4000
+    assert abs(histogram.sum - 8.0) < 1e-9
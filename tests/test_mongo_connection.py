@@ -0,0 +1,34 @@
+import asyncio
+import os
+
+import server
+
+
+def test_client_is_created_on_first_use():
+    connection = server.MongoConnection("mongodb://localhost:27017", "lazy_db")
+    users = connection.collection("users")
+
+    assert users.name == "users"
+    assert connection._client is None
+
+    asyncio.run(users.insert_one({"username": "alice"}))
+
+    assert connection._client is not None
+    assert asyncio.run(users.find_one({}, {"_id": 0})) == {"username": "alice"}
+    asyncio.run(connection.client.drop_database("lazy_db"))
+
+
+def test_forked_child_opens_its_own_client():
+    connection = server.MongoConnection("mongodb://localhost:27017", "lazy_db")
+    users = connection.collection("users")
+    users.find  # resolves the collection, creating the parent's client
+    parent_client = connection._client
+
+    pid = os.fork()
+    if pid == 0:
+        # Exit status reports whether the inherited client and collection were dropped
+        os._exit(0 if connection._client is None and users.resolved is None else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert connection._client is parent_client
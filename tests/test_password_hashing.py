@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+LOGIN = {"username": "teststudent", "password": "test123"}
+
+
+def stored_hash(username):
+    return asyncio.run(server.users_repo.get_credentials(username))["password"]
+
+
+def test_full_queue_is_refused_with_retry_after():
+    hasher = server.PasswordHasher(server.create_pwd_context, workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def saturate():
+        running = asyncio.ensure_future(hasher._run("verify", release.wait))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(HTTPException) as refused:
+                await hasher._run("verify", release.wait)
+        finally:
+            release.set()
+            await running
+        return refused.value
+
+    try:
+        refused = asyncio.run(saturate())
+    finally:
+        hasher.shutdown()
+
+    assert (refused.status_code, refused.headers) == (503, {"Retry-After": "1"})
+    assert hasher.pending == 0
+
+
+def test_login_is_refused_while_the_hash_queue_is_full(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server.password_hasher, "pending", server.password_hasher.max_pending)
+
+    response = client.post("/api/auth/login", json=LOGIN)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_login_rehashes_after_bcrypt_rounds_change(client, auth_headers, monkeypatch):
+    assert stored_hash("teststudent").startswith(f"$2b${server.BCRYPT_ROUNDS:02d}$")
+
+    monkeypatch.setattr(server, "BCRYPT_ROUNDS", server.BCRYPT_ROUNDS + 1)
+    monkeypatch.setattr(server.password_hasher, "_context", None)
+    assert client.post("/api/auth/login", json=LOGIN).status_code == 200
+
+    rehashed = stored_hash("teststudent")
+    assert rehashed.startswith(f"$2b${server.BCRYPT_ROUNDS:02d}$")
+    assert client.post("/api/auth/login", json=LOGIN).status_code == 200
+    assert stored_hash("teststudent") == rehashed
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def principal_reads(monkeypatch):
+    reads = []
+    get_principal = server.users_repo.get_principal
+
+    async def counting(username):
+        reads.append(username)
+        return await get_principal(username)
+
+    monkeypatch.setattr(server.users_repo, "get_principal", counting)
+    return reads
+
+
+def test_principal_is_read_once_per_ttl(client, auth_headers, principal_reads):
+    profiles = [client.get("/api/auth/me", headers=auth_headers).json() for _ in range(3)]
+
+    assert principal_reads == ["teststudent"]
+    assert profiles[0] == profiles[2]
+    assert profiles[0]["course"] == "Computer Science"
+    assert server.principal_cache.get("teststudent") == server.UserPrincipal(**profiles[0])
+
+
+def test_expired_principal_is_reloaded(client, auth_headers, principal_reads, monkeypatch):
+    monkeypatch.setattr(server.principal_cache, "ttl", -1)
+
+    for _ in range(2):
+        assert client.get("/api/auth/me", headers=auth_headers).status_code == 200
+
+    assert principal_reads == ["teststudent", "teststudent"]
+
+
+def test_evicting_after_an_update_serves_the_new_document(client, auth_headers):
+    client.get("/api/auth/me", headers=auth_headers)
+    asyncio.run(server.users_repo.update_one({"username": "teststudent"}, {"$set": {"course": "History"}}))
+    assert client.get("/api/auth/me", headers=auth_headers).json()["course"] == "Computer Science"
+
+    server.evict_principal("teststudent")
+
+    assert client.get("/api/auth/me", headers=auth_headers).json()["course"] == "History"
+
+
+def test_logout_evicts_the_principal(client, auth_headers):
+    client.get("/api/auth/me", headers=auth_headers)
+    assert server.principal_cache.get("teststudent") is not None
+
+    assert client.post("/api/auth/logout", headers=auth_headers, json={}).status_code == 200
+
+    assert server.principal_cache.get("teststudent") is None
+    assert client.get("/api/auth/me", headers=auth_headers).status_code == 401
+
+
+def test_cache_is_bounded():
+    cache = server.TTLCache(max_entries=2, ttl=60)
+    for name in ["alice", "bob", "carol"]:
+        cache.set(name, name)
+
+    assert (cache.get("alice"), cache.get("bob"), cache.get("carol")) == (None, "bob", "carol")
@@ -0,0 +1,88 @@
+import json
+
+import server
+
+
+class CollectionSpy:
+    """Records the projection of every find on the wrapped collection"""
+
+    def __init__(self, collection, reads):
+        self.collection = collection
+        self.reads = reads
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        self.reads.append((self.collection.name, projection))
+        return self.collection.find(filter, projection, *args, **kwargs)
+
+    def find_one(self, filter=None, projection=None, *args, **kwargs):
+        self.reads.append((self.collection.name, projection))
+        return self.collection.find_one(filter, projection, *args, **kwargs)
+
+
+def reads_field(projection, field):
+    if projection is None:
+        return True
+    if any(projection.values()):
+        return bool(projection.get(field))
+    return field not in projection
+
+
+def test_every_route_projects_and_only_login_reads_passwords(client, auth_headers, monkeypatch):
+    reads = []
+    for repo in vars(server).values():
+        if isinstance(repo, server.Repository):
+            monkeypatch.setattr(repo, "collection", CollectionSpy(repo.collection, reads))
+    monkeypatch.setattr(server, "STAFF_USERNAMES", {"teststudent"})
+    monkeypatch.setattr(server, "QR_ISSUER_USERNAMES", {"teststudent"})
+    client.post("/api/seed", headers=auth_headers)
+    client.post("/api/timetable", headers=auth_headers, json={
+        "course": "Algorithms", "time": "09:00-11:00", "location": "QA080", "day": "Monday", "campus": "Greenwich",
+    })
+    login = {"username": "teststudent", "password": "test123"}
+    refresh_token = client.post("/api/auth/login", json=login).json()["refresh_token"]
+    grade_rows = json.dumps({"name": "Networks", "grade": "B", "credits": 15})
+
+    calls = [
+        ("POST", "/api/auth/register", {"json": {
+            "username": "another", "email": "another@greenwich.ac.uk", "password": "secret1",
+            "student_id": "STU000002", "course": "History", "year": 1,
+        }}),
+        ("POST", "/api/auth/login", {"json": login}),
+        ("POST", "/api/auth/refresh", {"json": {"refresh_token": refresh_token}}),
+        ("GET", "/api/auth/me", {}),
+        ("GET", "/api/timetable", {}),
+        ("POST", "/api/grades", {"json": {"name": "Algorithms", "grade": "A", "credits": 15}}),
+        ("POST", "/api/grades/import", {"content": grade_rows,
+                                        "headers": {"Content-Type": "application/x-ndjson"}}),
+        ("GET", "/api/grades", {}),
+        ("GET", "/api/grades/summary", {}),
+        ("POST", "/api/admin/grade-summaries/backfill", {}),
+        ("GET", "/api/news", {}),
+        ("GET", "/api/events", {"params": {"format": "ndjson"}}),
+        ("GET", "/api/library", {"params": {"campus": "Greenwich"}}),
+        ("GET", "/api/library", {"params": {"query": "978-0-13-110362-7"}}),
+        ("GET", "/api/library/autocomplete", {"params": {"prefix": "intro"}}),
+        ("GET", "/api/attendance", {}),
+        ("GET", "/api/attendance/sessions", {}),
+        ("GET", "/api/dashboard", {}),
+        ("GET", "/api/sync", {}),
+        ("GET", "/api/chat/history", {}),
+        ("GET", "/api/analytics/attendance/classes", {}),
+        ("GET", "/api/analytics/attendance/students", {}),
+        ("POST", "/api/auth/logout", {"json": {}}),
+    ]
+    password_readers = set()
+    for method, path, kwargs in calls:
+        server.principal_cache.clear()
+        reads.clear()
+        headers = {**auth_headers, **kwargs.pop("headers", {})}
+        response = client.request(method, path, headers=headers, **kwargs)
+        assert response.status_code == 200, (path, response.text)
+        assert all(projection is not None for _, projection in reads), (path, reads)
+        if any(name == "users" and reads_field(projection, "password") for name, projection in reads):
+            password_readers.add(path)
+
+    assert password_readers == {"/api/auth/login"}
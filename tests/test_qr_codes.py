@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+# A Tuesday morning, in timetable local time
+TUESDAY_10AM = datetime(2026, 10, 13, 10, 0, tzinfo=server.TIMETABLE_TIMEZONE)
+NOW = 1_800_000_000.0
+
+
+@pytest.fixture
+def lecture():
+    return server.session_index.add({"course": "Software Engineering", "day": "Tuesday", "time": "09:00-11:00",
+                                     "location": "Room QA080", "campus": "Greenwich"})
+
+
+def rejection(code, at=NOW, now=TUESDAY_10AM):
+    with pytest.raises(HTTPException) as error:
+        server.verify_qr_code(code, at, now)
+    return error.value.detail
+
+
+def test_code_resolves_to_its_class(lecture):
+    code, rotates_at = server.issue_qr_code(lecture.session_id, NOW)
+
+    assert server.verify_qr_code(code, NOW, TUESDAY_10AM) == lecture
+    assert NOW < rotates_at <= NOW + server.QR_WINDOW_SECONDS
+
+
+def test_previous_window_is_still_accepted(lecture):
+    code, _ = server.issue_qr_code(lecture.session_id, NOW - server.QR_WINDOW_SECONDS)
+
+    assert server.verify_qr_code(code, NOW, TUESDAY_10AM) == lecture
+    assert rejection(server.issue_qr_code(lecture.session_id, NOW - 2 * server.QR_WINDOW_SECONDS)[0]) \
+        == "QR code expired"
+
+
+def test_tampered_and_malformed_codes_are_rejected(lecture):
+    code, _ = server.issue_qr_code(lecture.session_id, NOW)
+    session_id, window, signature = code.split(".")
+
+    assert rejection(f"{session_id}.{int(window) + 1}.{signature}") == "Invalid QR code"
+    tampered = signature[:-1] + ("B" if signature.endswith("A") else "A")
+    assert rejection(f"{session_id}.{window}.{tampered}") == "Invalid QR code"
+    assert rejection("QR_CODE_12345_LECTURE_HALL_A") == "Invalid QR code"
+    assert rejection(f"{session_id}.²") == "Invalid QR code"
+
+
+def test_qr_key_is_never_the_jwt_secret():
+    derived = server.derive_qr_secret(None, "jwt-secret")
+
+    assert derived not in (b"", b"jwt-secret")
+    assert derived == server.derive_qr_secret("", "jwt-secret")
+    assert server.derive_qr_secret("qr-secret", "jwt-secret") == b"qr-secret"
+    assert server.QR_SECRET == server.derive_qr_secret(None, server.JWT_SECRET)
+    with pytest.raises(RuntimeError):
+        server.derive_qr_secret(None, None)
+
+
+def test_code_only_scans_while_class_is_on(lecture):
+    code, _ = server.issue_qr_code(lecture.session_id, NOW)
+
+    assert server.verify_qr_code(code, NOW, TUESDAY_10AM.replace(hour=8, minute=50)) == lecture
+    assert rejection(code, now=TUESDAY_10AM.replace(hour=11, minute=1)) == "Class is not in session"
+    assert rejection(code, now=TUESDAY_10AM.replace(day=14)) == "Class is not in session"
+
+
+def test_session_ids_are_shared_by_every_students_copy(lecture):
+    copy = server.class_session({"course": "Software Engineering", "day": "Tuesday", "time": "09:00-11:00",
+                                 "location": "Room QA080", "campus": "Greenwich", "username": "someone"})
+
+    assert copy.session_id == lecture.session_id
+
+
+def test_index_is_rebuilt_from_timetable(client, auth_headers):
+    client.post("/api/timetable", headers=auth_headers, json={
+        "course": "Databases", "time": "14:00-16:00", "location": "Room QM065", "day": "Wed", "campus": "Avery Hill"})
+    server.session_index.sessions.clear()
+
+    server.asyncio.run(server.session_index.rebuild(server.timetable_repo))
+
+    assert [session.course for session in server.session_index.sessions.values()] == ["Databases"]
+
+
+def test_issued_code_marks_attendance(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, "QR_ISSUER_USERNAMES", {"teststudent"})
+    client.post("/api/timetable", headers=auth_headers, json={
+        "course": "Networks", "time": "00:00-23:59", "location": "Room QA080",
+        "day": server.timetable_now().strftime("%A"), "campus": "Greenwich"})
+
+    sessions = client.get("/api/attendance/sessions", headers=auth_headers).json()
+    assert [session["course"] for session in sessions] == ["Networks"]
+    issued = client.get(f"/api/attendance/sessions/{sessions[0]['session_id']}/qr", headers=auth_headers).json()
+    response = client.post("/api/attendance", headers=auth_headers,
+                           json={"class_name": "Networks", "qr_code": issued["qr_code"]})
+
+    assert response.status_code == 200
+    assert response.json()["record"]["class_name"] == "Networks"
+
+
+def test_forged_code_is_refused(client, auth_headers):
+    response = client.post("/api/attendance", headers=auth_headers,
+                           json={"class_name": "Networks", "qr_code": "QR_CODE_12345_LECTURE_HALL_A"})
+
+    assert response.status_code == 400
+
+
+def test_only_issuers_can_display_codes(client, auth_headers, monkeypatch):
+    assert client.get("/api/attendance/sessions", headers=auth_headers).status_code == 403
+    assert client.get("/api/attendance/sessions/abc123/qr", headers=auth_headers).status_code == 403
+
+    monkeypatch.setattr(server, "QR_ISSUER_USERNAMES", {"lecturer"})
+
+    assert client.get("/api/attendance/sessions", headers=auth_headers).status_code == 403
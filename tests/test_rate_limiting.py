@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import server
+
+LOGIN = {"username": "teststudent", "password": "test123"}
+
+
+def test_login_is_limited_per_client_ip_and_username(client, auth_headers, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMITS, "auth", server.RateLimit(capacity=2, refill_per_second=0.1))
+    server.rate_limiter.store.buckets.clear()
+
+    statuses = [client.post("/api/auth/login", json=LOGIN).status_code for _ in range(3)]
+    retry_after = int(client.post("/api/auth/login", json=LOGIN).headers["Retry-After"])
+    # Another student behind the same NAT still gets their own bucket
+    response = client.post("/api/auth/login", json={"username": "someone", "password": "else"})
+
+    assert statuses == [200, 200, 429]
+    assert 1 <= retry_after <= 10
+    assert response.status_code == 401
+
+
+def test_auth_is_capped_per_client_ip_across_usernames(client, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMITS, "auth_ip", server.RateLimit(capacity=3, refill_per_second=0.1))
+    server.rate_limiter.store.buckets.clear()
+
+    statuses = [client.post("/api/auth/login", json={"username": f"guess{n}", "password": "x"}).status_code
+                for n in range(4)]
+
+    assert statuses == [401, 401, 401, 429]
+
+
+def test_forwarded_for_is_only_used_when_trusted(client, auth_headers, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMITS, "auth", server.RateLimit(capacity=1, refill_per_second=0.1))
+    server.rate_limiter.store.buckets.clear()
+
+    assert client.post("/api/auth/login", json=LOGIN, headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 200
+    assert client.post("/api/auth/login", json=LOGIN, headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 429
+
+    monkeypatch.setattr(server, "TRUST_FORWARDED_FOR", True)
+    chained = {"X-Forwarded-For": "10.0.0.3, 10.0.0.9"}
+    assert client.post("/api/auth/login", json=LOGIN, headers=chained).status_code == 200
+    assert client.post("/api/auth/login", json=LOGIN, headers={"X-Forwarded-For": "10.0.0.3"}).status_code == 429
+
+
+def test_attendance_buckets_are_per_user(client, auth_headers, monkeypatch):
+    monkeypatch.setitem(server.RATE_LIMITS, "attendance", server.RateLimit(capacity=2, refill_per_second=0.1))
+    other = client.post("/api/auth/register", json={
+        "username": "otherstudent", "email": "otherstudent@greenwich.ac.uk", "password": "test123",
+        "student_id": "STU000002", "course": "History", "year": 1,
+    })
+    other_headers = {"Authorization": f"Bearer {other.json()['token']}"}
+    scan = {"class_name": "Algorithms", "qr_code": "not-a-code"}
+
+    statuses = [client.post("/api/attendance", headers=auth_headers, json=scan).status_code for _ in range(3)]
+
+    # Refused scans still spend a token, so guessing codes is throttled too
+    assert statuses == [400, 400, 429]
+    assert client.post("/api/attendance", headers=other_headers, json=scan).status_code == 400
+
+
+def test_bucket_refills_over_time():
+    store = server.InMemoryRateLimitStore(max_keys=10)
+    limit = server.RateLimit(capacity=1, refill_per_second=50)
+
+    assert asyncio.run(store.take("chat:alice", limit)) == 0
+    retry_after = asyncio.run(store.take("chat:alice", limit))
+    assert 0 < retry_after <= 0.02
+    time.sleep(retry_after + 0.01)
+    assert asyncio.run(store.take("chat:alice", limit)) == 0
+
+
+def test_store_memory_is_bounded():
+    store = server.InMemoryRateLimitStore(max_keys=100)
+    limit = server.RateLimit(capacity=5, refill_per_second=1)
+
+    for n in range(1000):
+        asyncio.run(store.take(f"auth:10.0.{n // 256}.{n % 256}", limit))
+
+    assert len(store.buckets) == 100
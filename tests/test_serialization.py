@@ -0,0 +1,68 @@
+import asyncio
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+import server
+
+
+def test_fast_response_matches_standard_encoding():
+    documents = [
+        {"_id": ObjectId(), "class_name": "Databases", "timestamp": datetime(2024, 10, 7, 9, 15, 30, 123000)},
+        {"_id": ObjectId(), "title": "Open day", "date": datetime(2024, 11, 2), "location": None},
+    ]
+    expected = [{**document, "_id": str(document["_id"])} for document in documents]
+
+    body = server.FastJSONResponse(documents).body
+
+    assert json.loads(body) == json.loads(json.dumps(expected, default=server.json_default))
+
+
+def test_list_routes_return_projected_items(client, auth_headers):
+    asyncio.run(server.news_repo.insert_one({
+        "title": "Welcome week", "content": "Sign up for societies", "category": "Campus",
+        "author": "admin", "created_at": datetime(2024, 9, 16, 10, 0),
+    }))
+    client.post("/api/timetable", headers=auth_headers, json={
+        "course": "Algorithms", "time": "09:00-11:00", "location": "QA080", "day": "Monday", "campus": "Greenwich",
+    })
+    client.post("/api/grades", headers=auth_headers, json={"name": "Algorithms", "grade": "A", "credits": 15})
+
+    for path, model in [("/api/news", server.NewsItem), ("/api/timetable", server.TimetableItem),
+                        ("/api/grades", server.GradeItem)]:
+        items = client.get(path, headers=auth_headers).json()
+        assert len(items) == 1, path
+        assert set(items[0]) <= set(server.projection_for(model)), path
+        model.model_validate(items[0])
+        assert "username" not in items[0] and "author" not in items[0], path
+
+    news = client.get("/api/news").json()[0]
+    assert news["created_at"] == "2024-09-16T10:00:00"
+    assert ObjectId.is_valid(news["_id"])
+
+
+def test_paginated_route_keeps_cursor_header(client, auth_headers):
+    for name in ["Algorithms", "Databases", "Networks"]:
+        client.post("/api/grades", headers=auth_headers, json={"name": name, "grade": "B", "credits": 15})
+
+    first = client.get("/api/grades", headers=auth_headers, params={"limit": 2})
+    second = client.get("/api/grades", headers=auth_headers,
+                        params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+
+    assert [item["name"] for item in first.json() + second.json()] == ["Algorithms", "Databases", "Networks"]
+    assert "X-Next-Cursor" not in second.headers
+
+
+def test_cursor_values_must_be_scalars(client, auth_headers):
+    for name in ["Algorithms", "Databases"]:
+        client.post("/api/grades", headers=auth_headers, json={"name": name, "grade": "B", "credits": 15})
+    position = server.decode_cursor(client.get("/api/grades", headers=auth_headers, params={"limit": 1})
+                                    .headers["X-Next-Cursor"])
+    assert isinstance(position["id"], ObjectId)
+
+    for forged in [{"id": {"$ne": None}}, {"id": {"oid": str(position["id"]), "$gt": ""}}, {"id": [1]}]:
+        cursor = base64.urlsafe_b64encode(json.dumps(forged).encode()).decode()
+        response = client.get("/api/grades", headers=auth_headers, params={"limit": 1, "cursor": cursor})
+        assert response.status_code == 400
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+# Import plus first request, best of three on a cold interpreter; about 0.25s
+# here. Raise with care: the LLM SDKs alone add seconds when imported eagerly.
+TIME_TO_FIRST_REQUEST_BUDGET = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5"))
+LAZY_MODULES = ("litellm", "jose.jwt", "passlib", "numpy")
+
+FIRST_REQUEST = """
+import time
+from starlette.testclient import TestClient
+
+started = time.perf_counter()
+import server
+response = TestClient(server.app).get("/metrics")
+elapsed = time.perf_counter() - started
+assert response.status_code == 200, response.status_code
+print(elapsed)
+"""
+
+
+def run_first_request(*options):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([BACKEND, os.environ.get("PYTHONPATH", "")])}
+    result = subprocess.run([sys.executable, *options, "-c", FIRST_REQUEST], env=env, cwd=BACKEND,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result
+
+
+def test_heavy_dependencies_load_on_first_use():
+    result = run_first_request("-X", "importtime")
+    imported = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines()
+                if line.startswith("import time:")}
+
+    eager = sorted(name for name in imported if name.startswith(LAZY_MODULES))
+    assert not eager, f"imported before first use: {eager}"
+
+
+def test_time_to_first_request_within_budget():
+    elapsed = min(float(run_first_request().stdout.split()[-1]) for _ in range(3))
+
+    assert elapsed < TIME_TO_FIRST_REQUEST_BUDGET, \
+        f"import + first request took {elapsed:.3f}s (budget {TIME_TO_FIRST_REQUEST_BUDGET}s)"
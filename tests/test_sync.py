@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+import server
+
+
+def change(token, collection, document, operation="insert"):
+    event = {"_id": {"_data": token}, "operationType": operation, "ns": {"db": "university_db", "coll": collection},
+             "documentKey": {"_id": document["_id"]}}
+    if operation != "delete":
+        event["fullDocument"] = document
+    return event
+
+
+def record(*events):
+    asyncio.run(server.change_log_repo.record([server.change_entry(event) for event in events]))
+
+
+def insert(repo, document):
+    document["_id"] = ObjectId(asyncio.run(repo.insert_one(document)))
+    return document
+
+
+def sync(client, auth_headers, **params):
+    response = client.get("/api/sync", headers=auth_headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_sync_returns_only_changes_after_the_token(client, auth_headers):
+    lecture = insert(server.timetable_repo, {"username": "teststudent", "course": "Algorithms", "day": "Monday",
+                                             "time": "09:00-11:00", "location": "QA080", "campus": "Greenwich"})
+    record(change("8201", "timetable", lecture))
+
+    first = sync(client, auth_headers)
+    assert (first["reset"], first["token"]) == (True, "8201")
+    assert [item["course"] for item in first["changes"]["timetable"]["upserted"]] == ["Algorithms"]
+
+    grade = insert(server.grades_repo, {"username": "teststudent", "name": "Networks", "grade": "B", "credits": 15})
+    other = insert(server.grades_repo, {"username": "someoneelse", "name": "History", "grade": "A", "credits": 15})
+    news = insert(server.news_repo, {"title": "Open day", "content": "Tours", "category": "Campus"})
+    asyncio.run(server.timetable_repo.collection.delete_one({"_id": lecture["_id"]}))
+    record(change("8202", "grades", grade), change("8203", "grades", other), change("8204", "news", news),
+           change("8205", "timetable", lecture, "delete"))
+
+    delta = sync(client, auth_headers, since=first["token"])
+    assert (delta["reset"], delta["more"], delta["token"]) == (False, False, "8205")
+    assert [item["name"] for item in delta["changes"]["grades"]["upserted"]] == ["Networks"]
+    assert [item["title"] for item in delta["changes"]["news"]["upserted"]] == ["Open day"]
+    assert delta["changes"]["timetable"] == {"upserted": [], "deleted": [str(lecture["_id"])]}
+    assert delta["changes"]["attendance"] == {"upserted": [], "deleted": []}
+
+    assert all(section == {"upserted": [], "deleted": []}
+               for section in sync(client, auth_headers, since=delta["token"])["changes"].values())
+
+
+def test_unknown_token_gets_a_reset(client, auth_headers):
+    record(change("8201", "news", insert(server.news_repo, {"title": "Open day", "content": "", "category": ""})))
+
+    response = sync(client, auth_headers, since="81ff", collections="news")
+
+    assert response["reset"] is True
+    assert list(response["changes"]) == ["news"]
+    assert client.get("/api/sync", headers=auth_headers, params={"collections": "users"}).status_code == 400
+
+
+def test_large_deltas_are_paged(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, "SYNC_MAX_CHANGES", 2)
+    record(change("8200", "news", insert(server.news_repo, {"title": "Start", "content": "", "category": ""})))
+    grades = [insert(server.grades_repo, {"username": "teststudent", "name": name, "grade": "B", "credits": 15})
+              for name in ["Algorithms", "Databases", "Networks"]]
+    record(*(change(f"820{index + 1}", "grades", grade) for index, grade in enumerate(grades)))
+
+    page = sync(client, auth_headers, since="8200")
+    rest = sync(client, auth_headers, since=page["token"])
+
+    assert (page["more"], page["token"], rest["more"], rest["token"]) == (True, "8202", False, "8203")
+    assert [item["name"] for item in page["changes"]["grades"]["upserted"] + rest["changes"]["grades"]["upserted"]] \
+        == ["Algorithms", "Databases", "Networks"]
+
+
+class StreamDrained(Exception):
+    pass
+
+
+class FakeChangeStream:
+    """Replica-set stand-in: replays prepared events, then fails the feed"""
+
+    def __init__(self, events, error=None):
+        self.events = list(events)
+        self.error = error
+
+    async def try_next(self):
+        if self.error:
+            raise self.error
+        if not self.events:
+            raise StreamDrained()
+        return self.events.pop(0)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.watched = []
+
+    def watch(self, pipeline, resume_after=None, **options):
+        self.watched.append(resume_after)
+        return self.streams.pop(0)
+
+
+def test_feeder_resumes_from_the_log_and_restarts_when_history_is_lost():
+    repo = server.change_log_repo
+    record(change("8100", "news", {"_id": ObjectId()}))
+    grade = {"_id": ObjectId(), "username": "teststudent"}
+    news = {"_id": ObjectId(), "title": "Open day"}
+    database = FakeDatabase(
+        FakeChangeStream([], OperationFailure("history lost", server.CHANGE_STREAM_HISTORY_LOST)),
+        FakeChangeStream([change("8201", "grades", grade), change("8202", "news", news), None,
+                          change("8203", "grades", grade, "delete"), None]),
+    )
+
+    with pytest.raises(StreamDrained):
+        asyncio.run(server.feed_change_log(database, repo))
+
+    assert database.watched == [{"_data": "8100"}, None]
+    entries = asyncio.run(repo.find({}, {"_id": 1, "username": 1}, sort=[("_id", 1)]))
+    assert entries == [{"_id": "8201", "username": "teststudent"}, {"_id": "8202", "username": None},
+                       {"_id": "8203", "username": None}]
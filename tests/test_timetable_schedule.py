@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime
+
+import server
+
+CSV_HEADERS = {"Content-Type": "text/csv"}
+# A Tuesday, in timetable local time
+TUESDAY_10AM = datetime(2026, 10, 13, 10, 0, tzinfo=server.TIMETABLE_TIMEZONE)
+
+
+def add_class(client, auth_headers, course, day, time, **params):
+    return client.post("/api/timetable", headers=auth_headers, params=params, json={
+        "course": course, "time": time, "location": "QA080", "day": day, "campus": "Greenwich",
+    })
+
+
+def test_writes_store_normalized_slots(client, auth_headers):
+    created = add_class(client, auth_headers, "Algorithms", "tue", "9.00 – 11.00").json()
+
+    assert (created["day"], created["time"]) == ("Tuesday", "09:00-11:00")
+    assert (created["weekday"], created["start_minute"], created["end_minute"]) == (1, 540, 660)
+    assert add_class(client, auth_headers, "Networks", "Someday", "09:00-11:00").status_code == 422
+    assert add_class(client, auth_headers, "Networks", "Monday", "11:00-09:00").status_code == 422
+
+
+def test_today_next_and_range(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, "timetable_now", lambda: TUESDAY_10AM)
+    add_class(client, auth_headers, "Databases", "Tuesday", "14:00-16:00")
+    add_class(client, auth_headers, "Algorithms", "Tuesday", "09:00-11:00")
+    add_class(client, auth_headers, "Networks", "Monday", "09:00-10:00")
+
+    today = client.get("/api/timetable/today", headers=auth_headers).json()
+    assert [item["course"] for item in today] == ["Algorithms", "Databases"]
+    assert today[0]["starts_at"] == "2026-10-13T09:00:00+01:00"
+
+    upcoming = client.get("/api/timetable/next", headers=auth_headers).json()
+    assert (upcoming["course"], upcoming["date"]) == ("Databases", "2026-10-13")
+
+    week = client.get("/api/timetable/range", headers=auth_headers,
+                      params={"start": "2026-10-19", "end": "2026-10-27"}).json()
+    assert [(item["date"], item["course"]) for item in week] == [
+        ("2026-10-19", "Networks"), ("2026-10-20", "Algorithms"), ("2026-10-20", "Databases"),
+        ("2026-10-26", "Networks"), ("2026-10-27", "Algorithms"), ("2026-10-27", "Databases"),
+    ]
+    # Clocks go back on 25 October; classes keep their local start time
+    assert week[3]["starts_at"] == "2026-10-26T09:00:00+00:00"
+    assert client.get("/api/timetable/range", headers=auth_headers,
+                      params={"start": "2026-10-19", "end": "2027-10-19"}).status_code == 400
+
+
+def test_next_wraps_into_next_week():
+    schedule = server.WeeklySchedule([
+        {"course": "Networks", "weekday": 0, "start_minute": 540, "end_minute": 600},
+        {"course": "Databases", "weekday": 1, "start_minute": 840, "end_minute": 960},
+    ])
+
+    assert schedule.next_after(1, 840)[0]["course"] == "Databases"
+    assert schedule.next_after(1, 841) == ({"course": "Networks", "weekday": 0, "start_minute": 540,
+                                            "end_minute": 600}, 6)
+    assert server.WeeklySchedule([]).next_after(1, 0) is None
+
+
+def test_overlapping_class_is_rejected_unless_allowed(client, auth_headers):
+    add_class(client, auth_headers, "Algorithms", "Monday", "09:00-11:00")
+
+    clash = add_class(client, auth_headers, "Databases", "Monday", "10:00-12:00")
+    assert clash.status_code == 409
+    assert [item["course"] for item in clash.json()["detail"]["clashes"]] == ["Algorithms"]
+    assert add_class(client, auth_headers, "Networks", "Monday", "11:00-12:00").status_code == 200
+    assert add_class(client, auth_headers, "Databases", "Monday", "10:00-12:00", allow_clash=True).status_code == 200
+
+
+def test_import_fills_slots_and_refreshes_the_schedule(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, "timetable_now", lambda: TUESDAY_10AM)
+    assert client.get("/api/timetable/today", headers=auth_headers).json() == []
+
+    body = "course,time,location,day,campus\nSecurity,13:00-15:00,QA080,Tuesday,Greenwich\n"
+    client.post("/api/timetable/import", headers={**auth_headers, **CSV_HEADERS}, content=body)
+
+    assert [item["weekday"] for item in client.get("/api/timetable/today", headers=auth_headers).json()] == [1]
+
+
+def test_backfill_adds_slots_to_existing_classes():
+    asyncio.run(server.timetable_repo.insert_many([
+        {"username": "legacy", "course": "Ethics", "day": "Friday", "time": "10:00-12:00"},
+        {"username": "legacy", "course": "Field trip", "day": "TBC", "time": "all day"},
+    ]))
+
+    assert asyncio.run(server.timetable_repo.backfill_slots()) == 2
+    classes = asyncio.run(server.timetable_repo.find({"username": "legacy"},
+                                                     {"_id": 0, "weekday": 1, "start_minute": 1}))
+    assert classes == [{"weekday": 4, "start_minute": 600}, {"weekday": None, "start_minute": None}]
+    assert asyncio.run(server.timetable_repo.backfill_slots()) == 0
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import server
+
+REGISTER = {
+    "username": "teststudent", "email": "teststudent@greenwich.ac.uk", "password": "test123",
+    "student_id": "STU000001", "course": "Computer Science", "year": 2,
+}
+
+
+@pytest.fixture
+def tokens(client):
+    response = client.post("/api/auth/register", json=REGISTER)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_refresh_tokens_rotate_and_are_single_use(client, tokens):
+    rotated = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert rotated.status_code == 200
+    assert rotated.json()["refresh_token"] != tokens["refresh_token"]
+    assert client.get("/api/auth/me", headers=bearer(rotated.json()["token"])).status_code == 200
+
+    reused = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert (reused.status_code, reused.json()["detail"]) == (401, "Token revoked")
+    assert client.post("/api/auth/refresh", json={"refresh_token": rotated.json()["refresh_token"]}).status_code == 200
+
+
+def test_access_token_cannot_be_used_as_refresh_token(client, tokens):
+    assert client.post("/api/auth/refresh", json={"refresh_token": tokens["token"]}).status_code == 401
+    assert client.get("/api/auth/me", headers=bearer(tokens["refresh_token"])).status_code == 401
+
+
+def test_logout_revokes_both_tokens(client, tokens):
+    rotated = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    response = client.post("/api/auth/logout", headers=bearer(rotated["token"]),
+                           json={"refresh_token": rotated["refresh_token"]})
+
+    assert response.status_code == 200
+    assert client.get("/api/auth/me", headers=bearer(rotated["token"])).status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": rotated["refresh_token"]}).status_code == 401
+    # The access token from before the refresh wasn't revoked and stays valid until it expires
+    assert client.get("/api/auth/me", headers=bearer(tokens["token"])).status_code == 200
+
+
+def test_revocations_from_other_workers_arrive_by_sync(client, tokens):
+    client.post("/api/auth/logout", headers=bearer(tokens["token"]), json={"refresh_token": tokens["refresh_token"]})
+    # A worker that didn't handle the logout starts with an empty list
+    other_worker = server.RevocationList()
+    server.revocation_list.revoked.clear()
+    assert client.get("/api/auth/me", headers=bearer(tokens["token"])).status_code == 200
+
+    asyncio.run(other_worker.sync(server.revoked_tokens_repo))
+    server.revocation_list.revoked.update(other_worker.revoked)
+
+    assert len(other_worker) == 2
+    assert client.get("/api/auth/me", headers=bearer(tokens["token"])).status_code == 401
+
+
+def test_incremental_sync_picks_up_later_revocations(client, tokens):
+    worker = server.RevocationList()
+    asyncio.run(worker.sync(server.revoked_tokens_repo))
+    assert len(worker) == 0
+
+    client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    asyncio.run(worker.sync(server.revoked_tokens_repo))
+    assert worker.synced_until is not None
+    access = server.decode_token(tokens["token"])
+    client.post("/api/auth/logout", headers=bearer(tokens["token"]), json={})
+    asyncio.run(worker.sync(server.revoked_tokens_repo))
+
+    assert len(worker) == 2
+    assert access["jti"] in worker